@@ -1,6 +1,7 @@
 import hopsworks
 import pandas as pd
 from src.config import config
+from tools2.local_feature_store import LocalFeatureView
 from typing import List, Dict
 
 def get_primary_keys(last_n_minutes: int) -> List[Dict]:
@@ -19,6 +20,13 @@ def get_primary_keys(last_n_minutes: int) -> List[Dict]:
     return primary_keys
 
 def get_feature_view():
+    if config.feature_store_backend == 'local':
+        return LocalFeatureView(
+            root_dir=config.local_feature_store_dir,
+            feature_group_name=config.feature_group_name,
+            feature_group_version=config.feature_group_version,
+        )
+
     project = hopsworks.login(
         project=config.project_name,
         api_key_value=config.api_key,
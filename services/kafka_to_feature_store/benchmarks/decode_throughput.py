@@ -0,0 +1,78 @@
+"""
+Decodes synthetic JSON candles into the DataFrame that is inserted into the
+feature store, the previous way (`json.loads` into a list of dicts, then
+`pd.DataFrame`) and through `ColumnBuffer`, and reports candles/sec for both.
+
+Messages are fed to the `ColumnBuffer` in batches of `--consume-batch-size`,
+as `consumer.consume` hands them over. Run with `make benchmark`.
+"""
+import argparse
+import json
+import random
+from time import perf_counter
+from typing import List
+
+import pandas as pd
+from loguru import logger
+
+from column_buffer import ColumnBuffer
+
+
+def synthetic_candles(n_candles: int, n_products: int) -> List[bytes]:
+    timestamp_ms = 1_700_000_000_000
+    values = []
+    for i in range(n_candles):
+        price = random.uniform(1, 70_000)
+        values.append(json.dumps({
+            'timestamp': timestamp_ms + (i // n_products) * 60_000,
+            'open': price,
+            'high': price * 1.01,
+            'low': price * 0.99,
+            'close': price,
+            'product_id': f'PRODUCT{i % n_products}/USD',
+            'volume': random.uniform(0, 10),
+            'vwap': price,
+            'trade_count': random.randint(0, 500),
+            'first_trade_ms': timestamp_ms,
+            'last_trade_ms': timestamp_ms + 59_000,
+            'buy_volume': random.uniform(0, 5),
+            'sell_volume': random.uniform(0, 5),
+            'is_synthetic': False,
+        }).encode('utf-8'))
+    return values
+
+
+def legacy_decode(values: List[bytes]) -> pd.DataFrame:
+    return pd.DataFrame([json.loads(value.decode('utf-8')) for value in values])
+
+
+def column_buffer_decode(values: List[bytes], consume_batch_size: int) -> pd.DataFrame:
+    buffer = ColumnBuffer()
+    for i in range(0, len(values), consume_batch_size):
+        buffer.extend(values[i:i + consume_batch_size])
+    return buffer.to_frame()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-candles', type=int, default=500_000)
+    parser.add_argument('--n-products', type=int, default=10)
+    parser.add_argument('--consume-batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    values = synthetic_candles(args.n_candles, args.n_products)
+
+    start = perf_counter()
+    expected = legacy_decode(values)
+    legacy_sec = perf_counter() - start
+
+    start = perf_counter()
+    actual = column_buffer_decode(values, args.consume_batch_size)
+    column_sec = perf_counter() - start
+
+    assert actual.equals(expected), 'ColumnBuffer does not match the list of dicts'
+    logger.info(
+        f'list of dicts: {args.n_candles / legacy_sec:,.0f} candles/s, '
+        f'ColumnBuffer: {args.n_candles / column_sec:,.0f} candles/s '
+        f'({legacy_sec / column_sec:.1f}x)'
+    )
@@ -0,0 +1,43 @@
+"""
+Inserts synthetic candles into a `LocalFeatureStoreClient` in batches of
+several flush sizes, and reports candles/sec for each, so the sink can be
+benchmarked without a Hopsworks account.
+
+Every run writes to a fresh temporary directory, and the offline store is
+read back with DuckDB to check that no candle is lost. Run with
+`make benchmark-local-store`.
+"""
+import argparse
+import tempfile
+from time import perf_counter
+
+import duckdb
+from loguru import logger
+
+from decode_throughput import column_buffer_decode, synthetic_candles
+from local_feature_store import LocalFeatureStoreClient
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-candles', type=int, default=200_000)
+    parser.add_argument('--n-products', type=int, default=10)
+    parser.add_argument('--flush-sizes', type=int, nargs='+', default=[500, 5_000, 50_000])
+    args = parser.parse_args()
+
+    candles = column_buffer_decode(synthetic_candles(args.n_candles, args.n_products), 1000)
+
+    for flush_size in args.flush_sizes:
+        with tempfile.TemporaryDirectory() as root_dir:
+            client = LocalFeatureStoreClient(root_dir=root_dir)
+
+            start = perf_counter()
+            for i in range(0, len(candles), flush_size):
+                client.insert('ohlc', 1, candles.iloc[i:i + flush_size], 'offline')
+            elapsed = perf_counter() - start
+
+            n_rows = duckdb.sql(
+                f"SELECT count(*) FROM read_parquet('{root_dir}/offline/ohlc_1/*/*.parquet')"
+            ).fetchone()[0]
+            assert n_rows == len(candles), f'{n_rows} candles in the offline store, expected {len(candles)}'
+
+            logger.info(f'flushes of {flush_size}: {len(candles) / elapsed:,.0f} candles/s')
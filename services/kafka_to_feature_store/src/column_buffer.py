@@ -0,0 +1,90 @@
+from operator import itemgetter
+from typing import Dict, List
+
+import numpy as np
+import orjson
+import pandas as pd
+
+# dtypes of the candles trade_to_ohlc produces, other columns are inferred
+CANDLE_DTYPES = {
+    'timestamp': np.int64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'product_id': object,
+    'volume': np.float64,
+    'vwap': np.float64,
+    'trade_count': np.int64,
+    'first_trade_ms': np.int64,
+    'last_trade_ms': np.int64,
+    'buy_volume': np.float64,
+    'sell_volume': np.float64,
+    'is_synthetic': np.bool_,
+}
+
+
+class ColumnBuffer:
+    """
+    Buffers JSON candles column by column.
+
+    Every batch of messages is decoded and turned into one typed array per
+    column right away, so the buffer holds a few arrays per batch instead of
+    a dict per candle, and `to_frame` only concatenates them.
+
+    A candle missing a column, e.g. one produced before the column was added,
+    gets None in it.
+    """
+
+    def __init__(self):
+        # one dict of column arrays per decoded batch
+        self._chunks: List[Dict[str, np.ndarray]] = []
+        self._chunk_sizes: List[int] = []
+        self.n_rows = 0
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def extend(self, values: List[bytes]) -> None:
+        """
+        Decodes a batch of JSON messages and appends them to the buffer.
+        """
+        if not values:
+            return
+        records = [orjson.loads(value) for value in values]
+
+        columns = dict.fromkeys(records[0])
+        chunk = {}
+        for column in columns:
+            try:
+                chunk[column] = np.fromiter(
+                    map(itemgetter(column), records),
+                    dtype=CANDLE_DTYPES.get(column, object),
+                    count=len(records),
+                )
+            except (KeyError, TypeError, ValueError):
+                chunk[column] = np.array([r.get(column) for r in records], dtype=object)
+
+        # columns the first candle of the batch does not have
+        for record in records:
+            for column in record.keys() - chunk.keys():
+                chunk[column] = np.array([r.get(column) for r in records], dtype=object)
+
+        self._chunks.append(chunk)
+        self._chunk_sizes.append(len(records))
+        self.n_rows += len(records)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the buffered candles as a DataFrame.
+        """
+        columns = dict.fromkeys(column for chunk in self._chunks for column in chunk)
+        data = {
+            column: np.concatenate([
+                chunk[column] if column in chunk else np.full(size, None)
+                for chunk, size in zip(self._chunks, self._chunk_sizes)
+            ])
+            for column in columns
+        }
+        # object columns get the dtype pandas would have inferred from dicts
+        return pd.DataFrame(data, copy=False).infer_objects()
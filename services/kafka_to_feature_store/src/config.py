@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from pydantic import field_validator
 import os
 from dotenv import load_dotenv, find_dotenv
 from typing import Optional
@@ -11,9 +12,30 @@ class Config(BaseSettings):
     kafka_consumer_group: str = os.environ.get('KAFKA_CONSUMER_GROUP')
     feature_group_name: str = os.environ.get('FEATURE_GROUP_NAME')
     feature_group_version: int = os.environ.get('FEATURE_GROUP_VERSION')
-    buffer_size: int = os.environ.get('BUFFER_SIZE')
-    project_name: str = os.environ.get('HOPSWORKS_PROJECT_NAME')
-    api_key: str = os.environ.get('HOPSWORKS_API_KEY')
+    # flush policy overrides, the defaults depend on `live_or_historical`
+    buffer_size: Optional[int] = os.environ.get('BUFFER_SIZE')
+    flush_max_bytes: Optional[int] = os.environ.get('FLUSH_MAX_BYTES')
+    flush_max_age_sec: Optional[float] = os.environ.get('FLUSH_MAX_AGE_SEC')
+    flush_target_insert_sec: Optional[float] = os.environ.get('FLUSH_TARGET_INSERT_SEC')
+    consume_batch_size: int = os.environ.get('CONSUME_BATCH_SIZE', 1000)
+    # only needed with the hopsworks backend
+    project_name: Optional[str] = os.environ.get('HOPSWORKS_PROJECT_NAME')
+    api_key: Optional[str] = os.environ.get('HOPSWORKS_API_KEY')
     live_or_historical: str = os.environ.get('LIVE_OR_HISTORICAL')
+    # 'hopsworks', or 'local' for the Parquet/SQLite store in `local_feature_store_dir`
+    feature_store_backend: str = os.environ.get('FEATURE_STORE_BACKEND', 'hopsworks')
+    local_feature_store_dir: str = os.environ.get('LOCAL_FEATURE_STORE_DIR', 'feature_store')
+
+    @field_validator('buffer_size', 'flush_max_bytes', 'flush_max_age_sec', 'flush_target_insert_sec', mode='before')
+    @classmethod
+    def empty_to_none(cls, v):
+        # a variable left empty in app.yaml keeps the default of the mode
+        return None if v == '' else v
+
+    @field_validator('feature_store_backend')
+    @classmethod
+    def validate_feature_store_backend(cls, v: str) -> str:
+        assert v in ['hopsworks', 'local'], f'Invalid feature_store_backend value: {v}'
+        return v
 
 config = Config()
\ No newline at end of file
@@ -0,0 +1,122 @@
+import queue
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+from column_buffer import ColumnBuffer
+
+# (topic, partition) -> offset of the next message to consume
+Offsets = Dict[Tuple[str, int], int]
+
+
+class FeatureStoreWriter:
+    """
+    Writes batches of candles to the feature store from a background thread,
+    so the consumer keeps polling while an insert is in progress.
+
+    At most one batch is being written and `max_pending_batches` wait behind
+    it. `submit` never blocks: it returns False when the writer is that far
+    behind, and the caller is expected to pause consumption until `is_full`
+    turns False again.
+
+    A batch carries the offsets that follow its last messages. They are only
+    handed back through `pop_flushed_offsets` once the batch has been written,
+    so nothing is committed before it is in the feature store. The offsets of
+    revoked partitions are dropped with `drop_offsets`, whether their batch is
+    written yet or not.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[ColumnBuffer], None],
+        max_pending_batches: int = 1,
+    ):
+        self._write = write
+        self._batches: queue.Queue = queue.Queue(maxsize=max_pending_batches)
+        self._flushed_offsets: Offsets = {}
+        # the offsets of the queued and in-progress batches, oldest first
+        self._pending_offsets: Deque[Offsets] = deque()
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+
+        self._thread = threading.Thread(
+            target=self._run, name='feature-store-writer', daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._batches.get()
+            if item is None:
+                return
+
+            batch, offsets = item
+            try:
+                self._write(batch)
+            except BaseException as e:
+                logger.error(f'Feature store write failed, stopping the writer: {e}')
+                self._error = e
+                return
+            finally:
+                self._batches.task_done()
+
+            with self._lock:
+                self._pending_offsets.popleft()
+                self._flushed_offsets.update(offsets)
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError('Feature store writer died') from self._error
+
+    def is_full(self) -> bool:
+        return self._batches.full()
+
+    def submit(self, batch: ColumnBuffer, offsets: Offsets) -> bool:
+        """
+        Queues a batch for writing.
+
+        Args:
+            batch: The candles to write.
+            offsets: The offsets to commit once the batch is written.
+        Returns:
+            False, without queueing the batch, if the writer is full.
+        """
+        self._raise_if_failed()
+        with self._lock:
+            try:
+                self._batches.put_nowait((batch, offsets))
+            except queue.Full:
+                return False
+            self._pending_offsets.append(offsets)
+        return True
+
+    def pop_flushed_offsets(self) -> Offsets:
+        """
+        Returns the offsets of the batches written since the last call.
+        """
+        self._raise_if_failed()
+        with self._lock:
+            offsets, self._flushed_offsets = self._flushed_offsets, {}
+        return offsets
+
+    def drop_offsets(self, partitions: Iterable[Tuple[str, int]]) -> None:
+        """
+        Forgets the offsets of `partitions`, e.g. once they are revoked, so
+        they are never handed back for a commit.
+        """
+        partitions = list(partitions)
+        with self._lock:
+            for offsets in (*self._pending_offsets, self._flushed_offsets):
+                for partition in partitions:
+                    offsets.pop(partition, None)
+
+    def close(self) -> None:
+        """
+        Waits until every queued batch is written, then stops the writer.
+        """
+        if self._thread.is_alive():
+            self._batches.put(None)
+            self._thread.join()
+        self._raise_if_failed()
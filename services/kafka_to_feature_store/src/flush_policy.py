@@ -0,0 +1,156 @@
+import threading
+from time import monotonic, time
+from typing import Dict, Optional
+
+import pandas as pd
+from loguru import logger
+
+
+class FlushPolicy:
+    """
+    Decides when the buffered candles are flushed to the feature store.
+
+    A flush is due when the buffer reaches `max_records` records or
+    `max_bytes` bytes, or when its oldest record has waited `max_age_sec`.
+
+    With `target_insert_sec`, the record limit adapts to the insert latency
+    observed: it shrinks when inserts take longer than the target and grows
+    back, up to `max_records`, when they are faster.
+    """
+
+    def __init__(
+        self,
+        max_records: int,
+        max_bytes: int,
+        max_age_sec: float,
+        target_insert_sec: Optional[float] = None,
+        min_records: int = 1,
+    ):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self.target_insert_sec = target_insert_sec
+        self.min_records = min_records
+
+        self.record_limit = max_records
+        self._lock = threading.Lock()
+
+        self.n_records = 0
+        self.n_bytes = 0
+        self._oldest_at: Optional[float] = None
+
+    def add(self, n_records: int, n_bytes: int) -> None:
+        """
+        Accounts for records appended to the buffer.
+        """
+        if n_records == 0:
+            return
+        if self._oldest_at is None:
+            self._oldest_at = monotonic()
+        self.n_records += n_records
+        self.n_bytes += n_bytes
+
+    def should_flush(self) -> Optional[str]:
+        """
+        Returns why the buffer should be flushed now, or None.
+        """
+        if self.n_records == 0:
+            return None
+        if self.n_records >= self.record_limit:
+            return 'records'
+        if self.n_bytes >= self.max_bytes:
+            return 'bytes'
+        if monotonic() - self._oldest_at >= self.max_age_sec:
+            return 'age'
+        return None
+
+    def reset(self) -> None:
+        """
+        Empties the accounting, once the buffer has been handed to the writer.
+        """
+        self.n_records = 0
+        self.n_bytes = 0
+        self._oldest_at = None
+
+    def on_inserted(self, n_records: int, insert_sec: float) -> None:
+        """
+        Adapts the record limit to the latency of an insert. Called from the
+        writer thread.
+        """
+        if self.target_insert_sec is None or n_records == 0 or insert_sec <= 0:
+            return
+
+        # what fits in the target at the throughput just observed, moving at
+        # most 2x either way per insert
+        fitting = n_records * self.target_insert_sec / insert_sec
+        with self._lock:
+            limit = min(max(fitting, self.record_limit / 2), self.record_limit * 2)
+            self.record_limit = int(min(max(limit, self.min_records), self.max_records))
+
+
+# defaults per mode: live candles go to the online store and should be there
+# within seconds, historical ones are materialized offline in large inserts
+FLUSH_POLICY_DEFAULTS: Dict[str, Dict] = {
+    'live': {
+        'max_records': 500,
+        'max_bytes': 1_000_000,
+        'max_age_sec': 5.0,
+        'target_insert_sec': 2.0,
+    },
+    'historical': {
+        'max_records': 200_000,
+        'max_bytes': 64_000_000,
+        'max_age_sec': 60.0,
+        'target_insert_sec': 60.0,
+    },
+}
+
+
+def flush_policy_for_mode(
+    live_or_historical: str,
+    max_records: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    max_age_sec: Optional[float] = None,
+    target_insert_sec: Optional[float] = None,
+) -> FlushPolicy:
+    """
+    Builds the flush policy of a mode, overriding the defaults that are given.
+    """
+    overrides = {
+        'max_records': max_records,
+        'max_bytes': max_bytes,
+        'max_age_sec': max_age_sec,
+        'target_insert_sec': target_insert_sec,
+    }
+    params = {
+        **FLUSH_POLICY_DEFAULTS[live_or_historical],
+        **{k: v for k, v in overrides.items() if v is not None},
+    }
+    logger.info(f'Flush policy for {live_or_historical} mode: {params}')
+    return FlushPolicy(**params)
+
+
+class FlushStats:
+    """
+    Logs every flush with its size and the freshness of its candles, i.e. how
+    long after the end of their window they reached the feature store.
+    """
+
+    def __init__(self):
+        self.n_flushes = 0
+        self.n_records = 0
+        self.insert_sec = 0.0
+
+    def on_inserted(self, candles: pd.DataFrame, insert_sec: float) -> None:
+        self.n_flushes += 1
+        self.n_records += len(candles)
+        self.insert_sec += insert_sec
+
+        now_ms = int(time() * 1000)
+        logger.info(
+            f'Flushed {len(candles)} candles in {insert_sec:.2f}s, freshness '
+            f'{(now_ms - candles["timestamp"].max()) / 1000:.1f}s (newest) to '
+            f'{(now_ms - candles["timestamp"].min()) / 1000:.1f}s (oldest). '
+            f'{self.n_records} candles in {self.n_flushes} flushes so far, '
+            f'{self.n_records / self.n_flushes:.0f} per flush'
+        )
@@ -1,47 +1,147 @@
 import hopsworks
-from typing import Dict, List
+from typing import Dict, Tuple
 import pandas as pd
-from config import config
 from loguru import logger
+from time import perf_counter
+
+# status codes Hopsworks answers with once the session has expired
+AUTH_ERROR_STATUS_CODES = (401, 403)
+
+
+def is_auth_error(error: Exception) -> bool:
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) in AUTH_ERROR_STATUS_CODES
+
+
+class FeatureStoreClient:
+    """
+    Long-lived Hopsworks client that logs in once and keeps a handle per
+    feature group, so a flush only pays for the insert itself.
+
+    When Hopsworks rejects a call because the session expired, the client logs
+    in again, drops the cached handles and retries once.
+
+    Connect time (login and feature group lookups) and write time (inserts)
+    are accumulated separately in `metrics`.
+    """
+
+    def __init__(self, project_name: str, api_key: str):
+        self.project_name = project_name
+        self.api_key = api_key
+
+        self._feature_store = None
+        self._feature_groups: Dict[Tuple[str, int], object] = {}
+
+        self.metrics = {
+            'n_connects': 0,
+            'connect_sec': 0.0,
+            'n_inserts': 0,
+            'n_rows': 0,
+            'write_sec': 0.0,
+        }
+
+    def _get_feature_store(self):
+        if self._feature_store is None:
+            start = perf_counter()
+            project = hopsworks.login(
+                project=self.project_name,
+                api_key_value=self.api_key,
+            )
+            self._feature_store = project.get_feature_store()
+            self._add_connect_time(perf_counter() - start)
+        return self._feature_store
+
+    def get_feature_group(self, feature_group_name: str, feature_group_version: int):
+        """
+        Returns the handle of the feature group, creating the feature group if
+        it does not exist yet.
+        """
+        key = (feature_group_name, feature_group_version)
+        if key not in self._feature_groups:
+            feature_store = self._get_feature_store()
+            start = perf_counter()
+            try:
+                self._feature_groups[key] = feature_store.get_or_create_feature_group(
+                    name=feature_group_name,
+                    version=feature_group_version,
+                    description="OHLC feature group",
+                    primary_key=["product_id","timestamp"],
+                    event_time="timestamp",
+                    online_enabled=True,
+                )
+            except Exception as e:
+                logger.error(f"Error creating feature group: {e}")
+                raise e
+            self._add_connect_time(perf_counter() - start)
+        return self._feature_groups[key]
+
+    def reconnect(self) -> None:
+        """
+        Drops the session and every cached handle, so the next call logs in again.
+        """
+        logger.info("Reconnecting to Hopsworks")
+        hopsworks.logout()
+        self._feature_store = None
+        self._feature_groups.clear()
+
+    def insert(
+        self,
+        feature_group_name: str,
+        feature_group_version: int,
+        df: pd.DataFrame,
+        online_or_offline: str,
+    ) -> None:
+        """
+        Inserts the rows of `df` into the feature group.
+        """
+        for attempt in range(2):
+            try:
+                feature_group = self.get_feature_group(feature_group_name, feature_group_version)
+                start = perf_counter()
+                feature_group.insert(df, write_options={"start_offline_materialization": True if online_or_offline == 'offline' else False})
+                write_sec = perf_counter() - start
+                break
+            except Exception as e:
+                if attempt == 0 and is_auth_error(e):
+                    logger.warning(f"Hopsworks session expired: {e}")
+                    self.reconnect()
+                    continue
+                raise
+
+        self.metrics['n_inserts'] += 1
+        self.metrics['n_rows'] += len(df)
+        self.metrics['write_sec'] += write_sec
+        logger.info(
+            f"Inserted {len(df)} rows in {write_sec:.2f}s "
+            f"(total connect {self.metrics['connect_sec']:.2f}s over {self.metrics['n_connects']} calls, "
+            f"total write {self.metrics['write_sec']:.2f}s over {self.metrics['n_inserts']} inserts)"
+        )
+
+    def _add_connect_time(self, seconds: float) -> None:
+        self.metrics['n_connects'] += 1
+        self.metrics['connect_sec'] += seconds
+
 
 def push_data_to_feature_store(
+    client: FeatureStoreClient,
     feature_group_name: str,
     feature_group_version: int,
-    data: List[Dict],
+    data: pd.DataFrame,
     online_or_offline: str,
 ) -> None:
     """
     Pushes data to feature store.
     """
-    project = hopsworks.login(
-        project=config.project_name,
-        api_key_value=config.api_key,
-    )
-
-    fs = project.get_feature_store()
-
-    try:
-        ohlc_feature_group = fs.get_or_create_feature_group(
-            name=feature_group_name,
-            version=feature_group_version,
-            description="OHLC feature group",
-            primary_key=["product_id","timestamp"],
-            event_time="timestamp",
-            online_enabled=True,
-        )
-    except Exception as e:
-        logger.error(f"Error creating feature group: {e}")
-        raise e
-
-    if not data:
+    if data.empty:
         logger.warning("No data to push to feature store, skipping insert")
         return
-    
-    df = pd.DataFrame(data)
-    
+
+    # a candle replayed after a crash can be in the same batch twice
+    df = data.drop_duplicates(subset=["product_id","timestamp"], keep="last")
+
     if df.empty:
         logger.warning("DataFrame is empty, skipping insert")
         return
-    
+
     logger.info(f"Pushing {len(df)} records with columns: {list(df.columns)}")
-    ohlc_feature_group.insert(df, write_options={"start_offline_materialization": True if online_or_offline == 'offline' else False})
\ No newline at end of file
+    client.insert(feature_group_name, feature_group_version, df, online_or_offline)
@@ -0,0 +1,109 @@
+import sqlite3
+import time
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+import duckdb
+import pandas as pd
+from loguru import logger
+
+
+class LocalFeatureStoreClient:
+    """
+    Feature store on local disk, with the same interface as the Hopsworks
+    `FeatureStoreClient`, so the pipeline runs and is benchmarked without a
+    Hopsworks account.
+
+    Like an online-enabled feature group, every insert goes to both stores:
+
+    - offline: Parquet files partitioned by day, one file per insert and day,
+      `{root_dir}/offline/{name}_{version}/date=YYYY-MM-DD/part-{ns}.parquet`.
+      A candle written twice is in two files; readers keep the one of the
+      latest file.
+    - online: a SQLite table `{name}_{version}` in `{root_dir}/online.db`
+      holding the latest row per (product_id, timestamp).
+
+    `tools2.local_feature_store` reads this layout.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = Path(root_dir)
+        (self.root_dir / 'offline').mkdir(parents=True, exist_ok=True)
+
+        self._online = sqlite3.connect(self.root_dir / 'online.db', check_same_thread=False)
+        # readers in other processes are not blocked by the writer
+        self._online.execute('PRAGMA journal_mode=WAL')
+        self._online_columns = {}
+
+        self.metrics = {
+            'n_connects': 0,
+            'connect_sec': 0.0,
+            'n_inserts': 0,
+            'n_rows': 0,
+            'write_sec': 0.0,
+        }
+
+    def insert(
+        self,
+        feature_group_name: str,
+        feature_group_version: int,
+        df: pd.DataFrame,
+        online_or_offline: str,
+    ) -> None:
+        """
+        Inserts the rows of `df` into the offline and the online store.
+        """
+        table_name = f'{feature_group_name}_{feature_group_version}'
+        start = perf_counter()
+        self._write_offline(table_name, df)
+        self._write_online(table_name, df)
+        write_sec = perf_counter() - start
+
+        self.metrics['n_inserts'] += 1
+        self.metrics['n_rows'] += len(df)
+        self.metrics['write_sec'] += write_sec
+        logger.info(
+            f"Inserted {len(df)} rows in {write_sec:.2f}s into the local feature store "
+            f"(total write {self.metrics['write_sec']:.2f}s over {self.metrics['n_inserts']} inserts)"
+        )
+
+    def _write_offline(self, table_name: str, df: pd.DataFrame) -> None:
+        # a file name that sorts after every file written before it
+        file_name = f'part-{time.time_ns():020d}.parquet'
+        dates = pd.to_datetime(df['timestamp'], unit='ms').dt.strftime('%Y-%m-%d')
+        for date, rows in df.groupby(dates.to_numpy()):
+            partition_dir = self.root_dir / 'offline' / table_name / f'date={date}'
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            duckdb.from_df(rows).write_parquet(str(partition_dir / file_name))
+
+    def _write_online(self, table_name: str, df: pd.DataFrame) -> None:
+        columns = self._ensure_online_table(table_name, list(df.columns))
+        # missing columns are written as NULL
+        rows = df.reindex(columns=columns).astype(object)
+        rows = rows.where(rows.notna(), None)
+        placeholders = ', '.join('?' * len(columns))
+        column_names = ', '.join(f'"{column}"' for column in columns)
+        with self._online:
+            self._online.executemany(
+                f'INSERT OR REPLACE INTO "{table_name}" ({column_names}) VALUES ({placeholders})',
+                rows.itertuples(index=False, name=None),
+            )
+
+    def _ensure_online_table(self, table_name: str, columns: List[str]) -> List[str]:
+        if table_name not in self._online_columns:
+            column_names = ', '.join(f'"{column}"' for column in columns)
+            self._online.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table_name}" '
+                f'({column_names}, PRIMARY KEY (product_id, timestamp))'
+            )
+            self._online_columns[table_name] = [
+                row[1] for row in self._online.execute(f'PRAGMA table_info("{table_name}")')
+            ]
+
+        known_columns = self._online_columns[table_name]
+        for column in columns:
+            if column not in known_columns:
+                self._online.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column}"')
+                known_columns.append(column)
+        return known_columns
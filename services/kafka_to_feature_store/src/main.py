@@ -1,13 +1,23 @@
 from quixstreams import Application
 from loguru import logger
-import json
-from hopsworks_api import push_data_to_feature_store
-from config import config
-from typing import Optional
-from datetime import datetime, timezone
-
-def get_current_utc_seconds() -> int:
-    return int(datetime.now(timezone.utc).timestamp())
+from confluent_kafka import TopicPartition
+from hopsworks_api import FeatureStoreClient, push_data_to_feature_store
+from local_feature_store import LocalFeatureStoreClient
+from feature_store_writer import FeatureStoreWriter, Offsets
+from column_buffer import ColumnBuffer
+from flush_policy import FlushPolicy, FlushStats, flush_policy_for_mode
+from typing import Callable, List, Optional
+from time import perf_counter
+
+def commit_offsets(consumer, offsets: Offsets) -> None:
+    if offsets:
+        consumer.commit(
+            offsets=[
+                TopicPartition(topic_name, partition, offset)
+                for (topic_name, partition), offset in offsets.items()
+            ],
+            asynchronous=False,
+        )
 
 def kafka_to_feature_store(
     kafka_topic: str,
@@ -17,9 +27,34 @@ def kafka_to_feature_store(
     feature_group_version: int,
     buffer_size: Optional[int] = None,
     live_or_historical: Optional[str] = 'live',
+    flush_max_bytes: Optional[int] = None,
+    flush_max_age_sec: Optional[float] = None,
+    flush_target_insert_sec: Optional[float] = None,
+    consume_batch_size: int = 1000,
+    feature_store_backend: str = 'hopsworks',
+    local_feature_store_dir: str = 'feature_store',
+    hopsworks_project_name: Optional[str] = None,
+    hopsworks_api_key: Optional[str] = None,
 ) -> None:
     """
     Converts Kafka messages to feature store.
+
+    Candles are buffered and written by a background `FeatureStoreWriter`, so
+    polling goes on during an insert, and is paused when the writer falls
+    behind. Offsets are committed only after the candles before them are in
+    the feature store. A crash replays the uncommitted candles, and since the
+    feature group upserts on (product_id, timestamp), a replay overwrites
+    rows instead of duplicating them.
+
+    When to flush is up to a `FlushPolicy`, tuned per mode: small and frequent
+    flushes in live mode, large ones in historical mode. `buffer_size` and the
+    `flush_*` arguments override its defaults.
+
+    Messages are consumed `consume_batch_size` at a time and buffered in a
+    `ColumnBuffer`, which the writer turns into a DataFrame off the poll loop.
+
+    With `feature_store_backend='local'` the candles go to a Parquet/SQLite
+    store in `local_feature_store_dir` instead of Hopsworks.
     """
     app = Application(
         broker_address=kafka_broker_address,
@@ -29,57 +64,136 @@ def kafka_to_feature_store(
 
     topic = app.topic(name=kafka_topic, value_serializer='json')
 
-    last_saved_to_feature_ts = get_current_utc_seconds()
-
-    buffer = []
-    
-    with app.get_consumer() as consumer:
-        consumer.subscribe(topics=[topic.name])
-
-        while True:
-            msg = consumer.poll(1)
-
-
-            if msg is None:
-                n_sec = 10
-                if(get_current_utc_seconds() - last_saved_to_feature_ts) > n_sec:
-                    if len(buffer) > 0:
-                        logger.info(f"Time exceeded. Pushing data to feature store: {kafka_topic}")
-                        push_data_to_feature_store(
-                            feature_group_name=feature_group_name,
-                            feature_group_version=feature_group_version,
-                            data=buffer,
-                            online_or_offline='online' if live_or_historical == 'live' else 'offline',
-                        )
-                        buffer = []
-                        last_saved_to_feature_ts = get_current_utc_seconds()
-                continue
+    if feature_store_backend == 'local':
+        feature_store_client = LocalFeatureStoreClient(root_dir=local_feature_store_dir)
+    else:
+        # logs in on the first flush and is reused by every flush after it
+        feature_store_client = FeatureStoreClient(
+            project_name=hopsworks_project_name,
+            api_key=hopsworks_api_key,
+        )
 
-            if msg.error() :
-                logger.error(f"kafka_to_feature_store Error: {msg.error()}")
-                continue
+    flush_policy = flush_policy_for_mode(
+        live_or_historical,
+        max_records=buffer_size,
+        max_bytes=flush_max_bytes,
+        max_age_sec=flush_max_age_sec,
+        target_insert_sec=flush_target_insert_sec,
+    )
+    flush_stats = FlushStats()
+
+    def write(batch: ColumnBuffer) -> None:
+        df = batch.to_frame()
+        start = perf_counter()
+        push_data_to_feature_store(
+            client=feature_store_client,
+            feature_group_name=feature_group_name,
+            feature_group_version=feature_group_version,
+            data=df,
+            online_or_offline='online' if live_or_historical == 'live' else 'offline',
+        )
+        insert_sec = perf_counter() - start
+        flush_policy.on_inserted(len(df), insert_sec)
+        flush_stats.on_inserted(df, insert_sec)
+
+    # offsets are committed by us, and only once the writer has flushed them
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+        consume_to_feature_store(
+            consumer=consumer,
+            topic_name=topic.name,
+            write=write,
+            flush_policy=flush_policy,
+            consume_batch_size=consume_batch_size,
+        )
 
-            ohlc_candle = json.loads(msg.value().decode('utf-8'))
+def consume_to_feature_store(
+    consumer,
+    topic_name: str,
+    write: Callable[[ColumnBuffer], None],
+    flush_policy: FlushPolicy,
+    consume_batch_size: int = 1000,
+) -> None:
+    """
+    Consumes the candles of `topic_name` into batches written by a
+    `FeatureStoreWriter` with `write`, and commits the offsets of every batch
+    once it is written. Runs until the consumer or the writer fails.
+
+    When partitions are revoked, the offsets flushed so far are committed and
+    the pending ones of the revoked partitions are dropped, so this instance
+    never commits over the next owner. Lost partitions can no longer be
+    committed, so their offsets are only dropped. Their buffered candles are
+    written anyway, and replayed by the next owner.
+    """
+    writer = FeatureStoreWriter(write=write)
 
-            buffer.append(ohlc_candle)
+    buffer = ColumnBuffer()
+    # offsets that follow the messages in `buffer`
+    buffer_offsets = {}
+    paused = False
 
-            logger.info(f"Message received from Kafka: {ohlc_candle}")
+    def on_lost(consumer, partitions: List[TopicPartition]) -> None:
+        lost = [(p.topic, p.partition) for p in partitions]
+        writer.drop_offsets(lost)
+        for topic_partition in lost:
+            buffer_offsets.pop(topic_partition, None)
 
-            if len(buffer) >= buffer_size:
-                logger.debug(buffer)
-                push_data_to_feature_store(
-                    feature_group_name=feature_group_name,
-                    feature_group_version=feature_group_version,
-                    data=buffer,
-                    online_or_offline='online' if live_or_historical == 'live' else 'offline',
-                )
+    def on_revoke(consumer, partitions: List[TopicPartition]) -> None:
+        # still ours until this returns
+        commit_offsets(consumer, writer.pop_flushed_offsets())
+        on_lost(consumer, partitions)
 
-                buffer = []
-                last_saved_to_feature_ts = get_current_utc_seconds()
+    consumer.subscribe(topics=[topic_name], on_revoke=on_revoke, on_lost=on_lost)
 
-            consumer.store_offsets(message=msg)
+    try:
+        while True:
+            commit_offsets(consumer, writer.pop_flushed_offsets())
+
+            flush_reason = flush_policy.should_flush()
+            if flush_reason:
+                if writer.submit(buffer, buffer_offsets):
+                    logger.info(
+                        f"Pushing {len(buffer)} candles ({flush_policy.n_bytes / 1000:.1f} kB) "
+                        f"to feature store: {topic_name}, flushed on {flush_reason}"
+                    )
+                    buffer = ColumnBuffer()
+                    buffer_offsets = {}
+                    flush_policy.reset()
+                    if paused:
+                        logger.info("Feature store writer caught up, resuming")
+                        consumer.resume(consumer.assignment())
+                        paused = False
+                elif not paused:
+                    # keep polling, so we stay in the group, but stop fetching
+                    # until the writer has room for the next batch
+                    logger.warning("Feature store writer is behind, pausing consumption")
+                    consumer.pause(consumer.assignment())
+                    paused = True
+
+            # no more than what the next flush takes, so flushes keep their size
+            n_messages = min(consume_batch_size, flush_policy.record_limit - flush_policy.n_records)
+            messages = consumer.consume(num_messages=max(n_messages, 1), timeout=1)
+
+            values = []
+            for msg in messages:
+                if msg.error():
+                    logger.error(f"kafka_to_feature_store Error: {msg.error()}")
+                    continue
+                values.append(msg.value())
+                buffer_offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+
+            buffer.extend(values)
+            flush_policy.add(len(values), sum(map(len, values)))
+
+            if values:
+                logger.debug(f"{len(values)} messages received from Kafka")
+    finally:
+        # write what is already queued, and commit it if the writer is healthy
+        writer.close()
+        commit_offsets(consumer, writer.pop_flushed_offsets())
 
 if __name__ == "__main__":
+    from config import config
+
     try:
         kafka_to_feature_store(
             kafka_topic=config.kafka_topic,
@@ -89,6 +203,14 @@ if __name__ == "__main__":
             feature_group_version=config.feature_group_version,
             buffer_size=config.buffer_size,
             live_or_historical=config.live_or_historical,
+            flush_max_bytes=config.flush_max_bytes,
+            flush_max_age_sec=config.flush_max_age_sec,
+            flush_target_insert_sec=config.flush_target_insert_sec,
+            consume_batch_size=config.consume_batch_size,
+            feature_store_backend=config.feature_store_backend,
+            local_feature_store_dir=config.local_feature_store_dir,
+            hopsworks_project_name=config.project_name,
+            hopsworks_api_key=config.api_key,
         )
     except KeyboardInterrupt:
         logger.info("KeyboardInterrupt received, exiting...")
\ No newline at end of file
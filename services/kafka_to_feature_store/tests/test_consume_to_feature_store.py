@@ -0,0 +1,265 @@
+"""
+Checks the delivery of `consume_to_feature_store`: every candle reaches the
+feature store, a crash between a write and its commit replays the candles
+instead of losing them, and revoked partitions are never committed.
+
+The consumer is a fake over in-memory partitions, and the feature group keeps
+every row inserted, so replays show up as duplicates.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import orjson
+import pandas as pd
+import pytest
+from confluent_kafka import TopicPartition
+
+from flush_policy import FlushPolicy
+from main import consume_to_feature_store
+
+TOPIC = 'ohlc'
+
+
+class Crash(Exception):
+    """
+    The process dies: nothing after it reaches the broker.
+    """
+
+
+class Drained(Exception):
+    """
+    Every message was consumed: stops the consume loop.
+    """
+
+
+class FakeMessage:
+    def __init__(self, partition: int, offset: int, value: bytes):
+        self._partition = partition
+        self._offset = offset
+        self._value = value
+
+    def error(self):
+        return None
+
+    def topic(self) -> str:
+        return TOPIC
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def value(self) -> bytes:
+        return self._value
+
+
+class FakeBroker:
+    def __init__(self, candles: List[Dict], n_partitions: int):
+        self.partitions: Dict[int, List[bytes]] = {partition: [] for partition in range(n_partitions)}
+        for i, candle in enumerate(candles):
+            self.partitions[i % n_partitions].append(orjson.dumps(candle))
+        self.committed: Dict[int, int] = {}
+
+
+class FakeConsumer:
+    """
+    Consumes the partitions of a `FakeBroker` from their committed offsets.
+
+    With `crash_on_commit`, the nth commit crashes the process, and so does
+    every call after it. `on_consume` is called before every consume, with the
+    number of consumes so far.
+    """
+
+    def __init__(
+        self,
+        broker: FakeBroker,
+        crash_on_commit: Optional[int] = None,
+        on_consume: Optional[Callable[['FakeConsumer', int], None]] = None,
+    ):
+        self.broker = broker
+        self.crash_on_commit = crash_on_commit
+        self.on_consume = on_consume
+        self.crashed = False
+        self.commits: List[Dict[int, int]] = []
+        self.n_consumes = 0
+        self.positions: Dict[int, int] = {}
+        self.paused = set()
+
+    def _check_alive(self) -> None:
+        if self.crashed:
+            raise Crash()
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None) -> None:
+        self.on_revoke = on_revoke
+        self.positions = {
+            partition: self.broker.committed.get(partition, 0) for partition in self.broker.partitions
+        }
+
+    def revoke(self, partition: int) -> None:
+        self.on_revoke(self, [TopicPartition(TOPIC, partition)])
+        del self.positions[partition]
+
+    def assignment(self) -> List[TopicPartition]:
+        return [TopicPartition(TOPIC, partition) for partition in self.positions]
+
+    def pause(self, partitions) -> None:
+        self.paused.update(tp.partition for tp in partitions)
+
+    def resume(self, partitions) -> None:
+        self.paused.difference_update(tp.partition for tp in partitions)
+
+    def is_drained(self) -> bool:
+        return all(
+            self.broker.committed.get(partition) == len(self.broker.partitions[partition])
+            for partition in self.positions
+        )
+
+    def consume(self, num_messages: int, timeout: float) -> List[FakeMessage]:
+        self._check_alive()
+        if self.on_consume is not None:
+            self.on_consume(self, self.n_consumes)
+        self.n_consumes += 1
+
+        # an even share of every assigned partition
+        share = max(num_messages // max(len(self.positions), 1), 1)
+        messages = []
+        for partition, position in self.positions.items():
+            if partition in self.paused:
+                continue
+            values = self.broker.partitions[partition][position:position + share]
+            messages.extend(FakeMessage(partition, position + i, value) for i, value in enumerate(values))
+            self.positions[partition] += len(values)
+
+        if not messages:
+            if self.is_drained():
+                raise Drained()
+            # the writer is still busy
+            time.sleep(0.001)
+        return messages
+
+    def commit(self, offsets: List[TopicPartition], asynchronous: bool = True) -> None:
+        self._check_alive()
+        if self.crash_on_commit is not None and len(self.commits) + 1 == self.crash_on_commit:
+            self.crashed = True
+            raise Crash()
+        assert all(tp.partition in self.positions for tp in offsets), 'committed a partition it does not own'
+        committed = {tp.partition: tp.offset for tp in offsets}
+        self.commits.append(committed)
+        self.broker.committed.update(committed)
+
+
+class FakeFeatureGroup:
+    """
+    Keeps every row inserted, like an append-only table.
+    """
+
+    def __init__(self):
+        self.inserts: List[pd.DataFrame] = []
+
+    def write(self, batch) -> None:
+        self.inserts.append(batch.to_frame())
+
+    def rows(self) -> pd.DataFrame:
+        return pd.concat(self.inserts, ignore_index=True)
+
+
+def candles(n_candles: int, n_products: int) -> List[Dict]:
+    return [
+        {
+            'timestamp': 60_000 * (i // n_products + 1),
+            'open': float(i),
+            'high': float(i) + 1,
+            'low': float(i) - 1,
+            'close': float(i) + 0.5,
+            'product_id': f'PRODUCT{i % n_products}/USD',
+        }
+        for i in range(n_candles)
+    ]
+
+
+def flush_policy() -> FlushPolicy:
+    # a batch per consume
+    return FlushPolicy(max_records=25, max_bytes=1_000_000, max_age_sec=0)
+
+
+def consume(consumer: FakeConsumer, feature_group: FakeFeatureGroup) -> None:
+    consume_to_feature_store(
+        consumer=consumer,
+        topic_name=TOPIC,
+        write=feature_group.write,
+        flush_policy=flush_policy(),
+        consume_batch_size=25,
+    )
+
+
+def assert_written_once_after_dedup(feature_group: FakeFeatureGroup, expected: List[Dict]) -> None:
+    # the feature group upserts on its primary key
+    rows = feature_group.rows().drop_duplicates(['product_id', 'timestamp'], keep='last')
+    rows = rows.sort_values(['timestamp', 'product_id']).reset_index(drop=True)
+    expected = pd.DataFrame(expected).sort_values(['timestamp', 'product_id']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(rows, expected, check_dtype=False)
+
+
+def test_crash_between_write_and_commit_replays_candles():
+    expected = candles(n_candles=300, n_products=4)
+    broker = FakeBroker(expected, n_partitions=2)
+    feature_group = FakeFeatureGroup()
+
+    # the first batch is written, then the process dies before committing it
+    with pytest.raises(Crash):
+        consume(FakeConsumer(broker, crash_on_commit=1), feature_group)
+    assert len(feature_group.inserts) >= 1
+    assert broker.committed == {}
+
+    with pytest.raises(Drained):
+        consume(FakeConsumer(broker), feature_group)
+
+    assert broker.committed == {partition: len(values) for partition, values in broker.partitions.items()}
+    # the uncommitted candles were written twice
+    assert len(feature_group.rows()) > len(expected)
+    assert_written_once_after_dedup(feature_group, expected)
+
+
+def test_revoked_partitions_are_not_committed():
+    expected = candles(n_candles=100, n_products=4)
+    broker = FakeBroker(expected, n_partitions=2)
+    feature_group = FakeFeatureGroup()
+
+    # the first batch, with both partitions, is still being written when
+    # partition 1 is revoked
+    written = threading.Event()
+    revoked = threading.Event()
+
+    def write(batch) -> None:
+        if not written.is_set():
+            written.set()
+            assert revoked.wait(timeout=10)
+        feature_group.write(batch)
+
+    def on_consume(consumer: FakeConsumer, n_consumes: int) -> None:
+        if n_consumes == 1:
+            assert written.wait(timeout=10)
+            consumer.revoke(1)
+            revoked.set()
+
+    consumer = FakeConsumer(broker, on_consume=on_consume)
+    with pytest.raises(Drained):
+        consume_to_feature_store(
+            consumer=consumer,
+            topic_name=TOPIC,
+            write=write,
+            flush_policy=flush_policy(),
+            consume_batch_size=25,
+        )
+
+    assert all(1 not in committed for committed in consumer.commits)
+    assert broker.committed == {0: len(broker.partitions[0])}
+
+    # the next owner of partition 1 replays it from the start
+    consumer = FakeConsumer(broker)
+    with pytest.raises(Drained):
+        consume(consumer, feature_group)
+    assert broker.committed == {partition: len(values) for partition, values in broker.partitions.items()}
+    assert_written_once_after_dedup(feature_group, expected)
@@ -0,0 +1,109 @@
+"""
+Compares the cost of `Predictor.predict_batch` for one product and for many,
+against a local online store of synthetic candles, so no Hopsworks account is
+needed.
+
+The store is written to a temporary directory in the SQLite layout that
+kafka_to_feature_store writes with FEATURE_STORE_BACKEND=local. The features
+of every product are first checked against `add_features` on that product
+alone. Run with `make benchmark-batch` (the predictor settings come from
+.live.env, the model from `--model-path`).
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# read by tools2 when it is imported
+root_dir = tempfile.mkdtemp()
+os.environ['FEATURE_STORE_BACKEND'] = 'local'
+os.environ['LOCAL_FEATURE_STORE_DIR'] = root_dir
+
+from src.config import config
+from src.feature_engineering import FEATURE_COLUMNS, add_features, add_last_candle_features
+from src.predictor import TIMEPERIOD, Predictor
+from src.training import interpolate_missing_candles
+
+
+def write_online_store(n_products: int, n_candles: int, missing_ratio: float, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    window_ms = config.ohlc_window_sec * 1000
+    last_window_end_ms = int(time.time() * 1000) // window_ms * window_ms
+    timestamps = last_window_end_ms - window_ms * np.arange(n_candles)[::-1]
+
+    candles = []
+    for i in range(n_products):
+        close = 100 * (i + 1) + rng.normal(0, 1, n_candles).cumsum()
+        product_candles = pd.DataFrame({
+            'product_id': f'P{i}/USD',
+            'timestamp': timestamps,
+            'open': close + rng.normal(0, 0.5, n_candles),
+            'high': close + 1,
+            'low': close - 1,
+            'close': close,
+        })
+        candles.append(product_candles[rng.random(n_candles) >= missing_ratio])
+
+    table_name = f'{config.feature_group_name}_{config.feature_group_version}'
+    with closing(sqlite3.connect(os.path.join(root_dir, 'online.db'))) as connection:
+        pd.concat(candles).to_sql(table_name, connection, index=False)
+
+
+def time_it(fn, n_runs: int) -> float:
+    start = perf_counter()
+    for _ in range(n_runs):
+        fn()
+    return (perf_counter() - start) / n_runs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-path', default='lasso_model.pkl')
+    parser.add_argument('--n-products', type=int, default=50)
+    parser.add_argument('--missing-ratio', type=float, default=0.05)
+    parser.add_argument('--n-runs', type=int, default=20)
+    args = parser.parse_args()
+
+    predictor = Predictor(
+        model_path=args.model_path,
+        ohlc_window_sec=config.ohlc_window_sec,
+        feature_view_name=config.feature_view_name,
+        feature_view_version=config.feature_view_version,
+        feature_group_name=config.feature_group_name,
+        feature_group_version=config.feature_group_version,
+        last_n_minutes=config.last_n_minutes,
+        prediction_window_sec=config.prediction_window_sec,
+        last_n_days_to_fetch_from_store=0,
+        last_n_days_to_test_model=0,
+    )
+    # the candles the predictor reads per product
+    n_candles = predictor.n_candles
+    write_online_store(args.n_products, n_candles, args.missing_ratio)
+    product_ids = tuple(f'P{i}/USD' for i in range(args.n_products))
+
+    # the features of every product, as if it was featurized alone
+    candles = predictor._read_online_store(product_ids)
+    batch_features = add_last_candle_features(candles, TIMEPERIOD, config.ohlc_window_sec)
+    for i, (product_id, product_candles) in enumerate(candles.groupby('product_id', sort=False)):
+        expected = add_features(
+            interpolate_missing_candles(product_candles, config.ohlc_window_sec), TIMEPERIOD, 0
+        )[FEATURE_COLUMNS].iloc[-1]
+        actual = batch_features.drop(columns=['product_id']).iloc[i]
+        np.testing.assert_allclose(actual.to_numpy(dtype=float), expected[actual.index].to_numpy(dtype=float))
+    logger.info(f'Batch features match add_features for {args.n_products} products of {n_candles} candles')
+
+    one_sec = time_it(lambda: predictor.predict_batch(product_ids[:1]), args.n_runs)
+    batch_sec = time_it(lambda: predictor.predict_batch(product_ids), args.n_runs)
+    loop_sec = time_it(lambda: [predictor.predict_batch((product_id,)) for product_id in product_ids], 1)
+
+    logger.info(f'1 product: {one_sec * 1000:.1f}ms')
+    logger.info(f'{args.n_products} products in one batch: {batch_sec * 1000:.1f}ms ({batch_sec / one_sec:.1f}x one product)')
+    logger.info(f'{args.n_products} products one by one: {loop_sec * 1000:.1f}ms')
+    logger.info(f'stages: {predictor.latency.snapshot()}')
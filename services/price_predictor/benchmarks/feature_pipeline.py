@@ -0,0 +1,126 @@
+"""
+Runs the training feature pipeline (interpolate_missing_candles,
+create_target_metric and add_features) on a year of synthetic 1-minute
+candles, and reports its wall time and peak memory, against the pipeline
+that copied the frame in every step.
+
+Peak memory is measured with tracemalloc, which sees the NumPy buffers behind
+the frames, so it is the extra memory a step allocates on top of its input.
+Both pipelines must return the same features. Run with
+`make benchmark-feature-pipeline`.
+"""
+import argparse
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import talib
+from loguru import logger
+
+from src.feature_engineering import add_features
+from src.training import create_target_metric, interpolate_missing_candles
+
+N_CANDLES_INTO_FUTURE = 5
+
+
+def synthetic_candles(n_candles: int, missing_ratio: float, seed: int = 0) -> pd.DataFrame:
+    """
+    1-minute candles of one product with a random walk close, and a share of
+    the windows left out.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000_000 + 60_000 * np.arange(n_candles)
+    close = 40_000 + rng.normal(0, 20, n_candles).cumsum()
+    candles = pd.DataFrame({
+        'timestamp': timestamps,
+        'open': close + rng.normal(0, 5, n_candles),
+        'high': close + 10,
+        'low': close - 10,
+        'close': close,
+        'product_id': 'BTC/USD',
+    })
+    return candles[rng.random(n_candles) >= missing_ratio].reset_index(drop=True)
+
+
+def legacy_interpolate_missing_candles(data: pd.DataFrame, ohlc_window_sec: int = 60) -> pd.DataFrame:
+    window_ms = ohlc_window_sec * 1000
+    data.set_index('timestamp', inplace=True)
+    labels = range(int(data.index.min()), int(data.index.max()) + window_ms, window_ms)
+    data = data.reindex(labels)
+    data['close'] = data['close'].ffill()
+    data['product_id'] = data['product_id'].ffill()
+    data['open'] = data['open'].fillna(data['close'])
+    data['high'] = data['high'].fillna(data['close'])
+    data['low'] = data['low'].fillna(data['close'])
+    data.reset_index(inplace=True)
+    data['datetime'] = pd.to_datetime(data['timestamp'], unit='ms')
+    return data
+
+
+def legacy_create_target_metric(data: pd.DataFrame, n_candles_into_future: int) -> pd.DataFrame:
+    data['close_pct_change'] = data['close'].pct_change(n_candles_into_future)
+    data['target_metric'] = data['close_pct_change'].shift(-n_candles_into_future)
+    data.drop(columns=['close_pct_change'], inplace=True)
+    data.dropna(subset=['target_metric'], inplace=True)
+    return data
+
+
+def legacy_add_features(data: pd.DataFrame, timeperiod: int) -> pd.DataFrame:
+    X_ = data.copy()
+    X_ = X_.copy()
+    X_['rsi'] = talib.RSI(X_['close'], timeperiod=timeperiod)
+    X_['momentum'] = talib.MOM(X_['close'], timeperiod=timeperiod)
+    X_ = X_.copy()
+    X_['volatility'] = talib.STDDEV(X_['close'], timeperiod=timeperiod)
+    X_ = X_.copy()
+    X_['day_of_week'] = X_['datetime'].dt.dayofweek
+    X_['hour_of_day'] = X_['datetime'].dt.hour
+    X_['minute_of_hour'] = X_['datetime'].dt.minute
+    return X_
+
+
+def legacy_pipeline(candles: pd.DataFrame, timeperiod: int) -> pd.DataFrame:
+    data = legacy_interpolate_missing_candles(candles.copy())
+    data = legacy_create_target_metric(data, N_CANDLES_INTO_FUTURE)
+    return legacy_add_features(data, timeperiod)
+
+
+def pipeline(candles: pd.DataFrame, timeperiod: int) -> pd.DataFrame:
+    data = interpolate_missing_candles(candles)
+    data = create_target_metric(data, ohlc_window_sec=60, prediction_window_sec=60 * N_CANDLES_INTO_FUTURE)
+    return add_features(data, timeperiod=timeperiod, n_candles_into_future=N_CANDLES_INTO_FUTURE)
+
+
+def measure(run, candles: pd.DataFrame, timeperiod: int):
+    tracemalloc.start()
+    start = perf_counter()
+    features = run(candles, timeperiod)
+    elapsed = perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return features, elapsed, peak_bytes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-days', type=int, default=365)
+    parser.add_argument('--missing-ratio', type=float, default=0.01)
+    parser.add_argument('--timeperiod', type=int, default=14)
+    args = parser.parse_args()
+
+    candles = synthetic_candles(args.n_days * 24 * 60, args.missing_ratio)
+    input_bytes = candles.memory_usage(deep=True).sum()
+    logger.info(f'{len(candles):,} candles, {input_bytes / 2**20:,.0f}MB')
+
+    expected, legacy_sec, legacy_peak = measure(legacy_pipeline, candles, args.timeperiod)
+    actual, sec, peak = measure(pipeline, candles, args.timeperiod)
+
+    pd.testing.assert_frame_equal(
+        actual.reset_index(drop=True), expected[actual.columns].reset_index(drop=True),
+        check_dtype=False,
+    )
+
+    logger.info(f'copying pipeline: {legacy_sec:.2f}s, peak {legacy_peak / 2**20:,.0f}MB')
+    logger.info(f'copy-free pipeline: {sec:.2f}s, peak {peak / 2**20:,.0f}MB')
+    logger.info(f'{legacy_sec / sec:.1f}x faster, {legacy_peak / peak:.1f}x less peak memory')
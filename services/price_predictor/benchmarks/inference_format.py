@@ -0,0 +1,88 @@
+"""
+Compares the inference format exported by training with the pickled models
+it replaces, for the Lasso and the XGBoost regressor of `model_factory`.
+
+Both models are fitted on the features of the `--data` candles, like in
+training, then exported, saved and loaded back. Their predictions on every row
+must match the fitted models. Then the time to load each file and to predict
+one row is measured: the pickled model on a one-row DataFrame, and the
+exported one on a NumPy row and on the DataFrame. Run with
+`make benchmark-inference`.
+"""
+import argparse
+import os
+import pickle
+import tempfile
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.feature_engineering import FEATURE_COLUMNS, add_features
+from src.inference_model import INFERENCE_MODEL_SUFFIX, export_model, load_inference_model, save_inference_model
+from src.model_factory import fit_lasso_regressor, fit_xgboost_regressor
+from src.training import create_target_metric, interpolate_missing_candles
+
+
+def time_it(fn, n_runs: int) -> float:
+    start = perf_counter()
+    for _ in range(n_runs):
+        fn()
+    return (perf_counter() - start) / n_runs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data.csv')
+    parser.add_argument('--n-runs', type=int, default=2000)
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.data)[['timestamp', 'open', 'high', 'low', 'close', 'product_id']]
+    data = interpolate_missing_candles(data, 60)
+    data = create_target_metric(data, ohlc_window_sec=60, prediction_window_sec=300)
+    X = add_features(data.drop(columns=['target_metric']), timeperiod=14, n_candles_into_future=5)
+    X = X[FEATURE_COLUMNS]
+    has_features = ~X.isna().any(axis=1)
+    X, y = X[has_features], data['target_metric'][has_features]
+
+    last_row = X.iloc[-1:]
+    last_row_values = last_row.to_numpy(dtype=np.float64)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        for name, fit in [('lasso', fit_lasso_regressor), ('xgboost', fit_xgboost_regressor)]:
+            model = fit(X, y)
+            pickle_path = os.path.join(model_dir, f'{name}.pkl')
+            inference_path = os.path.join(model_dir, f'{name}{INFERENCE_MODEL_SUFFIX}')
+            with open(pickle_path, 'wb') as f:
+                pickle.dump(model, f)
+            save_inference_model(export_model(model), inference_path)
+            inference_model = load_inference_model(inference_path)
+
+            # XGBoost predicts in float32
+            np.testing.assert_allclose(
+                inference_model.predict_frame(X), model.predict(X), rtol=1e-5, atol=1e-6,
+                err_msg=f'The {name} inference model does not match the fitted model',
+            )
+
+            def load_pickle():
+                with open(pickle_path, 'rb') as f:
+                    return pickle.load(f)
+
+            load_pickle_sec = time_it(load_pickle, 20)
+            load_inference_sec = time_it(lambda: load_inference_model(inference_path), 20)
+            pickle_sec = time_it(lambda: model.predict(last_row), args.n_runs)
+            frame_sec = time_it(lambda: inference_model.predict_frame(last_row), args.n_runs)
+            array_sec = time_it(lambda: inference_model.predict(last_row_values), args.n_runs)
+
+            logger.info(
+                f'{name}: predictions match on {len(X)} rows, '
+                f'file {os.path.getsize(pickle_path):,}B pickled, {os.path.getsize(inference_path):,}B exported'
+            )
+            logger.info(
+                f'{name} load: pickle {load_pickle_sec * 1000:.2f}ms, exported {load_inference_sec * 1000:.2f}ms'
+            )
+            logger.info(
+                f'{name} one row: pickle {pickle_sec * 1e6:,.0f}us, exported {array_sec * 1e6:,.1f}us on NumPy '
+                f'({pickle_sec / array_sec:,.0f}x), {frame_sec * 1e6:,.0f}us on the DataFrame'
+            )
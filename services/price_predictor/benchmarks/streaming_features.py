@@ -0,0 +1,54 @@
+"""
+Compares the cost of adding one candle to the features: an update of
+`StreamingFeatures`, against `add_features` over the last `--window` candles.
+
+The candles are read from `--data` (by default the `data.csv` training sample
+of this service) and interpolated like in training. That both give the same
+features is checked by `tests/test_streaming_features.py`. Run with
+`make benchmark-features`.
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.feature_engineering import add_features
+from src.streaming_features import StreamingFeatures
+from src.training import interpolate_missing_candles
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data.csv')
+    parser.add_argument('--timeperiod', type=int, default=14)
+    parser.add_argument('--ohlc-window-sec', type=int, default=60)
+    parser.add_argument('--window', type=int, default=1440)
+    parser.add_argument('--n-updates', type=int, default=200)
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.data)[['timestamp', 'open', 'high', 'low', 'close', 'product_id']]
+    data = interpolate_missing_candles(data, args.ohlc_window_sec)
+
+    streaming_features = StreamingFeatures(args.timeperiod, args.ohlc_window_sec)
+    for timestamp, close in zip(data['timestamp'].tolist(), data['close'].tolist()):
+        streaming_features.update(timestamp, close)
+
+    window = data.iloc[-args.window:]
+    start = perf_counter()
+    for _ in range(args.n_updates):
+        add_features(window, timeperiod=args.timeperiod, n_candles_into_future=5)
+    recompute_sec = (perf_counter() - start) / args.n_updates
+
+    timestamps = data['timestamp'].iloc[-1] + args.ohlc_window_sec * 1000 * np.arange(1, 100_001)
+    closes = data['close'].iloc[-1] + np.random.normal(0, 10, len(timestamps)).cumsum()
+    start = perf_counter()
+    for timestamp, close in zip(timestamps.tolist(), closes.tolist()):
+        streaming_features.update(timestamp, close)
+    update_sec = (perf_counter() - start) / len(timestamps)
+
+    logger.info(
+        f'add_features over {len(window)} candles: {recompute_sec * 1e6:,.0f}us, '
+        f'StreamingFeatures.update: {update_sec * 1e6:,.1f}us '
+        f'({recompute_sec / update_sec:,.0f}x)'
+    )
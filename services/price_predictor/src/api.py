@@ -1,20 +1,138 @@
-from flask import Flask, jsonify
-from src.predictor import Predictor
+from typing import List
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from src.coalescer import RequestCoalescer
+from src.prediction_cache import PredictionCache, PredictionRefresher
+from src.model_registry import ModelArtifact, ModelRefresher
+from src.predictor import Predictor, get_model_registry
+from src.config import config
 from loguru import logger
 
-app = Flask(__name__)
+app = FastAPI()
 
-predictor = Predictor.from_model_registry(model_name='btc_usd_price_predictor_lasso')
+predictor = Predictor.from_model_registry(model_name=config.model_name, version=config.model_version)
+if config.candle_cache_enabled:
+    predictor.enable_candle_cache(
+        kafka_broker_address=config.kafka_broker_address,
+        kafka_topic=config.kafka_topic,
+    )
+# predictions run on a pool of threads, and concurrent requests share one
+predict = RequestCoalescer(
+    predictor.predict,
+    max_workers=config.predict_max_workers,
+    window_sec=config.coalesce_window_ms / 1000,
+)
+predict_batch = RequestCoalescer(
+    predictor.predict_batch,
+    max_workers=config.predict_max_workers,
+    window_sec=config.coalesce_window_ms / 1000,
+)
+prediction_cache = None
+if config.prediction_cache_enabled:
+    prediction_cache = PredictionCache(
+        ohlc_window_sec=config.ohlc_window_sec,
+        candle_cache=predictor.candle_cache,
+        retry_sec=config.prediction_retry_sec,
+    )
+    # computes the predictions of the new candles before they are requested
+    PredictionRefresher(
+        cache=prediction_cache,
+        predict_batch=predictor.predict_batch,
+        product_ids=(config.product_id,),
+        delay_sec=config.prediction_refresh_delay_sec,
+    ).start()
+
+def on_new_model_version(artifact: ModelArtifact) -> None:
+    predictor.swap_model(artifact)
+    if prediction_cache is not None:
+        prediction_cache.clear()
+
+# a pinned version is never swapped
+if config.model_version is None and config.model_refresh_sec > 0:
+    ModelRefresher(
+        registry=get_model_registry(),
+        model_name=config.model_name,
+        version=predictor.metadata['version'],
+        refresh_sec=config.model_refresh_sec,
+        on_new_version=on_new_model_version,
+    ).start()
 logger.info(f"Predictor initialized")
 
-@app.route('/health', methods=['GET'])
-def health():
+class BatchPredictionRequest(BaseModel):
+    product_ids: List[str]
+    # the model predicts `prediction_window_sec` ahead only
+    horizons_sec: List[int] = [config.prediction_window_sec]
+
+@app.get('/health')
+async def health():
     return f"I'm healthy"
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    output = predictor.predict()
-    return jsonify(output.to_dict())
+@app.post('/predict')
+async def predict_endpoint():
+    if prediction_cache is not None:
+        output = prediction_cache.get(config.product_id)
+        if output is not None:
+            return output.to_dict()
+
+    output = await predict()
+    if prediction_cache is not None:
+        prediction_cache.put([output])
+    return output.to_dict()
+
+@app.post('/predict/batch')
+async def predict_batch_endpoint(request: BatchPredictionRequest):
+    """
+    Predicts every product of the request with one read and one model call.
+    """
+    unsupported = sorted(set(request.horizons_sec) - {config.prediction_window_sec})
+    if unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported horizons {unsupported}, the model predicts {config.prediction_window_sec}s ahead",
+        )
+
+    product_ids = tuple(dict.fromkeys(request.product_ids))
+    cached = {}
+    if prediction_cache is not None:
+        cached = {product_id: prediction_cache.get(product_id) for product_id in product_ids}
+        cached = {product_id: output for product_id, output in cached.items() if output is not None}
+
+    to_predict = tuple(product_id for product_id in product_ids if product_id not in cached)
+    if to_predict:
+        outputs = await predict_batch(to_predict)
+        if prediction_cache is not None:
+            prediction_cache.put(outputs)
+        cached.update({output.product_id: output for output in outputs})
+    outputs = [cached[product_id] for product_id in product_ids if product_id in cached]
+    predicted = {output.product_id for output in outputs}
+    return {
+        'predictions': [
+            {**output.to_dict(), 'horizon_sec': horizon_sec}
+            for output in outputs
+            for horizon_sec in dict.fromkeys(request.horizons_sec)
+        ],
+        'missing_product_ids': [product_id for product_id in product_ids if product_id not in predicted],
+    }
+
+@app.get('/metrics')
+async def metrics():
+    """
+    Latency of every stage of the predictions of this worker process, and how
+    many requests shared a prediction.
+    """
+    return {
+        'model': {
+            'name': predictor.metadata.get('model_name'),
+            'version': predictor.metadata.get('version'),
+            'sha256': predictor.metadata.get('sha256'),
+            'first_prediction_sec': predictor.first_prediction_sec,
+        },
+        'stages': predictor.latency.snapshot(),
+        'requests': predict.stats(),
+        'batch_requests': predict_batch.stats(),
+        'prediction_cache': prediction_cache.stats() if prediction_cache is not None else None,
+    }
 
 if __name__ == '__main__':
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, port=5000)
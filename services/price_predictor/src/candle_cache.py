@@ -0,0 +1,269 @@
+import json
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from confluent_kafka import TopicPartition
+from loguru import logger
+from quixstreams import Application
+
+from src.streaming_features import StreamingFeatures
+
+
+class CandleRingBuffer:
+    """
+    The last `capacity` candles of one product, oldest first, in NumPy arrays.
+
+    Rows live in arrays twice the capacity and are appended at the end. When
+    the end is reached, the last `capacity` rows are moved to the front. So an
+    append is amortized O(1), and the candles are always one contiguous slice
+    that is read without copying.
+
+    A candle with the timestamp of one in the buffer replaces it, and a late
+    candle is inserted in its place, unless it is older than every candle of
+    a full buffer.
+    """
+
+    def __init__(self, capacity: int, n_columns: int):
+        self.capacity = capacity
+        self._timestamps = np.empty(2 * capacity, dtype=np.int64)
+        self._values = np.empty((2 * capacity, n_columns), dtype=np.float64)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[self._start:self._end]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[self._start:self._end]
+
+    def upsert(self, timestamp: int, values: np.ndarray) -> None:
+        timestamps = self.timestamps
+        if len(timestamps) == 0 or timestamp > timestamps[-1]:
+            i = len(timestamps)
+        else:
+            i = int(np.searchsorted(timestamps, timestamp))
+            if timestamps[i] == timestamp:
+                self._values[self._start + i] = values
+                return
+            if i == 0 and len(self) == self.capacity:
+                return
+
+        if self._end == len(self._timestamps):
+            self._compact()
+
+        position = self._start + i
+        # shifts the later candles, if any, one row down
+        self._timestamps[position + 1:self._end + 1] = self._timestamps[position:self._end]
+        self._values[position + 1:self._end + 1] = self._values[position:self._end]
+        self._timestamps[position] = timestamp
+        self._values[position] = values
+        self._end += 1
+
+        if len(self) > self.capacity:
+            self._start += 1
+
+    def _compact(self) -> None:
+        n_rows = len(self)
+        self._timestamps[:n_rows] = self._timestamps[self._start:self._end]
+        self._values[:n_rows] = self._values[self._start:self._end]
+        self._start = 0
+        self._end = n_rows
+
+
+class CandleCache:
+    """
+    The last `capacity` candles of every product, kept in a `CandleRingBuffer`
+    per product and safe to update from another thread.
+
+    Numeric columns are stored, in the order of the first frame or candle
+    seen, so `get_candles` returns the columns the model was trained on.
+
+    With a `timeperiod`, the features of the last candle of every product are
+    also kept up to date with `StreamingFeatures`, from every candle seen
+    since the cache was hydrated.
+    """
+
+    def __init__(self, capacity: int, timeperiod: Optional[int] = None, ohlc_window_sec: int = 60):
+        self.capacity = capacity
+        self.timeperiod = timeperiod
+        self.ohlc_window_sec = ohlc_window_sec
+        self.columns: Optional[List[str]] = None
+        self._buffers: Dict[str, CandleRingBuffer] = {}
+        self._features: Dict[str, StreamingFeatures] = {}
+        self._listeners: List[Callable[[str, int], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str, int], None]) -> None:
+        """
+        Calls `listener(product_id, timestamp)` with every candle newer than
+        the last one of its product, from the thread that adds it.
+        """
+        self._listeners.append(listener)
+
+    def _set_columns(self, columns: List[str]) -> None:
+        if self.columns is None:
+            self.columns = [column for column in columns if column != 'timestamp']
+            logger.info(f'Caching the last {self.capacity} candles with columns {self.columns}')
+
+    def hydrate(self, data: pd.DataFrame) -> None:
+        """
+        Loads candles read from the feature store, e.g. on a cold start.
+        """
+        numeric_data = data.select_dtypes(include=['number'])
+        self._set_columns(list(numeric_data.columns))
+        for candle in numeric_data.assign(product_id=data['product_id']).to_dict('records'):
+            self.update(candle)
+
+    def update(self, candle: Dict) -> None:
+        """
+        Adds a candle, or replaces the one with the same timestamp.
+        """
+        # None is a numeric value that is missing, e.g. in a synthetic candle
+        self._set_columns([
+            column for column, value in candle.items()
+            if value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+        ])
+        # a missing or None value becomes NaN
+        values = np.array([candle.get(column) for column in self.columns], dtype=np.float64)
+        with self._lock:
+            buffer = self._buffers.get(candle['product_id'])
+            if buffer is None:
+                buffer = self._buffers[candle['product_id']] = CandleRingBuffer(
+                    self.capacity, len(self.columns)
+                )
+            is_new = len(buffer) == 0 or candle['timestamp'] > buffer.timestamps[-1]
+            buffer.upsert(candle['timestamp'], values)
+
+            if self.timeperiod is not None and candle.get('close') is not None:
+                features = self._features.get(candle['product_id'])
+                if features is None:
+                    features = self._features[candle['product_id']] = StreamingFeatures(
+                        self.timeperiod, self.ohlc_window_sec
+                    )
+                features.update(candle['timestamp'], candle['close'])
+
+        if is_new:
+            for listener in self._listeners:
+                listener(candle['product_id'], candle['timestamp'])
+
+    def get_last_timestamp(self, product_id: str) -> Optional[int]:
+        """
+        Returns the timestamp of the last cached candle of `product_id`.
+        """
+        with self._lock:
+            buffer = self._buffers.get(product_id)
+            if buffer is None or len(buffer) == 0:
+                return None
+            return int(buffer.timestamps[-1])
+
+    def get_candles(self, product_id: str) -> pd.DataFrame:
+        """
+        Returns the cached candles of `product_id`, oldest first.
+        """
+        with self._lock:
+            buffer = self._buffers.get(product_id)
+            if buffer is None:
+                return pd.DataFrame(columns=['product_id', 'timestamp', *(self.columns or [])])
+            timestamps = buffer.timestamps.copy()
+            # one contiguous array per column
+            columns = buffer.values.T.copy()
+
+        return pd.DataFrame(
+            {
+                'product_id': np.full(len(timestamps), product_id, dtype=object),
+                'timestamp': timestamps,
+                **dict(zip(self.columns, columns)),
+            },
+            copy=False,
+        )
+
+    def get_last_features(self, product_id: str, feature_names: List[str]) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Returns the timestamp of the last candle of `product_id`, and the
+        candle with its streaming features as an array of `feature_names`, in
+        that order, or None if the features are not available yet.
+        """
+        with self._lock:
+            buffer = self._buffers.get(product_id)
+            features = self._features.get(product_id)
+            if buffer is None or features is None or features.features is None:
+                return None
+            if buffer.timestamps[-1] != features.last_timestamp:
+                return None
+            timestamp = int(buffer.timestamps[-1])
+            values = {
+                'timestamp': timestamp,
+                **dict(zip(self.columns, buffer.values[-1].tolist())),
+                **features.features,
+            }
+            row = np.array([values[name] for name in feature_names], dtype=np.float64)
+
+        if np.isnan(row).any():
+            # NaN until `timeperiod` candles were seen, or a missing value
+            return None
+        return timestamp, row
+
+
+class CandleFeed:
+    """
+    Consumes the OHLC topic into a `CandleCache` from a background thread.
+
+    Every instance needs every partition, so it joins a consumer group of its
+    own and never commits. On assignment it seeks back `lookback_ms`, so the
+    candles produced while the cache was being hydrated are not missed.
+    """
+
+    def __init__(
+        self,
+        cache: CandleCache,
+        kafka_broker_address: str,
+        kafka_topic: str,
+        lookback_ms: int,
+    ):
+        self.cache = cache
+        self.kafka_broker_address = kafka_broker_address
+        self.kafka_topic = kafka_topic
+        self.lookback_ms = lookback_ms
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='candle-feed', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _seek_to_lookback(self, consumer, partitions: List[TopicPartition]) -> None:
+        from_ms = int(time.time() * 1000) - self.lookback_ms
+        offsets = consumer.offsets_for_times(
+            [TopicPartition(p.topic, p.partition, from_ms) for p in partitions], timeout=10
+        )
+        consumer.assign(offsets)
+
+    def _run(self) -> None:
+        app = Application(
+            broker_address=self.kafka_broker_address,
+            consumer_group=f'price_predictor_candle_feed_{uuid.uuid4().hex}',
+            auto_offset_reset='latest',
+        )
+        with app.get_consumer(auto_commit_enable=False) as consumer:
+            consumer.subscribe(topics=[self.kafka_topic], on_assign=self._seek_to_lookback)
+            while not self._stop.is_set():
+                msg = consumer.poll(1)
+                if msg is None:
+                    continue
+                if msg.error():
+                    logger.error(f'Candle feed error: {msg.error()}')
+                    continue
+                self.cache.update(json.loads(msg.value()))
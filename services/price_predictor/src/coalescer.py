@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Set
+
+
+class RequestCoalescer:
+    """
+    Runs a blocking function, e.g. `Predictor.predict`, on a pool of worker
+    threads for async request handlers.
+
+    The calls with the same arguments made within `window_sec` of the first
+    one share its run: the run starts when the window closes, and every caller
+    gets its result, or its exception. So a burst of concurrent requests costs
+    one feature read and one model call.
+    """
+
+    def __init__(self, fn: Callable, max_workers: int, window_sec: float):
+        self.fn = fn
+        self.window_sec = window_sec
+        self.n_calls = 0
+        self.n_runs = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='coalescer')
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        # references to the running tasks, so they are not garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def __call__(self, *args: Hashable) -> Any:
+        self.n_calls += 1
+        future = self._pending.get(args)
+        if future is None:
+            future = self._pending[args] = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._run(args, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # a caller that goes away does not cancel the run of the others
+        return await asyncio.shield(future)
+
+    async def _run(self, args: tuple, future: asyncio.Future) -> None:
+        await asyncio.sleep(self.window_sec)
+        # later calls start a new window
+        del self._pending[args]
+        self.n_runs += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, self.fn, *args)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        return {'n_calls': self.n_calls, 'n_runs': self.n_runs}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
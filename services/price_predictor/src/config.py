@@ -18,5 +18,27 @@ class Config(BaseSettings):
     comet_project_name: str = os.environ.get('COMET_PROJECT_NAME')
     comet_api_key: str = os.environ.get('COMET_API_KEY')
     comet_workspace: str = os.environ.get('COMET_WORKSPACE')
+    product_id: str = os.environ.get('PRODUCT_ID', 'BTC/USD')
+    model_name: str = os.environ.get('MODEL_NAME', 'btc_usd_price_predictor_lasso')
+    # pins a version of the model, instead of following the production one
+    model_version: Optional[str] = os.environ.get('MODEL_VERSION')
+    # models downloaded from the registry, by sha256
+    model_cache_dir: str = os.environ.get('MODEL_CACHE_DIR', 'model_cache')
+    # how often the API checks for a new production version, 0 to never
+    model_refresh_sec: float = os.environ.get('MODEL_REFRESH_SEC', 300)
+    # keeps the latest candles in memory, consumed from `kafka_topic`
+    candle_cache_enabled: bool = os.environ.get('CANDLE_CACHE_ENABLED', False)
+    kafka_broker_address: Optional[str] = None
+    kafka_topic: str = os.environ.get('KAFKA_TOPIC', 'ohlc')
+    # threads running predictions, per API worker process
+    predict_max_workers: int = os.environ.get('PREDICT_MAX_WORKERS', 4)
+    # concurrent /predict requests within this window share one prediction
+    coalesce_window_ms: float = os.environ.get('COALESCE_WINDOW_MS', 5)
+    # serves the last prediction of a product until a new candle closes
+    prediction_cache_enabled: bool = os.environ.get('PREDICTION_CACHE_ENABLED', True)
+    # predictions are recomputed this long after every window closes
+    prediction_refresh_delay_sec: float = os.environ.get('PREDICTION_REFRESH_DELAY_SEC', 2)
+    # and then every `prediction_retry_sec` until the new candle is in the store
+    prediction_retry_sec: float = os.environ.get('PREDICTION_RETRY_SEC', 1)
 
 config = Config()
\ No newline at end of file
@@ -1,40 +1,144 @@
-import talib
+from typing import Dict
+
+import numpy as np
 import pandas as pd
+import talib
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+# The candle columns the models are trained on. The other numeric columns of
+# the candles, like the volumes and trade counts, are not features until a
+# model is trained with them.
+CANDLE_FEATURE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close']
+# The columns of a feature row, in the order the models expect them
+FEATURE_COLUMNS = [
+    *CANDLE_FEATURE_COLUMNS,
+    'rsi',
+    'momentum',
+    'volatility',
+    'day_of_week',
+    'hour_of_day',
+    'minute_of_hour',
+]
 
 def add_features(
     data: pd.DataFrame,
     timeperiod: int,
     n_candles_into_future: int,
 ) -> pd.DataFrame:
-    X_ = data.copy()
-    X_ = add_momentum_indicator(X_, timeperiod=timeperiod)
-    X_ = add_volatility_indicator(X_, timeperiod=timeperiod)
-    X_ = add_temportal_features(X_)
-    return X_
+    """
+    Returns `data` with the feature columns added, in a new frame.
 
-def add_momentum_indicator(
-    data: pd.DataFrame,
+    The features are computed in one pass over the close and timestamp arrays,
+    and the new frame is built around the columns of `data` without copying
+    them. So `data` is not modified, and the two frames share the candle
+    columns: copy the result before writing into those columns in place.
+    """
+    close = np.ascontiguousarray(data['close'].to_numpy(dtype=np.float64))
+    timestamps = data['timestamp'].to_numpy(dtype=np.int64)
+
+    features = {
+        **momentum_indicators(close, timeperiod=timeperiod),
+        **volatility_indicator(close, timeperiod=timeperiod),
+        **temporal_features(timestamps),
+    }
+    return pd.DataFrame(
+        {
+            **{column: data[column] for column in data.columns if column not in features},
+            **features,
+        },
+        index=data.index,
+        copy=False,
+    )
+
+def momentum_indicators(
+    close: np.ndarray,
     timeperiod: int,
-) -> pd.DataFrame:
-    X_ = data.copy()
-    X_['rsi'] = talib.RSI(X_['close'], timeperiod=timeperiod)
-    X_['momentum'] = talib.MOM(X_['close'], timeperiod=timeperiod)
-    return X_
+) -> Dict[str, np.ndarray]:
+    return {
+        'rsi': talib.RSI(close, timeperiod=timeperiod),
+        'momentum': talib.MOM(close, timeperiod=timeperiod),
+    }
 
-def add_volatility_indicator(
-    data: pd.DataFrame,
+def volatility_indicator(
+    close: np.ndarray,
     timeperiod: int,
-) -> pd.DataFrame:
-    X_ = data.copy()
-    X_['volatility'] = talib.STDDEV(X_['close'], timeperiod=timeperiod)
-    return X_
+) -> Dict[str, np.ndarray]:
+    return {
+        'volatility': talib.STDDEV(close, timeperiod=timeperiod),
+    }
 
-def add_temportal_features(
+def temporal_features(
+    timestamps: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    The UTC day of the week (Monday is 0), hour and minute of the candles,
+    from their timestamps in ms.
+    """
+    # 1970-01-01 was a Thursday
+    return {
+        'day_of_week': ((timestamps // DAY_MS + 3) % 7).astype(np.int32),
+        'hour_of_day': (timestamps // HOUR_MS % 24).astype(np.int32),
+        'minute_of_hour': (timestamps // MINUTE_MS % 60).astype(np.int32),
+    }
+
+def add_last_candle_features(
     data: pd.DataFrame,
+    timeperiod: int,
+    ohlc_window_sec: int,
 ) -> pd.DataFrame:
-    X_ = data.copy()
-    X_['day_of_week'] = X_['datetime'].dt.dayofweek
-    X_['hour_of_day'] = X_['datetime'].dt.hour
-    X_['minute_of_hour'] = X_['datetime'].dt.minute
+    """
+    Returns the last candle of every product in `data` with its features, one
+    row per product in order of appearance, with `product_id` and the
+    `FEATURE_COLUMNS`.
+
+    The features of a row are those `add_features` gives the last candle of
+    the product after `interpolate_missing_candles`, but the products are
+    processed together: the closes are pivoted once onto a common grid of
+    windows and forward filled, and only the indicators run per product, on
+    NumPy arrays.
+    """
+    window_ms = ohlc_window_sec * 1000
+    codes, product_ids = pd.factorize(data['product_id'])
+    timestamps = data['timestamp'].to_numpy(dtype=np.int64)
+
+    # the last candle of every product, with missing values filled like in
+    # the frame path
+    candle_data = data[CANDLE_FEATURE_COLUMNS]
+    if candle_data.isna().to_numpy().any():
+        candle_data = candle_data.groupby(codes).ffill()
+    order = np.lexsort((timestamps, codes))
+    last_rows = order[np.append(codes[order][1:] != codes[order][:-1], True)]
+    last_candles = candle_data.iloc[last_rows]
+
+    # closes on the grid of windows, one column per product
+    slots = (timestamps - timestamps.min()) // window_ms
+    closes = np.full((slots.max() + 1, len(product_ids)), np.nan)
+    closes[slots, codes] = data['close'].to_numpy(dtype=np.float64)
+    # a window without a candle gets the previous close of the product
+    valid = ~np.isnan(closes)
+    previous_rows = np.where(valid, np.arange(len(closes))[:, None], 0)
+    np.maximum.accumulate(previous_rows, axis=0, out=previous_rows)
+    closes = closes[previous_rows, np.arange(len(product_ids))]
+
+    indicators = {name: np.full(len(product_ids), np.nan) for name in ['rsi', 'momentum', 'volatility']}
+    for i in range(len(product_ids)):
+        rows = np.flatnonzero(valid[:, i])
+        if len(rows) == 0:
+            continue
+        # from the first to the last candle of the product
+        close = np.ascontiguousarray(closes[rows[0]:rows[-1] + 1, i])
+        for name, values in {
+            **momentum_indicators(close, timeperiod=timeperiod),
+            **volatility_indicator(close, timeperiod=timeperiod),
+        }.items():
+            indicators[name][i] = values[-1]
 
-    return X_
\ No newline at end of file
+    return pd.DataFrame({
+        'product_id': product_ids,
+        **{column: last_candles[column].to_numpy() for column in CANDLE_FEATURE_COLUMNS},
+        **indicators,
+        **temporal_features(last_candles['timestamp'].to_numpy(dtype=np.int64)),
+    })
@@ -0,0 +1,193 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+class InferenceModel(ABC):
+    """
+    A trained model exported to plain arrays, that predicts on a NumPy matrix
+    whose columns are `feature_names`, in that order, without scikit-learn or
+    XGBoost and their input validation.
+    """
+
+    format: str
+
+    def __init__(self, feature_names: List[str]):
+        self.feature_names = list(feature_names)
+
+    @abstractmethod
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predicts the rows of `X`, whose columns are `feature_names`.
+        """
+
+    def predict_frame(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Predicts the rows of `data`, whose columns are picked by name.
+        """
+        return self.predict(data[self.feature_names].to_numpy(dtype=np.float64))
+
+    @abstractmethod
+    def to_dict(self) -> Dict:
+        """
+        Returns the parameters of the model, as saved by `save_inference_model`.
+        """
+
+
+class LinearModel(InferenceModel):
+    """
+    A linear model, e.g. the Lasso of training: `X @ coef + intercept`.
+    """
+
+    format = 'linear'
+
+    def __init__(self, feature_names: List[str], coef: np.ndarray, intercept: float):
+        super().__init__(feature_names)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.coef + self.intercept
+
+    def to_dict(self) -> Dict:
+        return {'coef': self.coef.tolist(), 'intercept': self.intercept}
+
+
+class TreeEnsembleModel(InferenceModel):
+    """
+    A sum of regression trees, e.g. an XGBoost regressor, with the nodes of all
+    the trees in flat arrays.
+
+    Node `i` is a leaf if `feature[i]` is -1, with the value `value[i]`. Else
+    a row goes to `left[i]` if its feature is below `threshold[i]`, to
+    `missing[i]` if it is NaN, and to `right[i]` otherwise. Rows are compared
+    in float32, like XGBoost does, and every row goes down all the trees at
+    once, one level per step.
+    """
+
+    format = 'tree_ensemble'
+
+    def __init__(
+        self,
+        feature_names: List[str],
+        base_score: float,
+        roots: np.ndarray,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        missing: np.ndarray,
+        value: np.ndarray,
+    ):
+        super().__init__(feature_names)
+        self.base_score = float(base_score)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.feature = np.asarray(feature, dtype=np.int64)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.missing = np.asarray(missing, dtype=np.int64)
+        self.value = np.asarray(value, dtype=np.float32)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.tile(self.roots, (len(X), 1))
+
+        is_leaf = self.feature[nodes] < 0
+        while not is_leaf.all():
+            values = X[rows, np.where(is_leaf, 0, self.feature[nodes])]
+            children = np.where(
+                np.isnan(values),
+                self.missing[nodes],
+                np.where(values < self.threshold[nodes], self.left[nodes], self.right[nodes]),
+            )
+            nodes = np.where(is_leaf, nodes, children)
+            is_leaf = self.feature[nodes] < 0
+
+        return self.base_score + self.value[nodes].sum(axis=1, dtype=np.float64)
+
+    def to_dict(self) -> Dict:
+        return {
+            'base_score': self.base_score,
+            **{
+                name: getattr(self, name).tolist()
+                for name in ['roots', 'feature', 'threshold', 'left', 'right', 'missing', 'value']
+            },
+        }
+
+
+# training writes the model next to its pickle, as `{name}.inference.json`
+INFERENCE_MODEL_SUFFIX = '.inference.json'
+
+INFERENCE_MODELS = {model.format: model for model in [LinearModel, TreeEnsembleModel]}
+
+
+def export_model(model) -> InferenceModel:
+    """
+    Exports a fitted scikit-learn linear model or XGBoost regressor, trained
+    on a DataFrame, whose columns become the feature order.
+    """
+    feature_names = list(model.feature_names_in_)
+
+    if hasattr(model, 'get_booster'):
+        return _export_xgboost(model.get_booster(), feature_names)
+    if hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+        return LinearModel(feature_names, np.ravel(model.coef_), np.ravel(model.intercept_)[0])
+    raise ValueError(f'Cannot export a {type(model).__name__}')
+
+
+def _export_xgboost(booster, feature_names: List[str]) -> TreeEnsembleModel:
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    assert objective == 'reg:squarederror', f'Cannot export an XGBoost model with objective {objective}'
+    gradient_booster = learner['gradient_booster']
+    assert gradient_booster['name'] == 'gbtree', f"Cannot export an XGBoost {gradient_booster['name']} model"
+    # a list with one value since XGBoost 3
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+
+    # the nodes of all the trees, one after the other
+    trees = gradient_booster['model']['trees']
+    assert not any(tree['categories'] for tree in trees), 'Cannot export an XGBoost model with categorical splits'
+    roots = np.cumsum([0] + [len(tree['left_children']) for tree in trees[:-1]])
+
+    def concat(key: str, dtype) -> np.ndarray:
+        return np.concatenate([np.asarray(tree[key], dtype=dtype) for tree in trees])
+
+    def concat_children(key: str) -> np.ndarray:
+        return np.concatenate([
+            np.where(np.asarray(tree[key]) == -1, -1, np.asarray(tree[key]) + root)
+            for tree, root in zip(trees, roots)
+        ])
+
+    left = concat_children('left_children')
+    right = concat_children('right_children')
+    is_leaf = left == -1
+    # a leaf keeps its value in split_conditions
+    split_conditions = concat('split_conditions', np.float32)
+
+    return TreeEnsembleModel(
+        feature_names,
+        base_score=base_score,
+        roots=roots,
+        feature=np.where(is_leaf, -1, concat('split_indices', np.int64)),
+        threshold=np.where(is_leaf, 0, split_conditions),
+        left=left,
+        right=right,
+        missing=np.where(concat('default_left', bool), left, right),
+        value=np.where(is_leaf, split_conditions, 0),
+    )
+
+
+def save_inference_model(model: InferenceModel, path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump({'format': model.format, 'feature_names': model.feature_names, **model.to_dict()}, f)
+
+
+def load_inference_model(path: str) -> InferenceModel:
+    with open(path) as f:
+        data = json.load(f)
+    return INFERENCE_MODELS[data.pop('format')](**data)
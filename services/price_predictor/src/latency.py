@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict
+
+import numpy as np
+
+
+class StageLatency:
+    """
+    Latency of every stage of a prediction, e.g. read, interpolate, featurize
+    and infer, over the last `window` predictions, for the metrics endpoint.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._durations: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            if stage not in self._durations:
+                self._durations[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+            self._durations[stage].append(seconds)
+            self._counts[stage] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the count and the mean, p50, p95 and p99 latency in ms of
+        every stage.
+        """
+        with self._lock:
+            durations = {stage: np.array(values) * 1000 for stage, values in self._durations.items()}
+            counts = dict(self._counts)
+
+        return {
+            stage: {
+                'count': counts[stage],
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(np.percentile(values, 50)),
+                'p95_ms': float(np.percentile(values, 95)),
+                'p99_ms': float(np.percentile(values, 99)),
+            }
+            for stage, values in durations.items()
+        }
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional
+
+from loguru import logger
+
+from src.inference_model import INFERENCE_MODEL_SUFFIX
+
+# parameters of the training experiment the predictor is built from
+MODEL_PARAMETERS = [
+    'ohlc_window_sec',
+    'feature_view_name',
+    'feature_view_version',
+    'feature_group_name',
+    'feature_group_version',
+    'last_n_minutes',
+    'prediction_window_sec',
+    'last_n_days_to_fetch_from_store',
+    'last_n_days_to_test_model',
+]
+
+
+class ModelArtifact(NamedTuple):
+    model_path: str
+    # model name and version, sha256 of the model file and MODEL_PARAMETERS
+    metadata: Dict
+
+
+def version_key(version: str) -> tuple:
+    """
+    Sorts versions like '1.10.0' after '1.9.0'.
+    """
+    return tuple(int(part) if part.isdigit() else part for part in version.split('.'))
+
+
+class ModelCache:
+    """
+    Models downloaded from the registry, stored on disk by the sha256 of their
+    file, so every version is downloaded once and the same file is never kept
+    twice:
+
+    - `{cache_dir}/objects/{sha256}/model.inference.json`, or `model.pkl`
+      for a version logged without its inference format, a model file
+    - `{cache_dir}/versions/{model_name}/{version}.json`, the metadata of a
+      version: its sha256 and the parameters of its experiment, so a cached
+      version loads without contacting the registry
+    - `{cache_dir}/versions/{model_name}/production.json`, the last production
+      version seen, to start from when the registry is unreachable
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+
+    def _version_path(self, model_name: str, version: str) -> Path:
+        return self.cache_dir / 'versions' / model_name / f'{version}.json'
+
+    def get(self, model_name: str, version: str) -> Optional[ModelArtifact]:
+        version_path = self._version_path(model_name, version)
+        if not version_path.exists():
+            return None
+        metadata = json.loads(version_path.read_text())
+        model_path = self.cache_dir / 'objects' / metadata['sha256'] / metadata.get('model_file', 'model.pkl')
+        if not model_path.exists():
+            return None
+        return ModelArtifact(str(model_path), metadata)
+
+    def get_production_version(self, model_name: str) -> Optional[str]:
+        production_path = self._version_path(model_name, 'production')
+        if not production_path.exists():
+            return None
+        return json.loads(production_path.read_text())['version']
+
+    def set_production_version(self, model_name: str, version: str) -> None:
+        _write_json(self._version_path(model_name, 'production'), {'version': version})
+
+    def put(self, model_name: str, version: str, model_file: str, metadata: Dict) -> ModelArtifact:
+        """
+        Moves `model_file` into the cache, with `metadata`.
+        """
+        with open(model_file, 'rb') as f:
+            sha256 = hashlib.file_digest(f, 'sha256').hexdigest()
+        model_file_name = 'model.inference.json' if model_file.endswith(INFERENCE_MODEL_SUFFIX) else 'model.pkl'
+        metadata = {
+            **metadata, 'model_name': model_name, 'version': version, 'sha256': sha256, 'model_file': model_file_name,
+        }
+
+        model_path = self.cache_dir / 'objects' / sha256 / model_file_name
+        model_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(model_file, model_path)
+        # the version last, so a cached version always has its model file
+        _write_json(self._version_path(model_name, version), metadata)
+
+        return ModelArtifact(str(model_path), metadata)
+
+
+def _write_json(path: Path, data: Dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(data))
+    # readers never see a file half written
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """
+    Fetches models from the Comet model registry through a `ModelCache`.
+    """
+
+    def __init__(self, api_key: str, workspace: str, cache: ModelCache):
+        self.api_key = api_key
+        self.workspace = workspace
+        self.cache = cache
+        self._api = None
+
+    def _get_model(self, model_name: str):
+        if self._api is None:
+            from comet_ml import API
+            self._api = API(api_key=self.api_key)
+        return self._api.get_model(workspace=self.workspace, model_name=model_name)
+
+    def get_production_version(self, model_name: str) -> str:
+        versions = self._get_model(model_name).find_versions(status='production')
+        assert versions, f'No production version of {model_name}'
+        version = max(versions, key=version_key)
+        self.cache.set_production_version(model_name, version)
+        return version
+
+    def download(self, model_name: str, version: str) -> ModelArtifact:
+        """
+        Downloads a version and the parameters of its experiment, with one
+        call for all of them, into the cache.
+        """
+        model = self._get_model(model_name)
+        experiment_key = model.get_details(version=version)['experimentKey']
+        parameters = {
+            parameter['name']: parameter['valueCurrent']
+            for parameter in self._api.get_experiment_by_key(experiment_key).get_parameters_summary()
+            if parameter['name'] in MODEL_PARAMETERS
+        }
+        missing = set(MODEL_PARAMETERS) - set(parameters)
+        assert not missing, f'Experiment {experiment_key} has no parameters {sorted(missing)}'
+
+        download_dir = self.cache.cache_dir / 'downloads'
+        download_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=download_dir) as output_folder:
+            model.download(version=version, output_folder=output_folder)
+            # the inference format, if the version was logged with it
+            model_files = (
+                list(Path(output_folder).rglob(f'*{INFERENCE_MODEL_SUFFIX}'))
+                or list(Path(output_folder).rglob('*.pkl'))
+            )
+            assert len(model_files) == 1, f'Expected one model file in {model_name} {version}, got {model_files}'
+            return self.cache.put(
+                model_name,
+                version,
+                str(model_files[0]),
+                {'experiment_key': experiment_key, 'parameters': parameters},
+            )
+
+    def fetch(self, model_name: str, version: Optional[str] = None) -> ModelArtifact:
+        """
+        Returns a version of the model from the cache, downloading it if
+        needed: `version`, or else the production version.
+
+        A pinned version in the cache is returned without contacting the
+        registry. If the registry is unreachable, the last production version
+        in the cache is returned.
+        """
+        if version is not None:
+            artifact = self.cache.get(model_name, version)
+            if artifact is not None:
+                return artifact
+            return self.download(model_name, version)
+
+        try:
+            version = self.get_production_version(model_name)
+        except Exception as e:
+            version = self.cache.get_production_version(model_name)
+            artifact = self.cache.get(model_name, version) if version is not None else None
+            if artifact is None:
+                raise
+            logger.warning(f'Model registry unreachable ({e}), using the cached version {version} of {model_name}')
+            return artifact
+
+        return self.cache.get(model_name, version) or self.download(model_name, version)
+
+
+class ModelRefresher:
+    """
+    Checks the registry every `refresh_sec` from a background thread, and
+    calls `on_new_version` with a new production version once it is in the
+    cache, so the API swaps models without restarting.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        model_name: str,
+        version: str,
+        refresh_sec: float,
+        on_new_version: Callable[[ModelArtifact], None],
+    ):
+        self.registry = registry
+        self.model_name = model_name
+        self.version = version
+        self.refresh_sec = refresh_sec
+        self.on_new_version = on_new_version
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='model-refresher', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.refresh_sec):
+            try:
+                version = self.registry.get_production_version(self.model_name)
+                if version == self.version:
+                    continue
+                artifact = self.registry.fetch(self.model_name, version)
+                self.on_new_version(artifact)
+                self.version = version
+            except Exception as e:
+                logger.error(f'Failed to refresh the model {self.model_name}: {e}')
@@ -0,0 +1,154 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from src.candle_cache import CandleCache
+from src.predictor import PredictorOutput
+
+
+class _Entry(NamedTuple):
+    output: PredictorOutput
+    computed_at: float
+
+
+class PredictionCache:
+    """
+    The last prediction of every product, keyed by the timestamp of the candle
+    it was made from.
+
+    A prediction only changes when a new candle closes, so it is served until
+    a newer candle exists: the last candle of the `CandleCache` when there is
+    one, else the last window closed by the clock. Until that candle reaches
+    the feature store, a prediction is recomputed at most every `retry_sec`.
+    """
+
+    def __init__(self, ohlc_window_sec: int, candle_cache: Optional[CandleCache] = None, retry_sec: float = 1.0):
+        self.window_ms = ohlc_window_sec * 1000
+        self.candle_cache = candle_cache
+        self.retry_sec = retry_sec
+        self.n_hits = 0
+        self.n_misses = 0
+
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def get_last_candle_timestamp(self, product_id: str) -> int:
+        if self.candle_cache is not None:
+            timestamp = self.candle_cache.get_last_timestamp(product_id)
+            if timestamp is not None:
+                return timestamp
+        # candles are timestamped with the end of their window
+        return int(time.time() * 1000) // self.window_ms * self.window_ms
+
+    def _is_fresh(self, product_id: str, entry: _Entry, retried_is_fresh: bool = True) -> bool:
+        return (
+            entry.output.predicted_timestamp >= self.get_last_candle_timestamp(product_id)
+            or (retried_is_fresh and time.monotonic() - entry.computed_at < self.retry_sec)
+        )
+
+    def get(self, product_id: str) -> Optional[PredictorOutput]:
+        """
+        Returns the prediction of `product_id`, or None if there is none for
+        its last candle.
+        """
+        with self._lock:
+            entry = self._entries.get(product_id)
+        if entry is not None and self._is_fresh(product_id, entry):
+            self.n_hits += 1
+            return entry.output
+        self.n_misses += 1
+        return None
+
+    def put(self, outputs: Iterable[PredictorOutput]) -> None:
+        computed_at = time.monotonic()
+        with self._lock:
+            for output in outputs:
+                self._entries[output.product_id] = _Entry(output, computed_at)
+
+    def clear(self) -> None:
+        """
+        Drops every prediction, e.g. after the model changed.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def get_stale_product_ids(self, product_ids: Iterable[str] = (), include_retried: bool = False) -> Tuple[str, ...]:
+        """
+        Returns the products of `product_ids` and of the cache whose
+        prediction is missing, or older than their last candle and not
+        recomputed in the last `retry_sec`, or even if it was with
+        `include_retried`.
+        """
+        with self._lock:
+            entries = dict(self._entries)
+        return tuple(
+            product_id
+            for product_id in dict.fromkeys([*product_ids, *entries])
+            if product_id not in entries
+            or not self._is_fresh(product_id, entries[product_id], retried_is_fresh=not include_retried)
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {'n_hits': self.n_hits, 'n_misses': self.n_misses, 'n_products': len(self._entries)}
+
+
+class PredictionRefresher:
+    """
+    Recomputes the stale predictions of a `PredictionCache` from a background
+    thread, so requests find them in memory.
+
+    It wakes up `delay_sec` after every window closes, which leaves time for
+    the new candles to reach the feature store, and as soon as the candle
+    cache, if any, gets a new candle. While predictions stay stale it retries
+    every `retry_sec` of the cache.
+    """
+
+    def __init__(
+        self,
+        cache: PredictionCache,
+        predict_batch: Callable[[Tuple[str, ...]], List[PredictorOutput]],
+        product_ids: Tuple[str, ...],
+        delay_sec: float,
+    ):
+        self.cache = cache
+        self.predict_batch = predict_batch
+        self.product_ids = product_ids
+        self.delay_sec = delay_sec
+        self.n_refreshes = 0
+
+        self._wake_up = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='prediction-refresher', daemon=True)
+        if cache.candle_cache is not None:
+            cache.candle_cache.add_listener(lambda product_id, timestamp: self._wake_up.set())
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake_up.set()
+        self._thread.join()
+
+    def _seconds_until_next_window(self) -> float:
+        window_sec = self.cache.window_ms / 1000
+        return window_sec - (time.time() - self.delay_sec) % window_sec
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            timeout = self._seconds_until_next_window()
+            stale_product_ids = self.cache.get_stale_product_ids(self.product_ids)
+            if stale_product_ids:
+                try:
+                    self.cache.put(self.predict_batch(stale_product_ids))
+                    self.n_refreshes += 1
+                except Exception as e:
+                    logger.error(f'Failed to refresh the predictions of {stale_product_ids}: {e}')
+            # the new candles may not be in the feature store yet
+            if self.cache.get_stale_product_ids(self.product_ids, include_retried=True):
+                timeout = min(timeout, self.cache.retry_sec)
+
+            self._wake_up.wait(timeout)
+            self._wake_up.clear()
@@ -1,9 +1,39 @@
 import pickle
 from pydantic import BaseModel
 from tools2.ohlc_data_reader import OhlcDataReader
+from src.candle_cache import CandleCache, CandleFeed
+from src.latency import StageLatency
 from src.config import config
 from loguru import logger
-from comet_ml import Model
+from src.inference_model import INFERENCE_MODEL_SUFFIX, InferenceModel, export_model, load_inference_model
+from src.model_registry import ModelArtifact, ModelCache, ModelRegistry
+import numpy as np
+import pandas as pd
+import time
+from itertools import compress
+from typing import List, Optional, Tuple
+
+# timeperiod of the indicators of `add_features`, as in training
+TIMEPERIOD = 14
+# RSI and MOM need `TIMEPERIOD` + 1 candles for a value, STDDEV `TIMEPERIOD`
+MIN_CANDLES = TIMEPERIOD + 1
+
+def load_model(model_path: str) -> InferenceModel:
+    """
+    Loads a model exported by training to the inference format, or else a
+    pickled one, which is exported on load.
+    """
+    if model_path.endswith(INFERENCE_MODEL_SUFFIX):
+        return load_inference_model(model_path)
+    with open(model_path, 'rb') as f:
+        return export_model(pickle.load(f))
+
+def get_model_registry() -> ModelRegistry:
+    return ModelRegistry(
+        api_key=config.comet_api_key,
+        workspace=config.comet_workspace,
+        cache=ModelCache(config.model_cache_dir),
+    )
 
 class PredictorOutput(BaseModel):
     prediction: float
@@ -21,111 +51,238 @@ class PredictorOutput(BaseModel):
 
 
 class Predictor:
-    def __init__(self, model_path: str, ohlc_window_sec: int, feature_view_name: str, feature_view_version: int, feature_group_name: str, feature_group_version: int, last_n_minutes: int, prediction_window_sec: int, last_n_days_to_fetch_from_store: int, last_n_days_to_test_model: int):
+    def __init__(self, model_path: str, ohlc_window_sec: int, feature_view_name: str, feature_view_version: int, feature_group_name: str, feature_group_version: int, last_n_minutes: int, prediction_window_sec: int, last_n_days_to_fetch_from_store: int, last_n_days_to_test_model: int, started_at: Optional[float] = None):
+        # when the predictor started to load, for the time to first prediction
+        self.started_at = started_at if started_at is not None else time.perf_counter()
         self.model_path = model_path
+        self.ohlc_window_sec = int(ohlc_window_sec)
+        self.last_n_minutes = int(last_n_minutes)
+        self.prediction_window_sec = int(prediction_window_sec)
+        # the candles read per product: `last_n_minutes`, but never fewer than
+        # the indicators need, plus the last window, whose candle may not be
+        # published yet
+        self.n_candles = max(self.last_n_minutes * 60 // self.ohlc_window_sec, MIN_CANDLES + 1)
         self.ohlc_data_reader = OhlcDataReader(
-            ohlc_window_sec=config.ohlc_window_sec,
-            feature_view_name=config.feature_view_name,
-            feature_view_version=config.feature_view_version,
-            feature_group_name=config.feature_group_name,
-            feature_group_version=config.feature_group_version,
-            last_n_minutes=config.last_n_minutes,
+            ohlc_window_sec=self.ohlc_window_sec,
+            feature_view_name=feature_view_name,
+            feature_view_version=int(feature_view_version),
+            feature_group_name=feature_group_name,
+            feature_group_version=int(feature_group_version),
+            last_n_minutes=self.last_n_minutes,
+        )
+        self.model = load_model(model_path)
+        # model name, version and sha256 when loaded from the registry
+        self.metadata = {}
+        self.candle_cache = None
+        self.candle_feed = None
+        # latency of the read, interpolate, featurize and infer stages
+        self.latency = StageLatency()
+        self.first_prediction_sec = None
+
+    def enable_candle_cache(self, kafka_broker_address: str, kafka_topic: str) -> None:
+        """
+        Keeps the last `n_candles` candles in memory, fed from the OHLC topic,
+        so `predict` does not read the feature store. The cache is hydrated
+        from the online store first.
+        """
+        self.candle_cache = CandleCache(
+            capacity=self.n_candles, timeperiod=TIMEPERIOD, ohlc_window_sec=self.ohlc_window_sec
+        )
+        self.candle_cache.hydrate(self._read_online_store((config.product_id,)))
+
+        self.candle_feed = CandleFeed(
+            cache=self.candle_cache,
+            kafka_broker_address=kafka_broker_address,
+            kafka_topic=kafka_topic,
+            lookback_ms=self.n_candles * self.ohlc_window_sec * 1000,
         )
-        self.model = self._load_model_pickle()
+        self.candle_feed.start()
+
+    def _read_candles(self):
+        if self.candle_cache is not None:
+            ohlc_data = self.candle_cache.get_candles(config.product_id)
+            if not ohlc_data.empty:
+                return ohlc_data
+            logger.warning(f"No cached candles for {config.product_id}, reading the online store")
+        return self._read_online_store((config.product_id,))
+
+    def _read_online_store(self, product_ids: Tuple[str, ...]) -> pd.DataFrame:
+        return self.ohlc_data_reader.read_from_online_store(product_ids, n_candles=self.n_candles)
 
     @classmethod
-    def from_model_registry(cls, model_name: str) -> 'Predictor':
-        from comet_ml import API
-        api = API(api_key=config.comet_api_key)
-        model = api.get_model(workspace=config.comet_workspace, model_name=model_name)
-        model_versions = model.find_versions(status='production')
-        model_versions = sorted(model_versions, reverse=True)
-        model_version = model_versions[0]
-
-        model.download(version=model_version, output_folder='./')
-        model_path = "./lasso_model.pkl"
-
-        # Step 2: fetch metadata
-        experiment_key = model.get_details(version=model_version)['experimentKey']
-
-        experiment = api.get_experiment_by_key(experiment_key=experiment_key)
-        # get parameters from the experiment
-        ohlc_window_sec = experiment.get_parameters_summary('ohlc_window_sec')['valueCurrent']
-        feature_view_name = experiment.get_parameters_summary('feature_view_name')['valueCurrent']
-        feature_view_version = experiment.get_parameters_summary('feature_view_version')['valueCurrent']
-        feature_group_name = experiment.get_parameters_summary('feature_group_name')['valueCurrent']
-        feature_group_version = experiment.get_parameters_summary('feature_group_version')['valueCurrent']
-        last_n_minutes = experiment.get_parameters_summary('last_n_minutes')['valueCurrent']
-        prediction_window_sec = experiment.get_parameters_summary('prediction_window_sec')['valueCurrent']
-        last_n_days_to_fetch_from_store = experiment.get_parameters_summary('last_n_days_to_fetch_from_store')['valueCurrent']
-        last_n_days_to_test_model = experiment.get_parameters_summary('last_n_days_to_test_model')['valueCurrent']
-
-        return cls(
-            model_path=model_path, 
-            ohlc_window_sec=ohlc_window_sec, 
-            feature_view_name=feature_view_name, 
-            feature_view_version=feature_view_version, 
-            feature_group_name=feature_group_name, 
-            feature_group_version=feature_group_version, 
-            last_n_minutes=last_n_minutes, 
-            prediction_window_sec=prediction_window_sec, 
-            last_n_days_to_fetch_from_store=last_n_days_to_fetch_from_store, 
-            last_n_days_to_test_model=last_n_days_to_test_model
+    def from_model_registry(cls, model_name: str, version: Optional[str] = None) -> 'Predictor':
+        """
+        Loads `version` of the model, or the production version, from the
+        local model cache, downloading it from the registry if needed.
+        """
+        started_at = time.perf_counter()
+        artifact = get_model_registry().fetch(model_name, version)
+        predictor = cls.from_artifact(artifact, started_at=started_at)
+        logger.info(
+            f"Loaded {model_name} {artifact.metadata['version']} ({artifact.metadata['sha256'][:12]}) "
+            f"in {time.perf_counter() - started_at:.2f}s"
         )
+        return predictor
+
+    @classmethod
+    def from_artifact(cls, artifact: ModelArtifact, started_at: Optional[float] = None) -> 'Predictor':
+        predictor = cls(model_path=artifact.model_path, started_at=started_at, **artifact.metadata['parameters'])
+        predictor.metadata = artifact.metadata
+        return predictor
+
+    def swap_model(self, artifact: ModelArtifact) -> None:
+        """
+        Replaces the model with another version trained on the same features,
+        while predictions keep being served.
+        """
+        parameters = artifact.metadata['parameters']
+        for name in ['ohlc_window_sec', 'last_n_minutes', 'prediction_window_sec']:
+            if int(parameters[name]) != getattr(self, name):
+                raise ValueError(
+                    f"{artifact.metadata['version']} has {name}={parameters[name]}, "
+                    f"the predictor {getattr(self, name)}, restart the API to load it"
+                )
+        reader = self.ohlc_data_reader
+        for name in ['feature_view_name', 'feature_view_version', 'feature_group_name', 'feature_group_version']:
+            if str(parameters[name]) != str(getattr(reader, name)):
+                raise ValueError(
+                    f"{artifact.metadata['version']} reads {name}={parameters[name]}, "
+                    f"the predictor {getattr(reader, name)}, restart the API to load it"
+                )
+
+        model = load_model(artifact.model_path)
+        # a prediction uses the model it started with
+        self.model_path = artifact.model_path
+        self.model = model
+        self.metadata = artifact.metadata
+        logger.info(f"Swapped the model to {artifact.metadata['version']} ({artifact.metadata['sha256'][:12]})")
 
-    
     def predict(self) -> PredictorOutput:
-        # Step 1: Read the latest ohlc data from the online store
-        ohlc_data = self.ohlc_data_reader.read_from_online_store()
+        # a prediction uses the model it started with
+        model = self.model
+
+        # With the candle cache, the features of the last candle are updated
+        # as candles arrive, so they are not recomputed from every candle
+        if self.candle_cache is not None:
+            with self.latency.measure('read'):
+                features = self.candle_cache.get_last_features(config.product_id, model.feature_names)
+            if features is not None:
+                timestamp, row = features
+                with self.latency.measure('infer'):
+                    prediction = model.predict(row[None, :])[0]
+                return self._to_output(prediction, config.product_id, timestamp)
+
+        # Step 1: Read the latest ohlc data from the candle cache or the online store
+        with self.latency.measure('read'):
+            ohlc_data = self._read_candles()
 
         # Step 2: Preprocess data
         from src.training import interpolate_missing_candles
-        ohlc_data = interpolate_missing_candles(ohlc_data)
+        with self.latency.measure('interpolate'):
+            ohlc_data = interpolate_missing_candles(ohlc_data, self.ohlc_window_sec)
 
         # Step 3: add features
         from src.feature_engineering import add_features
-        ohlc_data = add_features(
-            data=ohlc_data,
-            timeperiod=14,
-            n_candles_into_future=config.prediction_window_sec // config.ohlc_window_sec,
-        )
+        with self.latency.measure('featurize'):
+            ohlc_data = add_features(
+                data=ohlc_data,
+                timeperiod=TIMEPERIOD,
+                n_candles_into_future=self.prediction_window_sec // self.ohlc_window_sec,
+            )
 
-        # Step 4: Extract metadata before selecting numeric columns
+        # Step 4: Extract metadata before selecting the feature columns
         # Get the last row's metadata for the prediction output
         last_row = ohlc_data.iloc[-1]
         product_id = str(last_row['product_id'])
         predicted_timestamp = int(last_row['timestamp'])
-        predicted_timestamp_str = last_row['datetime'].strftime('%Y-%m-%d %H:%M:%S') if 'datetime' in last_row else str(predicted_timestamp)
 
-        # Step 5: Select only numeric columns (same as training)
-        ohlc_data_numeric = ohlc_data.select_dtypes(include=['number'])
-        
+        # Step 5: Select the feature columns, in the order of training
+        ohlc_data_numeric = ohlc_data[model.feature_names]
+
         # Step 6: Handle NaN values - use the last row for prediction
         ohlc_data_numeric = ohlc_data_numeric.ffill().bfill()
-        last_row_numeric = ohlc_data_numeric.iloc[-1:]
+        last_row_numeric = ohlc_data_numeric.iloc[-1:].to_numpy(dtype=np.float64)
 
         # Step 7: model predict
-        prediction = self.model.predict(last_row_numeric)[0]
+        with self.latency.measure('infer'):
+            prediction = model.predict(last_row_numeric)[0]
 
         # Step 8: Return PredictorOutput
+        return self._to_output(prediction, product_id, predicted_timestamp)
+
+    def predict_batch(self, product_ids: Tuple[str, ...]) -> List[PredictorOutput]:
+        """
+        Predicts the last candle of every product in `product_ids`, in that
+        order, with one read of the online store and one model call for all
+        of them. Products without a candle, or without enough candles for the
+        features, are left out.
+        """
+        model = self.model
+        # the product, the timestamp and the feature row of every last candle
+        product_ids_with_rows, timestamps, rows = [], [], []
+        to_read = product_ids
+        if self.candle_cache is not None:
+            with self.latency.measure('read'):
+                cached = {
+                    product_id: self.candle_cache.get_last_features(product_id, model.feature_names)
+                    for product_id in product_ids
+                }
+            for product_id, features in cached.items():
+                if features is not None:
+                    product_ids_with_rows.append(product_id)
+                    timestamps.append(features[0])
+                    rows.append(features[1][None, :])
+            to_read = tuple(product_id for product_id, features in cached.items() if features is None)
+
+        if to_read:
+            with self.latency.measure('read'):
+                ohlc_data = self._read_online_store(to_read)
+            if not ohlc_data.empty:
+                from src.feature_engineering import add_last_candle_features
+                with self.latency.measure('featurize'):
+                    features = add_last_candle_features(ohlc_data, TIMEPERIOD, self.ohlc_window_sec)
+                    product_ids_with_rows.extend(features['product_id'].tolist())
+                    timestamps.extend(features['timestamp'].tolist())
+                    rows.append(features[model.feature_names].to_numpy(dtype=np.float64))
+
+        if not rows:
+            return []
+        X = np.concatenate(rows)
+        # products without enough candles for the features
+        has_features = ~np.isnan(X).any(axis=1)
+        if not has_features.any():
+            return []
+
+        # one model call for all the products
+        with self.latency.measure('infer'):
+            predictions = model.predict(X[has_features])
+
+        outputs = {
+            product_id: self._to_output(prediction, product_id, timestamp)
+            for product_id, timestamp, prediction in zip(
+                compress(product_ids_with_rows, has_features), compress(timestamps, has_features), predictions
+            )
+        }
+        return [outputs[product_id] for product_id in product_ids if product_id in outputs]
+
+    def _to_output(self, prediction: float, product_id: str, predicted_timestamp: int) -> PredictorOutput:
+        if self.first_prediction_sec is None:
+            self.first_prediction_sec = time.perf_counter() - self.started_at
+            logger.info(f"First prediction {self.first_prediction_sec:.2f}s after the predictor started to load")
+        predicted_timestamp = int(predicted_timestamp)
         return PredictorOutput(
             prediction=float(prediction),
             product_id=product_id,
             predicted_timestamp=predicted_timestamp,
-            predicted_timestamp_str=predicted_timestamp_str,
+            predicted_timestamp_str=pd.to_datetime(predicted_timestamp, unit='ms').strftime('%Y-%m-%d %H:%M:%S'),
         )
 
-    def _load_model_pickle(self):
-        with open(self.model_path, 'rb') as f:
-            model = pickle.load(f)
-            return model
-
 if __name__ == "__main__":
     # predictor = Predictor(model_path='./lasso_model.pkl')
     # prediction = predictor.predict()
     # logger.info(f"Prediction: {prediction}")
 
-    predictor = Predictor.from_model_registry(model_name='btc_usd_price_predictor_lasso')
+    predictor = Predictor.from_model_registry(model_name=config.model_name, version=config.model_version)
     prediction = predictor.predict()
     logger.info(f"Prediction: {prediction}")
         
\ No newline at end of file
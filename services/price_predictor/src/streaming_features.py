@@ -0,0 +1,195 @@
+import math
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# `TA_IS_ZERO_OR_NEG` of talib
+TALIB_MIN_VARIANCE = 1e-8
+
+
+class WilderRSI:
+    """
+    RSI updated one close at a time, as `talib.RSI` computes it: the first
+    average gain and loss are the means of the first `period` changes, the
+    next ones are smoothed with Wilder's method.
+
+    `undo` reverts the last update, like every indicator here.
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self._previous_close = None
+        self._n_changes = 0
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+
+    def update(self, close: float) -> float:
+        self._undo_state = (self._previous_close, self._n_changes, self._avg_gain, self._avg_loss)
+        if self._previous_close is None:
+            self._previous_close = close
+            return math.nan
+
+        change = close - self._previous_close
+        self._previous_close = close
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        self._n_changes += 1
+
+        if self._n_changes < self.period:
+            # sums until the first average
+            self._avg_gain += gain
+            self._avg_loss += loss
+            return math.nan
+        if self._n_changes == self.period:
+            self._avg_gain = (self._avg_gain + gain) / self.period
+            self._avg_loss = (self._avg_loss + loss) / self.period
+        else:
+            self._avg_gain = (self._avg_gain * (self.period - 1) + gain) / self.period
+            self._avg_loss = (self._avg_loss * (self.period - 1) + loss) / self.period
+
+        total = self._avg_gain + self._avg_loss
+        return 100 * self._avg_gain / total if total > 1e-14 else 0.0
+
+    def undo(self) -> None:
+        self._previous_close, self._n_changes, self._avg_gain, self._avg_loss = self._undo_state
+
+
+class Momentum:
+    """
+    Change of the close over the last `period` candles, as `talib.MOM`.
+    """
+
+    def __init__(self, period: int):
+        self._closes = deque(maxlen=period + 1)
+
+    def update(self, close: float) -> float:
+        # the close that drops out of the window, if any
+        self._dropped = self._closes[0] if len(self._closes) == self._closes.maxlen else None
+        self._closes.append(close)
+        if len(self._closes) < self._closes.maxlen:
+            return math.nan
+        return close - self._closes[0]
+
+    def undo(self) -> None:
+        self._closes.pop()
+        if self._dropped is not None:
+            self._closes.appendleft(self._dropped)
+
+
+class RollingStd:
+    """
+    Population standard deviation of the last `period` closes, as
+    `talib.STDDEV`, with Welford's update for a sliding window.
+
+    At prices around 1e5, the rounding errors of the sliding update add up to
+    about 1e-4 after a few thousand candles, so the mean and the sum of
+    squares are recomputed from the window every `period` updates, which is
+    still O(1) per update on average.
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self._closes = deque(maxlen=period)
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._n_sliding_updates = 0
+
+    def update(self, close: float) -> float:
+        self._undo_state = (
+            self._closes[0] if len(self._closes) == self.period else None,
+            self._mean,
+            self._m2,
+            self._n_sliding_updates,
+        )
+        if len(self._closes) < self.period:
+            self._closes.append(close)
+            delta = close - self._mean
+            self._mean += delta / len(self._closes)
+            self._m2 += delta * (close - self._mean)
+        else:
+            oldest = self._closes[0]
+            self._closes.append(close)
+            self._n_sliding_updates += 1
+            if self._n_sliding_updates == self.period:
+                self._n_sliding_updates = 0
+                self._mean = sum(self._closes) / self.period
+                self._m2 = sum((c - self._mean) ** 2 for c in self._closes)
+            else:
+                mean = self._mean + (close - oldest) / self.period
+                self._m2 += (close - oldest) * (close - mean + oldest - self._mean)
+                self._mean = mean
+
+        if len(self._closes) < self.period:
+            return math.nan
+        variance = self._m2 / self.period
+        # talib rounds variances below 1e-8 down to 0
+        if variance < TALIB_MIN_VARIANCE:
+            return 0.0
+        return math.sqrt(variance)
+
+    def undo(self) -> None:
+        dropped, self._mean, self._m2, self._n_sliding_updates = self._undo_state
+        self._closes.pop()
+        if dropped is not None:
+            self._closes.appendleft(dropped)
+
+
+class StreamingFeatures:
+    """
+    The features `add_features` adds to a candle, updated one candle at a
+    time, for one product.
+
+    Windows skipped between two candles are filled with a flat candle at the
+    previous close, as `interpolate_missing_candles` does. A candle with the
+    timestamp of the last one replaces it: the last update of the indicators
+    is undone and redone with its close. An older candle, e.g. replayed from
+    Kafka, is ignored.
+    """
+
+    def __init__(self, timeperiod: int, ohlc_window_sec: int):
+        self.window_ms = ohlc_window_sec * 1000
+        self._rsi = WilderRSI(timeperiod)
+        self._momentum = Momentum(timeperiod)
+        self._volatility = RollingStd(timeperiod)
+
+        self.last_timestamp: Optional[int] = None
+        self._last_close: Optional[float] = None
+        self.features: Optional[Dict[str, float]] = None
+
+    def update(self, timestamp: int, close: float) -> Optional[Dict[str, float]]:
+        """
+        Adds a candle and returns its features.
+        """
+        if self.last_timestamp is not None:
+            if timestamp < self.last_timestamp:
+                return self.features
+            if timestamp == self.last_timestamp:
+                if close == self._last_close:
+                    return self.features
+                for indicator in (self._rsi, self._momentum, self._volatility):
+                    indicator.undo()
+            else:
+                for _ in range((timestamp - self.last_timestamp) // self.window_ms - 1):
+                    self._update_indicators(self._last_close)
+
+        rsi, momentum, volatility = self._update_indicators(close)
+        self.last_timestamp = timestamp
+        self._last_close = close
+
+        candle_datetime = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+        self.features = {
+            'rsi': rsi,
+            'momentum': momentum,
+            'volatility': volatility,
+            'day_of_week': candle_datetime.weekday(),
+            'hour_of_day': candle_datetime.hour,
+            'minute_of_hour': candle_datetime.minute,
+        }
+        return self.features
+
+    def _update_indicators(self, close: float):
+        return (
+            self._rsi.update(close),
+            self._momentum.update(close),
+            self._volatility.update(close),
+        )
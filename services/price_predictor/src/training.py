@@ -1,11 +1,13 @@
 from tools2.ohlc_data_reader import OhlcDataReader
 from src.config import config
+import numpy as np
 import pandas as pd
 from loguru import logger
 from typing import Tuple
 from src.baseline_model import BaselineModel
 from src.model_factory import fit_lasso_regressor, fit_xgboost_regressor
-from src.feature_engineering import add_features
+from src.feature_engineering import FEATURE_COLUMNS, add_features
+from src.inference_model import INFERENCE_MODEL_SUFFIX, export_model, save_inference_model
 import comet_ml
 import matplotlib.pyplot as plt
 
@@ -37,18 +39,21 @@ def create_target_metric(
     ohlc_window_sec:int,
     prediction_window_sec:int,
 ) -> pd.DataFrame:
-
+    """
+    Returns the candles that have a target, the change of the close
+    `prediction_window_sec` later, in a new frame. `data` is not modified.
+    """
     assert prediction_window_sec % ohlc_window_sec == 0, "Prediction window must be a multiple of the OHLC window"
 
     n_candles_into_future = prediction_window_sec // ohlc_window_sec
 
-    data['close_pct_change'] = data['close'].pct_change(n_candles_into_future)
-    data['target_metric'] = data['close_pct_change'].shift(-n_candles_into_future)
-    data.drop(columns=['close_pct_change'], inplace=True)
-
-    data.dropna(subset=['target_metric'],inplace=True)
+    close = data['close'].to_numpy(dtype=np.float64)
+    target_metric = np.full(len(close), np.nan)
+    if len(close) > n_candles_into_future:
+        target_metric[:-n_candles_into_future] = close[n_candles_into_future:] / close[:-n_candles_into_future] - 1
 
-    return data
+    has_target = ~np.isnan(target_metric)
+    return data[has_target].assign(target_metric=target_metric[has_target])
 
 def train(
     feature_view_name:str,
@@ -101,14 +106,14 @@ def train(
     experiment.log_metric("n_rows_test", ohlc_test.shape[0])
 
     # Step 3: missing candles populated
-    n_missing_rows_train = ohlc_train['close'].isna().sum()
-    n_missing_rows_test = ohlc_test['close'].isna().sum()
+    n_missing_rows_train = count_missing_candles(ohlc_train, ohlc_window_sec)
+    n_missing_rows_test = count_missing_candles(ohlc_test, ohlc_window_sec)
     experiment.log_metric("n_missing_rows_train", n_missing_rows_train)
     experiment.log_metric("n_missing_rows_test", n_missing_rows_test)
     logger.info(f"Interpolating missing candles for train data")
-    ohlc_train = interpolate_missing_candles(ohlc_train)
+    ohlc_train = interpolate_missing_candles(ohlc_train, ohlc_window_sec)
     logger.info(f"Interpolating missing candles for test data")
-    ohlc_test = interpolate_missing_candles(ohlc_test)
+    ohlc_test = interpolate_missing_candles(ohlc_test, ohlc_window_sec)
 
 
     # Step 4: create the target metric
@@ -166,9 +171,9 @@ def train(
     X_train = add_features(X_train, timeperiod=14, n_candles_into_future=prediction_window_sec // ohlc_window_sec)
     X_test = add_features(X_test, timeperiod=14, n_candles_into_future=prediction_window_sec // ohlc_window_sec)
 
-    # Select only numeric columns for model training (exclude product_id, timestamp, datetime)
-    X_train = X_train.select_dtypes(include=['number'])
-    X_test = X_test.select_dtypes(include=['number'])
+    # Select the feature columns, so new candle columns are not silently used
+    X_train = X_train[FEATURE_COLUMNS]
+    X_test = X_test[FEATURE_COLUMNS]
 
     # Handle NaN values - drop rows with NaN and align y accordingly
     train_mask = ~X_train.isna().any(axis=1)
@@ -219,31 +224,81 @@ def train(
     with open('./lasso_model.pkl', 'wb') as f:
         pickle.dump(model, f)
 
+    # and in the inference format the predictor loads
+    save_inference_model(export_model(model), f'./lasso_model{INFERENCE_MODEL_SUFFIX}')
+
     experiment.log_model(name='BTC_USD_PRICE_PREDICTOR_LASSO', file_or_folder='./lasso_model.pkl')
+    experiment.log_model(name='BTC_USD_PRICE_PREDICTOR_LASSO', file_or_folder=f'./lasso_model{INFERENCE_MODEL_SUFFIX}')
 
     # if baseline_test_mae < baseline_train_mae:
     logger.info(f"Pushing model to the registry")
     experiment.register_model(model_name='BTC_USD_PRICE_PREDICTOR_LASSO')
     experiment.end()
 
-def interpolate_missing_candles(data: pd.DataFrame) -> pd.DataFrame:
-
-    data.set_index('timestamp', inplace=True)
-    from_ms = int(data.index.min())
-    to_ms = int(data.index.max())
-    labels = range(from_ms, to_ms, 60000)
-    data = data.reindex(labels)
+def count_missing_candles(data: pd.DataFrame, ohlc_window_sec: int = 60) -> int:
+    """
+    Counts the windows between the first and the last candle without a candle.
+    """
+    if data.empty:
+        return 0
+    window_ms = ohlc_window_sec * 1000
+    n_windows = (data['timestamp'].max() - data['timestamp'].min()) // window_ms + 1
+    return int(n_windows - len(data))
+
+# the columns of trade_to_ohlc candles that are 0 in a window without trades
+SYNTHETIC_ZERO_COLUMNS = ['volume', 'trade_count', 'buy_volume', 'sell_volume']
+
+def interpolate_missing_candles(data: pd.DataFrame, ohlc_window_sec: int = 60) -> pd.DataFrame:
+    """
+    Adds a flat candle at the previous close for every window without one,
+    and returns the candles in a new frame. `data` is not modified.
+
+    trade_to_ohlc emits synthetic candles for empty windows, so the series is
+    usually dense already and is returned without reindexing. The candles
+    added here are filled like those synthetic candles: no volume or trades,
+    the VWAP at the close and the trade times of the previous candle.
+    """
+    window_ms = ohlc_window_sec * 1000
+    timestamps = data['timestamp'].to_numpy()
+    if len(timestamps) < 2 or (timestamps[1:] - timestamps[:-1] == window_ms).all():
+        data = data.reset_index(drop=True)
+        data['datetime'] = pd.to_datetime(data['timestamp'], unit='ms')
+        return data
+
+    labels = range(int(timestamps.min()), int(timestamps.max()) + window_ms, window_ms)
+    # reindexing makes a new frame, so `data` is not modified
+    dtypes = data.dtypes
+    data = data.set_index('timestamp').reindex(labels)
+    data.index.name = 'timestamp'
+    is_missing = data['close'].isna()
 
     # forward fill
-    data['close'].ffill(inplace=True)
-    data['product_id'].ffill(inplace=True)
+    data['close'] = data['close'].ffill()
+    data['product_id'] = data['product_id'].ffill()
     # take the last value
-    data['open'].fillna(data['close'], inplace=True)
-    data['high'].fillna(data['close'], inplace=True)
-    data['low'].fillna(data['close'], inplace=True)
-
-    data.reset_index(inplace=True)
+    data['open'] = data['open'].fillna(data['close'])
+    data['high'] = data['high'].fillna(data['close'])
+    data['low'] = data['low'].fillna(data['close'])
+
+    # the columns trade_to_ohlc adds, when the candles have them
+    zero_columns = [column for column in SYNTHETIC_ZERO_COLUMNS if column in data]
+    data[zero_columns] = data[zero_columns].fillna(0)
+    if 'vwap' in data:
+        data['vwap'] = data['vwap'].fillna(data['close'])
+    if 'last_trade_ms' in data:
+        previous_last_trade_ms = data['last_trade_ms'].ffill()
+        data['last_trade_ms'] = previous_last_trade_ms
+        if 'first_trade_ms' in data:
+            data['first_trade_ms'] = data['first_trade_ms'].fillna(previous_last_trade_ms)
+    if 'is_synthetic' in data:
+        data['is_synthetic'] = data['is_synthetic'].where(~is_missing, True)
+    # reindexing made the integer columns float
+    data = data.astype({
+        column: dtype for column, dtype in dtypes.items()
+        if column in data and column != 'timestamp' and not data[column].isna().any()
+    })
 
+    data = data.reset_index()
     data['datetime'] = pd.to_datetime(data['timestamp'], unit='ms')
 
     # save it as a csv
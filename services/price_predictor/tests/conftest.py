@@ -0,0 +1,17 @@
+"""
+`src.config` reads its settings from the environment when it is imported, so
+the required ones get placeholders before any test module imports it.
+"""
+import os
+
+for name, value in {
+    'FEATURE_VIEW_NAME': 'ohlc_feature_view',
+    'FEATURE_VIEW_VERSION': '1',
+    'FEATURE_GROUP_NAME': 'ohlc_feature_group',
+    'FEATURE_GROUP_VERSION': '1',
+    'LAST_N_MINUTES': '10',
+    'COMET_PROJECT_NAME': 'price-predictor-tests',
+    'COMET_API_KEY': 'unused',
+    'COMET_WORKSPACE': 'unused',
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,161 @@
+"""
+Checks the ring buffer of `CandleCache`: appends, replaced and late candles,
+and the compaction when the end of its arrays is reached. Then that the cached
+features of the last candle follow replaced candles, and are not returned
+when they are not those of the last candle.
+"""
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from src.candle_cache import CandleCache, CandleRingBuffer
+from src.feature_engineering import FEATURE_COLUMNS
+from src.streaming_features import StreamingFeatures
+
+TIMEPERIOD = 5
+WINDOW_MS = 60_000
+
+
+def assert_buffer(buffer: CandleRingBuffer, rows: Dict[int, float]) -> None:
+    assert buffer.timestamps.tolist() == list(rows)
+    assert buffer.values[:, 0].tolist() == list(rows.values())
+
+
+def test_appends_keep_the_last_capacity_candles():
+    buffer = CandleRingBuffer(capacity=3, n_columns=1)
+    for i in range(5):
+        buffer.upsert(i * WINDOW_MS, np.array([float(i)]))
+
+    assert len(buffer) == 3
+    assert_buffer(buffer, {2 * WINDOW_MS: 2.0, 3 * WINDOW_MS: 3.0, 4 * WINDOW_MS: 4.0})
+
+
+def test_a_candle_with_a_buffered_timestamp_replaces_it():
+    buffer = CandleRingBuffer(capacity=3, n_columns=1)
+    for i in range(3):
+        buffer.upsert(i * WINDOW_MS, np.array([float(i)]))
+
+    buffer.upsert(WINDOW_MS, np.array([10.0]))
+    buffer.upsert(2 * WINDOW_MS, np.array([20.0]))
+
+    assert_buffer(buffer, {0: 0.0, WINDOW_MS: 10.0, 2 * WINDOW_MS: 20.0})
+
+
+def test_a_late_candle_is_inserted_in_its_place():
+    buffer = CandleRingBuffer(capacity=4, n_columns=1)
+    for i in [0, 2, 3]:
+        buffer.upsert(i * WINDOW_MS, np.array([float(i)]))
+
+    buffer.upsert(WINDOW_MS, np.array([1.0]))
+    assert_buffer(buffer, {0: 0.0, WINDOW_MS: 1.0, 2 * WINDOW_MS: 2.0, 3 * WINDOW_MS: 3.0})
+
+    # in a full buffer, it pushes out the oldest candle
+    buffer.upsert(int(2.5 * WINDOW_MS), np.array([2.5]))
+    assert_buffer(buffer, {WINDOW_MS: 1.0, 2 * WINDOW_MS: 2.0, int(2.5 * WINDOW_MS): 2.5, 3 * WINDOW_MS: 3.0})
+
+
+def test_a_late_candle_older_than_a_full_buffer_is_dropped():
+    buffer = CandleRingBuffer(capacity=2, n_columns=1)
+    for i in [1, 2]:
+        buffer.upsert(i * WINDOW_MS, np.array([float(i)]))
+
+    buffer.upsert(0, np.array([0.0]))
+    assert_buffer(buffer, {WINDOW_MS: 1.0, 2 * WINDOW_MS: 2.0})
+
+    # but not from a buffer with room for it
+    buffer = CandleRingBuffer(capacity=3, n_columns=1)
+    for i in [1, 2]:
+        buffer.upsert(i * WINDOW_MS, np.array([float(i)]))
+    buffer.upsert(0, np.array([0.0]))
+    assert_buffer(buffer, {0: 0.0, WINDOW_MS: 1.0, 2 * WINDOW_MS: 2.0})
+
+
+@pytest.mark.parametrize('n_candles', [6, 7, 20, 101])
+def test_compaction_keeps_the_last_candles_in_order(n_candles):
+    capacity = 3
+    buffer = CandleRingBuffer(capacity=capacity, n_columns=2)
+    for i in range(n_candles):
+        buffer.upsert(i * WINDOW_MS, np.array([float(i), -float(i)]))
+        # a late candle in the middle, after every compaction
+        if i % 4 == 3:
+            buffer.upsert(int((i - 0.5) * WINDOW_MS), np.array([i - 0.5, 0.5 - i]))
+
+    expected = sorted(
+        [float(i) for i in range(n_candles)] + [i - 0.5 for i in range(n_candles) if i % 4 == 3]
+    )[-capacity:]
+    assert buffer.values[:, 0].tolist() == expected
+    assert buffer.values[:, 1].tolist() == [-value for value in expected]
+    assert buffer.timestamps.tolist() == [int(value * WINDOW_MS) for value in expected]
+
+
+def candle(i: int, close: float, product_id: str = 'BTC/USD') -> Dict:
+    return {
+        'product_id': product_id,
+        'timestamp': 1_700_000_040_000 + i * WINDOW_MS,
+        'open': close - 1,
+        'high': close + 2,
+        'low': close - 2,
+        'close': close,
+        'volume': 1.0,
+    }
+
+
+def expected_features(candles: List[Dict]) -> np.ndarray:
+    features = StreamingFeatures(TIMEPERIOD, WINDOW_MS // 1000)
+    for c in candles:
+        features.update(c['timestamp'], c['close'])
+    row = {**candles[-1], **features.features}
+    return np.array([row[name] for name in FEATURE_COLUMNS], dtype=np.float64)
+
+
+def cache_with(candles: List[Dict]) -> CandleCache:
+    cache = CandleCache(capacity=16, timeperiod=TIMEPERIOD, ohlc_window_sec=WINDOW_MS // 1000)
+    for c in candles:
+        cache.update(c)
+    return cache
+
+
+def test_last_features_follow_a_replaced_last_candle():
+    candles = [candle(i, 100.0 + (-1) ** i * i) for i in range(10)]
+    cache = cache_with(candles)
+
+    replaced = {**candles[-1], 'close': 50.0, 'low': 48.0}
+    cache.update(replaced)
+
+    timestamp, row = cache.get_last_features('BTC/USD', FEATURE_COLUMNS)
+    assert timestamp == replaced['timestamp']
+    np.testing.assert_allclose(row, expected_features(candles[:-1] + [replaced]), rtol=1e-12)
+
+    # and a replay of the same candle changes nothing
+    cache.update(replaced)
+    np.testing.assert_allclose(cache.get_last_features('BTC/USD', FEATURE_COLUMNS)[1], row, rtol=1e-12)
+
+
+def test_last_features_are_none_until_timeperiod_candles():
+    candles = [candle(i, 100.0 + i) for i in range(TIMEPERIOD + 1)]
+
+    assert cache_with(candles[:TIMEPERIOD]).get_last_features('BTC/USD', FEATURE_COLUMNS) is None
+    assert cache_with(candles).get_last_features('BTC/USD', FEATURE_COLUMNS) is not None
+    assert cache_with(candles).get_last_features('ETH/USD', FEATURE_COLUMNS) is None
+
+
+def test_last_features_are_none_when_they_are_not_those_of_the_last_candle():
+    candles = [candle(i, 100.0 + i) for i in range(10)]
+    cache = cache_with(candles)
+
+    # a candle without a close is buffered, but does not update the features
+    cache.update({**candle(10, 0.0), 'close': None})
+
+    assert cache.get_last_timestamp('BTC/USD') == candle(10, 0.0)['timestamp']
+    assert cache.get_last_features('BTC/USD', FEATURE_COLUMNS) is None
+
+
+def test_last_features_are_in_the_order_of_the_feature_names():
+    candles = [candle(i, 100.0 + i) for i in range(10)]
+    cache = cache_with(candles)
+
+    _, row = cache.get_last_features('BTC/USD', FEATURE_COLUMNS)
+    _, reversed_row = cache.get_last_features('BTC/USD', FEATURE_COLUMNS[::-1])
+
+    np.testing.assert_array_equal(reversed_row, row[::-1])
@@ -0,0 +1,70 @@
+"""
+Checks that `add_last_candle_features`, which featurizes the last candle of
+many products at once, gives every product the features the frame path gives
+its last candle: `add_features` after `interpolate_missing_candles`.
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.feature_engineering import FEATURE_COLUMNS, add_features, add_last_candle_features
+from src.training import interpolate_missing_candles
+
+TIMEPERIOD = 14
+OHLC_WINDOW_SEC = 60
+WINDOW_MS = OHLC_WINDOW_SEC * 1000
+T0 = 1_700_000_040_000
+
+
+def product_candles(product_id: str, windows: List[int], rng: np.random.Generator) -> pd.DataFrame:
+    close = 100 + rng.normal(0, 1, len(windows)).cumsum()
+    return pd.DataFrame({
+        'timestamp': T0 + WINDOW_MS * np.asarray(windows, dtype=np.int64),
+        'open': close + rng.normal(0, 0.5, len(windows)),
+        'high': close + 1,
+        'low': close - 1,
+        'close': close,
+        'product_id': product_id,
+    })
+
+
+def frame_features(candles: pd.DataFrame) -> pd.Series:
+    data = interpolate_missing_candles(candles.reset_index(drop=True), OHLC_WINDOW_SEC)
+    return add_features(data, TIMEPERIOD, 0)[FEATURE_COLUMNS].iloc[-1]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_batch_features_match_the_frame_path(seed):
+    rng = np.random.default_rng(seed)
+    windows = np.arange(60)
+    products = {
+        # a few missing windows, one of them the window before the last
+        'A/USD': np.delete(windows, [3, 17, 18, 40, 58]),
+        # starts later, with a gap longer than the timeperiod
+        'B/USD': np.delete(windows[10:], np.arange(15, 35)),
+        # ends earlier, and a random fifth of the windows missing
+        'C/USD': np.sort(rng.choice(windows[:50], 40, replace=False)),
+        # too few candles for the indicators
+        'D/USD': windows[50:58:2],
+        'E/USD': windows[-1:],
+    }
+    candles = [product_candles(product_id, product_windows, rng) for product_id, product_windows in products.items()]
+    # the products interleaved, as read from the store
+    data = pd.concat(candles).sort_values('timestamp', kind='stable', ignore_index=True)
+
+    actual = add_last_candle_features(data, TIMEPERIOD, OHLC_WINDOW_SEC)
+
+    assert actual['product_id'].tolist() == sorted(products, key=lambda p: data['product_id'].tolist().index(p))
+    assert list(actual.columns) == ['product_id', *FEATURE_COLUMNS]
+    for product_id, product_data in zip(products, candles):
+        expected = frame_features(product_data)
+        row = actual.set_index('product_id').loc[product_id, FEATURE_COLUMNS]
+        np.testing.assert_allclose(
+            row.to_numpy(dtype=float), expected.to_numpy(dtype=float), rtol=1e-9, atol=1e-9, equal_nan=True,
+            err_msg=f'{product_id} does not match the frame path',
+        )
+    # the products with enough candles have every feature
+    assert actual.set_index('product_id').loc[['A/USD', 'B/USD', 'C/USD']].notna().all(axis=None)
+    assert actual.set_index('product_id').loc[['D/USD', 'E/USD'], 'rsi'].isna().all()
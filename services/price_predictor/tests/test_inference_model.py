@@ -0,0 +1,76 @@
+"""
+Checks that models exported to the inference format predict like the fitted
+scikit-learn and XGBoost models, after a round trip through the JSON file.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Lasso
+from xgboost import XGBRegressor
+
+from src.inference_model import (
+    LinearModel,
+    TreeEnsembleModel,
+    export_model,
+    load_inference_model,
+    save_inference_model,
+)
+
+FEATURE_NAMES = ['open', 'close', 'rsi', 'momentum', 'volatility']
+
+
+def features(n_rows: int, nan_ratio: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(0, 1, (n_rows, len(FEATURE_NAMES))), columns=FEATURE_NAMES)
+    return X.mask(rng.random(X.shape) < nan_ratio)
+
+
+def target(X: pd.DataFrame, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = X.fillna(0).to_numpy()
+    return X @ np.array([0.5, -1.0, 0.0, 2.0, 0.3]) + np.sin(3 * X[:, 1]) + rng.normal(0, 0.1, len(X))
+
+
+def round_trip(model, path) -> object:
+    save_inference_model(export_model(model), str(path))
+    return load_inference_model(str(path))
+
+
+def test_lasso_predicts_like_the_fitted_model(tmp_path):
+    X = features(500)
+    model = Lasso(alpha=0.01).fit(X, target(X))
+
+    exported = round_trip(model, tmp_path / 'lasso.inference.json')
+
+    assert isinstance(exported, LinearModel)
+    assert exported.feature_names == FEATURE_NAMES
+    X_test = features(200, seed=2)
+    np.testing.assert_allclose(exported.predict(X_test.to_numpy()), model.predict(X_test), rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('base_score', [None, 0.7])
+def test_xgboost_predicts_like_the_fitted_model(tmp_path, base_score):
+    X = features(500, nan_ratio=0.1)
+    model = XGBRegressor(n_estimators=30, max_depth=4, base_score=base_score).fit(X, target(X))
+
+    exported = round_trip(model, tmp_path / 'xgboost.inference.json')
+
+    assert isinstance(exported, TreeEnsembleModel)
+    assert exported.feature_names == FEATURE_NAMES
+    # NaNs go down the default branch of every split
+    X_test = features(200, nan_ratio=0.2, seed=2)
+    # XGBoost sums the leaves in float32
+    np.testing.assert_allclose(exported.predict(X_test.to_numpy()), model.predict(X_test), rtol=1e-5, atol=1e-5)
+
+
+def test_predict_frame_picks_the_columns_by_name(tmp_path):
+    X = features(100)
+    exported = round_trip(Lasso(alpha=0.01).fit(X, target(X)), tmp_path / 'lasso.inference.json')
+
+    shuffled = X[FEATURE_NAMES[::-1]]
+    np.testing.assert_array_equal(exported.predict_frame(shuffled), exported.predict(X.to_numpy()))
+
+
+def test_models_that_cannot_be_exported_raise():
+    with pytest.raises(ValueError):
+        export_model(type('Model', (), {'feature_names_in_': np.array(FEATURE_NAMES)})())
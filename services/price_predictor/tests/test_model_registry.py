@@ -0,0 +1,187 @@
+"""
+Checks the content-addressed `ModelCache`, and that `ModelRegistry.fetch`
+serves cached versions when it does not need the registry, or cannot reach
+it. The Comet API is a fake that counts its calls.
+"""
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from src.inference_model import INFERENCE_MODEL_SUFFIX
+from src.model_registry import MODEL_PARAMETERS, ModelCache, ModelRefresher, ModelRegistry
+
+MODEL_NAME = 'btc_usd_price_predictor_lasso'
+
+
+class Unreachable(Exception):
+    pass
+
+
+class FakeCometAPI:
+    """
+    A model registry with a model file and an experiment per version.
+    """
+
+    def __init__(self, versions: Dict[str, bytes], production: List[str]):
+        self.versions = versions
+        self.production = production
+        self.reachable = True
+        self.n_calls = 0
+        self.n_downloads = 0
+
+    def _call(self) -> None:
+        self.n_calls += 1
+        if not self.reachable:
+            raise Unreachable('registry unreachable')
+
+    def get_model(self, workspace: str, model_name: str) -> 'FakeCometAPI':
+        self._call()
+        return self
+
+    def find_versions(self, status: str) -> List[str]:
+        self._call()
+        return list(self.production)
+
+    def get_details(self, version: str) -> Dict:
+        self._call()
+        return {'experimentKey': f'experiment-{version}'}
+
+    def get_experiment_by_key(self, experiment_key: str) -> 'FakeCometAPI':
+        self._call()
+        return self
+
+    def get_parameters_summary(self) -> List[Dict]:
+        self._call()
+        return [{'name': name, 'valueCurrent': '1'} for name in [*MODEL_PARAMETERS, 'learning_rate']]
+
+    def download(self, version: str, output_folder: str) -> None:
+        self._call()
+        self.n_downloads += 1
+        (Path(output_folder) / 'model').mkdir()
+        (Path(output_folder) / 'model' / f'lasso_model{INFERENCE_MODEL_SUFFIX}').write_bytes(self.versions[version])
+
+
+@pytest.fixture
+def api() -> FakeCometAPI:
+    return FakeCometAPI(
+        versions={'1.9.0': b'{"model": 1}', '1.10.0': b'{"model": 2}', '1.11.0': b'{"model": 2}'},
+        production=['1.9.0', '1.10.0'],
+    )
+
+
+def registry(api: FakeCometAPI, cache_dir: Path) -> ModelRegistry:
+    registry = ModelRegistry(api_key='key', workspace='workspace', cache=ModelCache(str(cache_dir)))
+    registry._api = api
+    return registry
+
+
+def test_put_then_get_returns_the_model_by_its_content(tmp_path):
+    cache = ModelCache(str(tmp_path / 'cache'))
+    artifacts = []
+    for version in ['1.0.0', '1.1.0']:
+        model_file = tmp_path / f'lasso_model{INFERENCE_MODEL_SUFFIX}'
+        model_file.write_bytes(b'same model')
+        artifacts.append(cache.put(MODEL_NAME, version, str(model_file), {'parameters': {'last_n_minutes': '10'}}))
+        # moved into the cache
+        assert not model_file.exists()
+
+    assert cache.get(MODEL_NAME, '1.0.0') == artifacts[0]
+    artifact = cache.get(MODEL_NAME, '1.1.0')
+    assert artifact == artifacts[1]
+    assert artifact.metadata['version'] == '1.1.0'
+    assert artifact.metadata['parameters'] == {'last_n_minutes': '10'}
+    assert Path(artifact.model_path).read_bytes() == b'same model'
+    # the same content is stored once
+    assert artifacts[0].model_path == artifacts[1].model_path
+    assert len(list((tmp_path / 'cache' / 'objects').iterdir())) == 1
+
+    assert cache.get(MODEL_NAME, '2.0.0') is None
+    # a version whose model file is gone is not cached
+    Path(artifact.model_path).unlink()
+    assert cache.get(MODEL_NAME, '1.1.0') is None
+
+
+def test_a_cached_pinned_version_is_served_without_the_registry(api, tmp_path):
+    artifact = registry(api, tmp_path).fetch(MODEL_NAME, '1.9.0')
+    assert Path(artifact.model_path).read_bytes() == b'{"model": 1}'
+    assert set(artifact.metadata['parameters']) == set(MODEL_PARAMETERS)
+
+    api.n_calls = 0
+    api.reachable = False
+    assert registry(api, tmp_path).fetch(MODEL_NAME, '1.9.0') == artifact
+    assert api.n_calls == 0
+
+
+def test_fetch_downloads_the_latest_production_version_once(api, tmp_path):
+    artifact = registry(api, tmp_path).fetch(MODEL_NAME)
+    assert artifact.metadata['version'] == '1.10.0'
+
+    assert registry(api, tmp_path).fetch(MODEL_NAME) == artifact
+    assert api.n_downloads == 1
+
+
+def test_fetch_falls_back_to_the_cached_production_version(api, tmp_path):
+    artifact = registry(api, tmp_path).fetch(MODEL_NAME)
+
+    api.reachable = False
+    assert registry(api, tmp_path).fetch(MODEL_NAME) == artifact
+
+    # with nothing cached, the error is raised
+    with pytest.raises(Unreachable):
+        registry(api, tmp_path / 'empty').fetch(MODEL_NAME)
+
+
+def wait_until(condition, timeout_sec: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout_sec
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_refresher_calls_back_only_when_the_production_version_changes(api, tmp_path):
+    model_registry = registry(api, tmp_path)
+    version = model_registry.fetch(MODEL_NAME).metadata['version']
+    swapped = []
+    refreshed = threading.Event()
+
+    class CountingRegistry:
+        def get_production_version(self, model_name: str) -> str:
+            try:
+                return model_registry.get_production_version(model_name)
+            finally:
+                refreshed.set()
+
+        def fetch(self, model_name: str, version: str):
+            return model_registry.fetch(model_name, version)
+
+    def refreshes(n: int) -> None:
+        for _ in range(n):
+            refreshed.clear()
+            assert refreshed.wait(timeout=5)
+
+    refresher = ModelRefresher(CountingRegistry(), MODEL_NAME, version, refresh_sec=0.01, on_new_version=swapped.append)
+    refresher.start()
+    try:
+        refreshes(3)
+        assert swapped == []
+
+        # an unreachable registry keeps the current version
+        api.reachable = False
+        refreshes(3)
+        assert swapped == []
+
+        api.reachable = True
+        api.production.append('1.11.0')
+        wait_until(lambda: len(swapped) == 1)
+        refreshes(3)
+    finally:
+        refresher.stop()
+
+    [artifact] = swapped
+    assert artifact.metadata['version'] == '1.11.0'
+    assert refresher.version == '1.11.0'
+    # 1.11.0 has the model of 1.10.0, stored once
+    assert artifact.model_path == model_registry.fetch(MODEL_NAME, '1.10.0').model_path
@@ -0,0 +1,210 @@
+"""
+Checks when `PredictionCache` serves a prediction: until a newer candle
+exists, then again for `retry_sec` after every recompute. And that
+`PredictionRefresher` keeps the predictions of new candles, and of a new
+model, in the cache.
+"""
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, List, Tuple
+
+import pytest
+
+import src.prediction_cache
+from src.candle_cache import CandleCache
+from src.prediction_cache import PredictionCache, PredictionRefresher
+from src.predictor import PredictorOutput
+
+WINDOW_SEC = 60
+WINDOW_MS = WINDOW_SEC * 1000
+T0 = 1_700_000_040_000
+
+
+def output(product_id: str, predicted_timestamp: int, prediction: float = 0.0) -> PredictorOutput:
+    return PredictorOutput(
+        prediction=prediction,
+        product_id=product_id,
+        predicted_timestamp=predicted_timestamp,
+        predicted_timestamp_str='',
+    )
+
+
+def candle(product_id: str, timestamp: int) -> dict:
+    return {'product_id': product_id, 'timestamp': timestamp, 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0}
+
+
+@pytest.fixture
+def clock(monkeypatch) -> SimpleNamespace:
+    """
+    The wall-clock and monotonic time of `src.prediction_cache`, in seconds.
+    """
+    clock = SimpleNamespace(now=T0 / 1000 + 10.0)
+    monkeypatch.setattr(
+        src.prediction_cache,
+        'time',
+        SimpleNamespace(time=lambda: clock.now, monotonic=lambda: clock.now),
+    )
+    return clock
+
+
+def test_a_prediction_is_served_until_a_newer_candle_exists(clock):
+    candle_cache = CandleCache(capacity=16)
+    candle_cache.update(candle('BTC/USD', T0))
+    cache = PredictionCache(WINDOW_SEC, candle_cache=candle_cache, retry_sec=1.0)
+
+    assert cache.get('BTC/USD') is None
+    cache.put([output('BTC/USD', T0)])
+    clock.now += 3 * WINDOW_SEC
+    assert cache.get('BTC/USD').predicted_timestamp == T0
+
+    candle_cache.update(candle('BTC/USD', T0 + WINDOW_MS))
+    assert cache.get('BTC/USD') is None
+    assert cache.stats() == {'n_hits': 1, 'n_misses': 2, 'n_products': 1}
+
+
+def test_a_stale_prediction_is_retried_every_retry_sec(clock):
+    candle_cache = CandleCache(capacity=16)
+    candle_cache.update(candle('BTC/USD', T0 + WINDOW_MS))
+    cache = PredictionCache(WINDOW_SEC, candle_cache=candle_cache, retry_sec=1.0)
+
+    # the new candle is not in the feature store yet, so the recompute still
+    # predicts from the previous one
+    cache.put([output('BTC/USD', T0)])
+    clock.now += 0.5
+    assert cache.get('BTC/USD').predicted_timestamp == T0
+    assert cache.get_stale_product_ids() == ()
+    assert cache.get_stale_product_ids(include_retried=True) == ('BTC/USD',)
+
+    clock.now += 0.6
+    assert cache.get('BTC/USD') is None
+    assert cache.get_stale_product_ids() == ('BTC/USD',)
+
+    cache.put([output('BTC/USD', T0 + WINDOW_MS)])
+    clock.now += 10
+    assert cache.get('BTC/USD').predicted_timestamp == T0 + WINDOW_MS
+    assert cache.get_stale_product_ids(include_retried=True) == ()
+
+
+def test_without_a_candle_cache_the_clock_closes_the_windows(clock):
+    cache = PredictionCache(WINDOW_SEC, retry_sec=1.0)
+    # the window ending at T0 is the last one closed
+    clock.now = T0 / 1000 + 30
+    cache.put([output('BTC/USD', T0)])
+
+    clock.now += 20
+    assert cache.get('BTC/USD') is not None
+    clock.now += 20
+    assert cache.get('BTC/USD') is None
+
+
+def test_stale_products_include_the_requested_ones_and_those_cached(clock):
+    candle_cache = CandleCache(capacity=16)
+    for product_id in ['BTC/USD', 'ETH/USD']:
+        candle_cache.update(candle(product_id, T0))
+    cache = PredictionCache(WINDOW_SEC, candle_cache=candle_cache, retry_sec=1.0)
+    cache.put([output('BTC/USD', T0), output('ETH/USD', T0)])
+    clock.now += 2
+
+    assert cache.get_stale_product_ids(['SOL/USD', 'BTC/USD']) == ('SOL/USD',)
+    candle_cache.update(candle('ETH/USD', T0 + WINDOW_MS))
+    assert cache.get_stale_product_ids(['SOL/USD', 'BTC/USD']) == ('SOL/USD', 'ETH/USD')
+
+    cache.clear()
+    assert cache.get_stale_product_ids(['BTC/USD']) == ('BTC/USD',)
+    assert cache.get('BTC/USD') is None
+
+
+def wait_until(condition: Callable[[], bool], timeout_sec: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout_sec
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+class StubPredictor:
+    """
+    A `predict_batch` whose feature store is `lag` candles behind the candle
+    cache, and whose predictions are the version of its model.
+    """
+
+    def __init__(self, candle_cache: CandleCache):
+        self.candle_cache = candle_cache
+        self.model_version = 1
+        self.lag = 0
+        self.calls: List[Tuple[str, ...]] = []
+        self._lock = threading.Lock()
+
+    def predict_batch(self, product_ids: Tuple[str, ...]) -> List[PredictorOutput]:
+        with self._lock:
+            self.calls.append(product_ids)
+            return [
+                output(
+                    product_id,
+                    self.candle_cache.get_last_timestamp(product_id) - self.lag * WINDOW_MS,
+                    self.model_version,
+                )
+                for product_id in product_ids
+            ]
+
+
+PRODUCT_IDS = ('BTC/USD', 'ETH/USD')
+
+
+def all_fresh(refresher: SimpleNamespace) -> bool:
+    return refresher.cache.get_stale_product_ids(PRODUCT_IDS, include_retried=True) == ()
+
+
+@pytest.fixture
+def refresher():
+    candle_cache = CandleCache(capacity=16)
+    for product_id in PRODUCT_IDS:
+        candle_cache.update(candle(product_id, T0))
+    cache = PredictionCache(WINDOW_SEC, candle_cache=candle_cache, retry_sec=0.05)
+    predictor = StubPredictor(candle_cache)
+    refresher = PredictionRefresher(cache, predictor.predict_batch, PRODUCT_IDS, delay_sec=2)
+    refresher.start()
+    yield SimpleNamespace(cache=cache, candle_cache=candle_cache, predictor=predictor, refresher=refresher)
+    refresher.stop()
+
+
+def test_refresher_predicts_new_candles_before_they_are_requested(refresher):
+    wait_until(lambda: all_fresh(refresher))
+    assert refresher.predictor.calls[0] == PRODUCT_IDS
+
+    # a new candle of one product wakes it up, and only that product is stale
+    n_calls = len(refresher.predictor.calls)
+    refresher.candle_cache.update(candle('ETH/USD', T0 + WINDOW_MS))
+    wait_until(lambda: refresher.cache.get('ETH/USD').predicted_timestamp == T0 + WINDOW_MS)
+    assert refresher.predictor.calls[n_calls:] == [('ETH/USD',)]
+
+
+def test_refresher_retries_until_the_feature_store_has_the_new_candle(refresher):
+    wait_until(lambda: all_fresh(refresher))
+
+    refresher.predictor.lag = 1
+    n_calls = len(refresher.predictor.calls)
+    refresher.candle_cache.update(candle('BTC/USD', T0 + WINDOW_MS))
+    # one call per `retry_sec`
+    wait_until(lambda: len(refresher.predictor.calls) >= n_calls + 3)
+
+    refresher.predictor.lag = 0
+    wait_until(lambda: refresher.cache.get('BTC/USD').predicted_timestamp == T0 + WINDOW_MS)
+    n_calls = len(refresher.predictor.calls)
+    time.sleep(0.2)
+    assert len(refresher.predictor.calls) == n_calls
+
+
+def test_a_cleared_cache_is_refilled_with_the_new_model(refresher):
+    wait_until(lambda: all_fresh(refresher))
+    assert refresher.cache.get('BTC/USD').prediction == 1
+
+    # what the API does on a model swap
+    refresher.predictor.model_version = 2
+    refresher.cache.clear()
+    assert refresher.cache.get('BTC/USD') is None
+
+    # the next candle wakes the refresher up, and every product is recomputed
+    refresher.candle_cache.update(candle('BTC/USD', T0 + WINDOW_MS))
+    wait_until(lambda: all_fresh(refresher))
+    assert [refresher.cache.get(product_id).prediction for product_id in PRODUCT_IDS] == [2, 2]
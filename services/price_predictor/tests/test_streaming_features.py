@@ -0,0 +1,76 @@
+"""
+Checks that `StreamingFeatures`, fed one candle at a time, returns the
+features `add_features` computes over the whole history, on the `data.csv`
+training sample interpolated like in training.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.feature_engineering import add_features
+from src.streaming_features import TALIB_MIN_VARIANCE, StreamingFeatures
+from src.training import interpolate_missing_candles
+
+DATA_PATH = Path(__file__).parent.parent / 'data.csv'
+OHLC_WINDOW_SEC = 60
+FEATURES = ['rsi', 'momentum', 'volatility', 'day_of_week', 'hour_of_day', 'minute_of_hour']
+
+# talib 0.6 computes the variance from running sums of the closes and of their
+# squares, which at prices around 1e5 is off by up to a few 1e-3
+TALIB_VOLATILITY_ATOL = 1e-2
+
+
+@pytest.fixture(scope='module')
+def candles() -> pd.DataFrame:
+    data = pd.read_csv(DATA_PATH)[['timestamp', 'open', 'high', 'low', 'close', 'product_id']]
+    return interpolate_missing_candles(data, OHLC_WINDOW_SEC)
+
+
+def streaming_features(candles: pd.DataFrame, timeperiod: int) -> pd.DataFrame:
+    features = StreamingFeatures(timeperiod, OHLC_WINDOW_SEC)
+    return pd.DataFrame([
+        features.update(timestamp, close)
+        for timestamp, close in zip(candles['timestamp'].tolist(), candles['close'].tolist())
+    ])
+
+
+@pytest.mark.parametrize('timeperiod', [14, 5])
+def test_streaming_features_match_add_features(candles, timeperiod):
+    expected = add_features(candles, timeperiod=timeperiod, n_candles_into_future=5)[FEATURES]
+    actual = streaming_features(candles, timeperiod)
+
+    for feature in FEATURES:
+        np.testing.assert_allclose(
+            actual[feature], expected[feature], rtol=1e-9,
+            atol=TALIB_VOLATILITY_ATOL if feature == 'volatility' else 1e-6, equal_nan=True,
+            err_msg=f'{feature} does not match add_features',
+        )
+    # the first candles have no indicators yet, the others all have them
+    assert actual['rsi'].isna().sum() == timeperiod
+
+
+@pytest.mark.parametrize('timeperiod', [14, 5])
+def test_streaming_volatility_matches_the_exact_one(candles, timeperiod):
+    windows = np.lib.stride_tricks.sliding_window_view(candles['close'].to_numpy(), timeperiod)
+    variance = windows.var(axis=1)
+    volatility = np.where(variance < TALIB_MIN_VARIANCE, 0.0, np.sqrt(variance))
+    expected = np.concatenate([np.full(timeperiod - 1, np.nan), volatility])
+
+    actual = streaming_features(candles, timeperiod)['volatility']
+
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-6, equal_nan=True)
+
+
+def test_a_replaced_candle_gives_the_features_of_its_close(candles):
+    expected = streaming_features(candles, 14)
+
+    # every candle first arrives with another close, then with its own
+    features = StreamingFeatures(14, OHLC_WINDOW_SEC)
+    actual = []
+    for timestamp, close in zip(candles['timestamp'].tolist(), candles['close'].tolist()):
+        features.update(timestamp, close * 1.01)
+        actual.append(features.update(timestamp, close))
+
+    pd.testing.assert_frame_equal(pd.DataFrame(actual), expected, rtol=1e-9, atol=1e-9)
@@ -0,0 +1,87 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import duckdb
+import pandas as pd
+
+
+class LocalFeatureView:
+    """
+    Reads the local feature store written by kafka_to_feature_store with
+    FEATURE_STORE_BACKEND=local, through the two methods of a Hopsworks
+    feature view we use, so it can stand in for one.
+
+    The offline store is a directory of Parquet files partitioned by day,
+    `{root_dir}/offline/{name}_{version}/date=YYYY-MM-DD/part-{ns}.parquet`,
+    queried with DuckDB. The online store is the SQLite table
+    `{name}_{version}` in `{root_dir}/online.db`.
+    """
+
+    def __init__(self, root_dir: str, feature_group_name: str, feature_group_version: int):
+        self.root_dir = Path(root_dir)
+        self.table_name = f"{feature_group_name}_{feature_group_version}"
+
+    def get_batch_data(self) -> pd.DataFrame:
+        """
+        Returns every candle of the offline store.
+        """
+        files = self.root_dir / "offline" / self.table_name / "*" / "*.parquet"
+        # a candle written again after a replay is in more than one file, keep
+        # the row of the file written last
+        return duckdb.sql(f"""
+            SELECT * EXCLUDE (date, filename)
+            FROM read_parquet('{files}', hive_partitioning = true, filename = true)
+            QUALIFY row_number() OVER (PARTITION BY product_id, timestamp ORDER BY filename DESC) = 1
+            ORDER BY timestamp
+        """).df()
+
+    def read_range(self, product_id: str, from_ms: int, to_ms: int) -> pd.DataFrame:
+        """
+        Returns the candles of `product_id` in [from_ms, to_ms) of the offline
+        store, sorted by timestamp. Only the day partitions of the range are
+        scanned.
+        """
+        files = self.root_dir / "offline" / self.table_name / "*" / "*.parquet"
+        from_date = datetime.fromtimestamp(from_ms / 1000, tz=timezone.utc).date()
+        to_date = datetime.fromtimestamp(to_ms / 1000, tz=timezone.utc).date()
+        # a connection per call, so slices can be read from several threads
+        with duckdb.connect() as connection:
+            return connection.execute(f"""
+                SELECT * EXCLUDE (date, filename)
+                FROM read_parquet('{files}', hive_partitioning = true, filename = true)
+                WHERE date BETWEEN ? AND ?
+                    AND product_id = ? AND timestamp >= ? AND timestamp < ?
+                QUALIFY row_number() OVER (PARTITION BY product_id, timestamp ORDER BY filename DESC) = 1
+                ORDER BY timestamp
+            """, [from_date, to_date, product_id, from_ms, to_ms]).df()
+
+    def get_feature_vectors(
+        self,
+        entry: List[Dict],
+        return_type: str = "pandas",
+        allow_missing: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Looks up the candles of the primary keys in `entry` in the online
+        store, in the order of `entry`. Keys without a candle are left out, or
+        get a row with missing features with `allow_missing`.
+        """
+        assert return_type == "pandas", f"Unsupported return_type: {return_type}"
+        keys = pd.DataFrame(entry, columns=["product_id", "timestamp"])
+
+        product_ids = list(keys["product_id"].unique())
+        query = (
+            f'SELECT * FROM "{self.table_name}" '
+            f"WHERE product_id IN ({', '.join('?' * len(product_ids))}) "
+            f"AND timestamp BETWEEN ? AND ?"
+        )
+        params = [*product_ids, int(keys["timestamp"].min()), int(keys["timestamp"].max())]
+
+        with closing(sqlite3.connect(self.root_dir / "online.db")) as connection:
+            rows = pd.read_sql_query(query, connection, params=params)
+
+        how = "left" if allow_missing else "inner"
+        return keys.merge(rows, on=["product_id", "timestamp"], how=how)[rows.columns]
@@ -1,8 +1,26 @@
 import hopsworks
+import pandas as pd
 from .config import config
-from typing import List, Dict
+from .local_feature_store import LocalFeatureView
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 import time
 
+DAY_MS = 24 * 60 * 60 * 1000
+
+def read_range_from_feature_group(feature_group, product_id: str, from_ms: int, to_ms: int) -> pd.DataFrame:
+    """
+    Reads the candles of `product_id` in [from_ms, to_ms) from the offline
+    store of a Hopsworks feature group, with both filters applied by the store.
+    """
+    query = feature_group.select_all().filter(
+        (feature_group.product_id == product_id)
+        & (feature_group.timestamp >= from_ms)
+        & (feature_group.timestamp < to_ms)
+    )
+    # the query API has no ORDER BY, so each slice is sorted on its own
+    return query.read().sort_values(by='timestamp', ignore_index=True)
+
 class OhlcDataReader:
     def __init__(
         self,
@@ -20,19 +38,18 @@ class OhlcDataReader:
         self.feature_group_version = feature_group_version
         self.last_n_minutes = last_n_minutes
 
-    def _get_primary_keys(self, last_n_minutes: int) -> List[Dict]:
-        current_utc = int(time.time() * 1000)
-        current_utc = current_utc - (current_utc % 60000)
+        self._feature_store = None
+        self._feature_views = {}
+        self._feature_group = None
 
-        timestamps = [current_utc - i * 60000 for i in range(last_n_minutes)]
-        primary_keys = [
-            {
-                "product_id": "BTC/USD",
-                "timestamp": timestamp
-            } for timestamp in timestamps
-        ]
-
-        return primary_keys
+    def _get_feature_store(self):
+        if self._feature_store is None:
+            project = hopsworks.login(
+                project=config.project_name,
+                api_key_value=config.api_key,
+            )
+            self._feature_store = project.get_feature_store()
+        return self._feature_store
 
     def get_feature_view(
         self,
@@ -41,48 +58,119 @@ class OhlcDataReader:
         feature_view_name:str,
         feature_view_version:int,
     ):
-        project = hopsworks.login(
-            project=config.project_name,
-            api_key_value=config.api_key,
-        )
+        if config.feature_store_backend == 'local':
+            return LocalFeatureView(
+                root_dir=config.local_feature_store_dir,
+                feature_group_name=feature_group_name,
+                feature_group_version=feature_group_version,
+            )
 
-        fs = project.get_feature_store()
+        key = (feature_view_name, feature_view_version)
+        if key not in self._feature_views:
+            fs = self._get_feature_store()
 
-        feature_group = fs.get_feature_group(name=feature_group_name, version=feature_group_version)
+            feature_group = fs.get_feature_group(name=feature_group_name, version=feature_group_version)
 
-        feature_view = fs.get_or_create_feature_view(
-            name=feature_view_name,
-            version=feature_view_version,
-            query=feature_group.select_all()
-        )
+            self._feature_views[key] = fs.get_or_create_feature_view(
+                name=feature_view_name,
+                version=feature_view_version,
+                query=feature_group.select_all()
+            )
 
-        return feature_view
+        return self._feature_views[key]
 
-    def read_from_online_store(self):
-        feature_view = self.get_feature_view(
-            feature_group_name=self.feature_group_name,
-            feature_group_version=self.feature_group_version,
-            feature_view_name=self.feature_view_name,
-            feature_view_version=self.feature_view_version,
-        )
-        data = feature_view.get_batch_data()
-        #sort by timestamp
-        data = data.sort_values(by='timestamp')
+    def _get_feature_group(self):
+        if self._feature_group is None:
+            self._feature_group = self._get_feature_store().get_feature_group(
+                name=self.feature_group_name, version=self.feature_group_version
+            )
+        return self._feature_group
 
-        return data
+    def _get_last_primary_keys(self, product_ids: Tuple[str, ...], n_candles: int) -> List[Dict]:
+        """
+        Returns the primary keys of the last `n_candles` windows of every
+        product, oldest first.
+        """
+        window_ms = self.ohlc_window_sec * 1000
+        # candles are timestamped with the end of their window
+        last_window_end_ms = int(time.time() * 1000) // window_ms * window_ms
+        return [
+            {
+                "product_id": product_id,
+                "timestamp": last_window_end_ms - i * window_ms,
+            }
+            for product_id in product_ids
+            for i in reversed(range(n_candles))
+        ]
+
+    def read_from_online_store(
+        self,
+        product_ids: Tuple[str, ...] = ("BTC/USD",),
+        n_candles: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads the candles of the last `n_candles` windows, or of the last
+        `last_n_minutes`, of every product from the online store, sorted by
+        product and timestamp.
 
-    def read_from_offline_store(self, last_n_days_to_fetch_from_store:int):
-        print("GROUPPP NAMEMEM",self.feature_group_name)
+        Only the keys of those windows are looked up, so the read does not grow
+        with the history kept in the store. Readers that compute indicators
+        pass the number of candles the indicators need, which can be more than
+        `last_n_minutes` holds.
+        """
         feature_view = self.get_feature_view(
             feature_group_name=self.feature_group_name,
             feature_group_version=self.feature_group_version,
             feature_view_name=self.feature_view_name,
             feature_view_version=self.feature_view_version,
         )
+        if n_candles is None:
+            n_candles = self.last_n_minutes * 60 // self.ohlc_window_sec
         data = feature_view.get_feature_vectors(
-            entry=self._get_primary_keys(last_n_minutes=last_n_days_to_fetch_from_store * 24 * 60),
-            return_type="pandas"
+            entry=self._get_last_primary_keys(product_ids, n_candles),
+            return_type="pandas",
+            allow_missing=True,
         )
-        #sort by timestamp ascending
-        data = data.sort_values(by='timestamp', ascending=True)
-        return data
\ No newline at end of file
+        # vectors come back in the order of the keys, and windows without a
+        # candle with missing features
+        return data.dropna(subset=["close"]).reset_index(drop=True)
+
+    def read_from_offline_store(
+        self,
+        last_n_days_to_fetch_from_store:int,
+        product_id:str = "BTC/USD",
+        days_per_slice:int = 7,
+        max_workers:int = 4,
+    ) -> pd.DataFrame:
+        """
+        Reads the candles of `product_id` of the last days from the offline
+        store, sorted by timestamp.
+
+        From Hopsworks, the range is split into slices of `days_per_slice` days
+        that are read in parallel and concatenated in order.
+        """
+        window_ms = self.ohlc_window_sec * 1000
+        to_ms = int(time.time() * 1000) // window_ms * window_ms + window_ms
+        from_ms = to_ms - last_n_days_to_fetch_from_store * DAY_MS
+
+        if config.feature_store_backend == 'local':
+            # DuckDB already scans the partitions of one query in parallel
+            feature_view = self.get_feature_view(
+                feature_group_name=self.feature_group_name,
+                feature_group_version=self.feature_group_version,
+                feature_view_name=self.feature_view_name,
+                feature_view_version=self.feature_view_version,
+            )
+            return feature_view.read_range(product_id, from_ms, to_ms)
+
+        slice_ms = days_per_slice * DAY_MS
+        slices = [(start, min(start + slice_ms, to_ms)) for start in range(from_ms, to_ms, slice_ms)]
+
+        # resolved once, before the slices are read concurrently
+        feature_group = self._get_feature_group()
+        read_slice = lambda s: read_range_from_feature_group(feature_group, product_id, *s)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(read_slice, slices))
+
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,82 @@
+"""
+Trades/sec of decoding raw Kraken websocket messages into Kafka payload bytes,
+comparing the pydantic `Trade` path with the `FastTrade` decoder.
+
+Run with `make benchmark-decode`. No broker is needed.
+"""
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Callable, List
+
+from loguru import logger
+
+from kraken_api.fast_trade import decode_websocket_trades
+from kraken_api.Trade import Trade
+
+
+def synthetic_messages(n_messages: int, trades_per_message: int) -> List[str]:
+    now = datetime(2024, 1, 31, 23, 59, tzinfo=timezone.utc)
+    messages = []
+    for _ in range(n_messages):
+        data = []
+        for _ in range(trades_per_message):
+            now += timedelta(microseconds=random.randint(0, 500_000))
+            data.append({
+                'symbol': 'BTC/USD',
+                'side': random.choice(['buy', 'sell']),
+                'price': round(random.uniform(40_000, 70_000), 1),
+                'qty': round(random.uniform(0.0001, 0.5), 8),
+                'ord_type': 'market',
+                'trade_id': random.randint(0, 10**9),
+                'timestamp': now.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            })
+        messages.append(json.dumps({'channel': 'trade', 'type': 'update', 'data': data}))
+    return messages
+
+
+def pydantic_path(message: str) -> List[bytes]:
+    trades = [
+        Trade(
+            product_id='BTC/USD',
+            price=trade['price'],
+            volume=trade['qty'],
+            timestamp_ms=int(
+                datetime.strptime(trade['timestamp'], '%Y-%m-%dT%H:%M:%S.%fZ')
+                .replace(tzinfo=timezone.utc)
+                .timestamp() * 1000
+            ),
+            side=trade['side'],
+        )
+        for trade in json.loads(message)['data']
+    ]
+    return [
+        json.dumps(trade.model_dump(), separators=(',', ':')).encode()
+        for trade in trades
+    ]
+
+
+def fast_path(message: str) -> List[bytes]:
+    trades = decode_websocket_trades(json.loads(message)['data'], product_id='BTC/USD')
+    return [trade.to_json_bytes() for trade in trades]
+
+
+def trades_per_sec(decode: Callable[[str], List[bytes]], messages: List[str]) -> float:
+    start = perf_counter()
+    n_trades = sum(len(decode(message)) for message in messages)
+    return n_trades / (perf_counter() - start)
+
+
+if __name__ == '__main__':
+    messages = synthetic_messages(n_messages=20_000, trades_per_message=10)
+
+    for message in messages[:100]:
+        assert [json.loads(v) for v in pydantic_path(message)] == [
+            json.loads(v) for v in fast_path(message)
+        ]
+
+    before = trades_per_sec(pydantic_path, messages)
+    after = trades_per_sec(fast_path, messages)
+    logger.info(f'pydantic Trade + strptime: {before:,.0f} trades/s')
+    logger.info(f'FastTrade decoder:         {after:,.0f} trades/s ({after / before:.1f}x)')
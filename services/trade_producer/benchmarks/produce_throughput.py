@@ -0,0 +1,95 @@
+"""
+Messages/sec of the historical produce path against a local Redpanda.
+
+Start the broker first with `make start-redpanda` in `docker-compose/`, then run
+`make benchmark` from this service. Trades are synthetic and come in pages of
+1000, the same shape `KrakenRestAPI` returns.
+"""
+import argparse
+import random
+from time import perf_counter
+from typing import List
+
+from loguru import logger
+from quixstreams import Application
+
+from kafka_produce import ProduceStats, produce_batch
+from kraken_api.fast_trade import FastTrade
+
+
+def synthetic_pages(n_trades: int, page_size: int = 1000) -> List[List[FastTrade]]:
+    timestamp_ms = 1_700_000_000_000
+    price = 60_000.0
+    pages = []
+    for start in range(0, n_trades, page_size):
+        page = []
+        for _ in range(min(page_size, n_trades - start)):
+            timestamp_ms += random.randint(0, 500)
+            price += random.uniform(-5, 5)
+            page.append(FastTrade(
+                product_id='BTC/USD',
+                price=round(price, 1),
+                volume=round(random.uniform(0.0001, 0.5), 8),
+                timestamp_ms=timestamp_ms,
+                side=random.choice(['buy', 'sell']),
+            ))
+        pages.append(page)
+    return pages
+
+
+def run(
+    broker_address: str,
+    topic_name: str,
+    pages: List[List[FastTrade]],
+    linger_ms: int,
+    batch_size: int,
+    compression_type: str,
+) -> float:
+    app = Application(
+        broker_address=broker_address,
+        producer_extra_config={
+            'linger.ms': linger_ms,
+            'batch.size': batch_size,
+            'compression.type': compression_type,
+        },
+    )
+    topic = app.topic(name=topic_name, value_serializer='json')
+    stats = ProduceStats(log_interval_sec=float('inf'))
+
+    start = perf_counter()
+    with app.get_producer() as producer:
+        for page in pages:
+            produce_batch(producer=producer, topic=topic, trades=page, stats=stats)
+    elapsed = perf_counter() - start
+
+    assert stats.failed == 0, f'{stats.failed} messages failed'
+    return stats.delivered / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--broker-address', default='localhost:19092')
+    parser.add_argument('--topic', default='trade_benchmark')
+    parser.add_argument('--n-trades', type=int, default=200_000)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.n_trades)
+
+    for linger_ms, batch_size, compression_type in [
+        (0, 16_384, 'none'),
+        (5, 1_000_000, 'none'),
+        (50, 1_000_000, 'lz4'),
+        (50, 1_000_000, 'zstd'),
+    ]:
+        msg_per_sec = run(
+            broker_address=args.broker_address,
+            topic_name=args.topic,
+            pages=pages,
+            linger_ms=linger_ms,
+            batch_size=batch_size,
+            compression_type=compression_type,
+        )
+        logger.info(
+            f'linger.ms={linger_ms} batch.size={batch_size} '
+            f'compression={compression_type}: {msg_per_sec:,.0f} msg/s'
+        )
@@ -1,18 +1,43 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, NoDecode
+import json
 import os
 from dotenv import load_dotenv, find_dotenv
 from pydantic import field_validator
-from typing import Optional
+from typing import Annotated, List, Optional
 
 load_dotenv(find_dotenv())
 
 class Config(BaseSettings):
-    product_id: str = 'BTC/USD'
+    # decoded by validate_product_ids, not as JSON by pydantic-settings
+    product_ids: Annotated[List[str], NoDecode] = ['BTC/USD']
     kafka_broker_address: Optional[str] = os.environ.get('KAFKA_BROKER_ADDRESS')
     kafka_topic_name: str = os.environ.get('KAFKA_TOPIC')
+    kafka_topic_partitions: int = os.environ.get('KAFKA_TOPIC_PARTITIONS', 1)
+    kafka_topic_replication_factor: int = os.environ.get('KAFKA_TOPIC_REPLICATION_FACTOR', 1)
     ohlc_windows_seconds: int = os.environ.get('OHLC_WINDOWS_SECONDS')
     live_or_historical: str = os.environ.get('LIVE_OR_HISTORICAL')
     last_n_days: Optional[int] = os.environ.get('LAST_N_DAYS')
+    backfill_n_workers: int = os.environ.get('BACKFILL_N_WORKERS', 4)
+    backfill_n_shards: int = os.environ.get('BACKFILL_N_SHARDS', 64)
+    backfill_max_requests_per_sec: float = os.environ.get('BACKFILL_MAX_REQUESTS_PER_SEC', 1.0)
+    kafka_linger_ms: int = os.environ.get('KAFKA_LINGER_MS', 50)
+    kafka_batch_size: int = os.environ.get('KAFKA_BATCH_SIZE', 1_000_000)
+    kafka_compression_type: str = os.environ.get('KAFKA_COMPRESSION_TYPE', 'lz4')
+    stats_log_interval_sec: float = os.environ.get('STATS_LOG_INTERVAL_SEC', 10.0)
+    validate_trades: bool = os.environ.get('VALIDATE_TRADES', False)
+    websocket_heartbeat_timeout_sec: float = os.environ.get('WEBSOCKET_HEARTBEAT_TIMEOUT_SEC', 10.0)
+    websocket_queue_max_size: int = os.environ.get('WEBSOCKET_QUEUE_MAX_SIZE', 10_000)
+
+    @field_validator('product_ids', mode='before')
+    @classmethod
+    def validate_product_ids(cls, v):
+        # PRODUCT_IDS is a JSON list, e.g. '["BTC/USD", "ETH/USD"]', or
+        # comma-separated, e.g. 'BTC/USD,ETH/USD'
+        if isinstance(v, str):
+            v = json.loads(v) if v.lstrip().startswith('[') else v.split(',')
+            v = [product_id.strip() for product_id in v if product_id.strip()]
+        assert len(v) > 0, 'At least one product_id is required'
+        return v
 
     @field_validator('live_or_historical')
     @classmethod
@@ -0,0 +1,144 @@
+from time import monotonic, time
+from typing import Dict, List, Optional
+
+from confluent_kafka import KafkaError, Message
+from loguru import logger
+from quixstreams.kafka import Producer
+from quixstreams.models import Topic
+
+from kraken_api.fast_trade import FastTrade
+
+
+class ProductStats:
+    """
+    Message rate and lag of a single product.
+
+    The lag is the difference between the wall clock at produce time and the
+    exchange timestamp of the latest trade, so in historical mode it tells how
+    far behind the backfill is.
+    """
+
+    def __init__(self) -> None:
+        self.produced = 0
+        self.last_log_produced = 0
+        self.lag_ms = 0
+
+
+class ProduceStats:
+    """
+    Throughput and delivery-report counters for the Kafka produce path.
+
+    Replaces per-message logging: counters are updated on every produce call and
+    delivery report, and a single summary line (plus one per product) is logged
+    every `log_interval_sec` seconds.
+    """
+
+    def __init__(self, log_interval_sec: float = 10.0) -> None:
+        self.log_interval_sec = log_interval_sec
+        self.produced = 0
+        self.delivered = 0
+        self.failed = 0
+        self.delivered_bytes = 0
+        self.products: Dict[str, ProductStats] = {}
+
+        self._started_at = monotonic()
+        self._last_log_at = self._started_at
+        self._last_log_produced = 0
+
+    def on_produced(self, trades: List[FastTrade]) -> None:
+        self.produced += len(trades)
+
+        now_ms = int(time() * 1000)
+        latest_ms: Dict[str, int] = {}
+        for trade in trades:
+            product = self.products.get(trade.product_id)
+            if product is None:
+                product = self.products[trade.product_id] = ProductStats()
+            product.produced += 1
+            latest_ms[trade.product_id] = trade.timestamp_ms
+
+        for product_id, timestamp_ms in latest_ms.items():
+            self.products[product_id].lag_ms = now_ms - timestamp_ms
+
+    def on_delivery(self, err: Optional[KafkaError], msg: Message) -> None:
+        """
+        Delivery report callback, served by `producer.poll()` / `producer.flush()`.
+        """
+        if err is not None:
+            self.failed += 1
+            logger.error(f'Delivery failed for key {msg.key()}: {err}')
+            return
+        self.delivered += 1
+        self.delivered_bytes += len(msg.value() or b'')
+
+    @property
+    def in_flight(self) -> int:
+        return self.produced - self.delivered - self.failed
+
+    def maybe_log(self) -> None:
+        now = monotonic()
+        elapsed = now - self._last_log_at
+        if elapsed < self.log_interval_sec:
+            return
+
+        rate = (self.produced - self._last_log_produced) / elapsed
+        logger.info(
+            f'Produced {self.produced} messages ({rate:.0f} msg/s), '
+            f'delivered {self.delivered}, failed {self.failed}, '
+            f'in flight {self.in_flight}'
+        )
+        for product_id, product in self.products.items():
+            product_rate = (product.produced - product.last_log_produced) / elapsed
+            logger.info(
+                f'{product_id}: {product.produced} messages ({product_rate:.0f} msg/s), '
+                f'lag {product.lag_ms / 1000:.1f}s'
+            )
+            product.last_log_produced = product.produced
+        self._last_log_at = now
+        self._last_log_produced = self.produced
+
+    def log_summary(self) -> None:
+        elapsed = monotonic() - self._started_at
+        logger.info(
+            f'Produced {self.produced} messages in {elapsed:.1f}s '
+            f'({self.produced / max(elapsed, 1e-9):.0f} msg/s), '
+            f'delivered {self.delivered} ({self.delivered_bytes} bytes), '
+            f'failed {self.failed}'
+        )
+
+
+def produce_batch(
+    producer: Producer,
+    topic: Topic,
+    trades: List[FastTrade],
+    stats: ProduceStats,
+) -> None:
+    """
+    Enqueues a batch of trades into the producer buffer without blocking on
+    delivery. librdkafka groups them into Kafka batches according to
+    `linger.ms` / `batch.size`, and delivery reports are served by the
+    non-blocking `poll(0)` at the end of the batch.
+
+    Trades serialize themselves to JSON, so the topic serializer is bypassed.
+    Messages are keyed by product ID, so the partitioner routes every symbol to
+    a fixed partition and per-symbol ordering is kept.
+
+    Args:
+        producer: The Kafka producer.
+        topic: The topic to produce the trades to.
+        trades: The trades to produce.
+        stats: Counters updated with produced and delivered messages.
+    Returns:
+        None
+    """
+    for trade in trades:
+        producer.produce(
+            topic=topic.name,
+            value=trade.to_json_bytes(),
+            key=trade.product_id,
+            timestamp=trade.timestamp_ms,
+            on_delivery=stats.on_delivery,
+        )
+
+    stats.on_produced(trades)
+    producer.poll(0)
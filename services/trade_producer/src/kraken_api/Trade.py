@@ -1,7 +1,10 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 class Trade(BaseModel):
     product_id: str
     price: float
     volume: float
-    timestamp_ms: int
\ No newline at end of file
+    timestamp_ms: int
+    side: Literal['buy', 'sell']
\ No newline at end of file
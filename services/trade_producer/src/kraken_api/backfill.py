@@ -0,0 +1,197 @@
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import sleep
+from typing import Dict, List, NamedTuple, Optional
+
+import requests
+from loguru import logger
+
+from .fast_trade import FastTrade
+from .rate_limiter import TokenBucketRateLimiter
+from .rest import KrakenRestAPI, KrakenRestAPIError, fetch_trades_page
+
+
+class TimeShard(NamedTuple):
+    index: int
+    product_id: str
+    from_ms: int
+    to_ms: int
+
+
+class KrakenRestAPIBackfill:
+    """
+    Historical backfill that fetches several time shards of `[from_ms, to_ms]`
+    concurrently, all sharing one token-bucket rate limiter.
+
+    Every product gets its own shards. Shards are emitted window after window
+    (all products of a window, then the next window), and each shard in
+    timestamp order, so per-product ordering is the same as with the serial
+    `KrakenRestAPI`. Only
+    `max_shards_in_flight` shards are fetched ahead of the one being emitted,
+    which bounds memory usage.
+
+    Rate-limit errors slow every worker down and are retried until they stop.
+    Any other error is retried `max_retries` times in a row, with an
+    exponential backoff from `retry_backoff_sec`, then raised by `get_trades`.
+    """
+
+    def __init__(
+        self,
+        product_ids: List[str],
+        last_n_days: int,
+        n_workers: int = 4,
+        n_shards: int = 16,
+        max_requests_per_sec: float = 1.0,
+        max_shards_in_flight: Optional[int] = None,
+        validate_trades: bool = False,
+        max_retries: int = 5,
+        retry_backoff_sec: float = 1.0,
+    ) -> None:
+        self.product_ids = product_ids
+        self.validate_trades = validate_trades
+        self.last_n_days = last_n_days
+        self.max_retries = max_retries
+        self.retry_backoff_sec = retry_backoff_sec
+        self.from_ms, self.to_ms = KrakenRestAPI._init_from_to_ms(last_n_days)
+
+        self._shards = self._split_into_shards(
+            product_ids, self.from_ms, self.to_ms, n_shards
+        )
+        self._rate_limiter = TokenBucketRateLimiter(max_rate_per_sec=max_requests_per_sec)
+        self._executor = ThreadPoolExecutor(
+            max_workers=n_workers, thread_name_prefix='kraken-backfill'
+        )
+        self._max_shards_in_flight = max_shards_in_flight or 2 * n_workers
+
+        self._shard_queues: Dict[int, queue.Queue] = {}
+        self._futures: Dict[int, Future] = {}
+        self._next_shard_to_submit = 0
+        self._head_shard = 0
+
+        logger.info(
+            f'Backfilling {product_ids} from {self.from_ms} to {self.to_ms} '
+            f'in {len(self._shards)} shards with {n_workers} workers'
+        )
+
+    @staticmethod
+    def _split_into_shards(
+        product_ids: List[str], from_ms: int, to_ms: int, n_shards: int
+    ) -> List[TimeShard]:
+        shard_ms = max(1, -(-(to_ms - from_ms) // n_shards))
+        windows = [
+            (start, min(start + shard_ms, to_ms))
+            for start in range(from_ms, to_ms, shard_ms)
+        ]
+        return [
+            TimeShard(index=i, product_id=product_id, from_ms=start, to_ms=end)
+            for i, ((start, end), product_id) in enumerate(
+                (window, product_id) for window in windows for product_id in product_ids
+            )
+        ]
+
+    def _submit_shards(self) -> None:
+        while (
+            self._next_shard_to_submit < len(self._shards)
+            and self._next_shard_to_submit - self._head_shard < self._max_shards_in_flight
+        ):
+            shard = self._shards[self._next_shard_to_submit]
+            self._shard_queues[shard.index] = queue.Queue()
+            self._futures[shard.index] = self._executor.submit(self._fetch_shard, shard)
+            self._next_shard_to_submit += 1
+
+    def _fetch_shard(self, shard: TimeShard) -> None:
+        """
+        Pages through one shard and pushes every page to the shard queue,
+        followed by a `None` sentinel.
+        """
+        shard_queue = self._shard_queues[shard.index]
+        since_ns = shard.from_ms * 1_000_000
+        n_errors = 0
+
+        while since_ns < shard.to_ms * 1_000_000:
+            self._rate_limiter.acquire()
+            try:
+                trades, last_ns = fetch_trades_page(
+                    shard.product_id, since_ns, validate=self.validate_trades
+                )
+            except KrakenRestAPIError as e:
+                if not e.is_rate_limit:
+                    n_errors = self._on_error(shard, e, n_errors)
+                    continue
+                backoff_sec = self._rate_limiter.on_rate_limited()
+                logger.warning(f'Shard {shard.index}: {e}. Backing off {backoff_sec}s')
+                continue
+            except (requests.RequestException, ValueError) as e:
+                n_errors = self._on_error(shard, e, n_errors)
+                continue
+            self._rate_limiter.on_success()
+            n_errors = 0
+
+            trades = [
+                trade for trade in trades
+                if shard.from_ms <= trade.timestamp_ms < shard.to_ms
+            ]
+            if trades:
+                shard_queue.put(trades)
+
+            if last_ns <= since_ns:
+                # no progress, Kraken has no more trades for this range
+                break
+            since_ns = last_ns
+
+        logger.debug(f'Shard {shard.index} fetched')
+        shard_queue.put(None)
+
+    def _on_error(self, shard: TimeShard, error: Exception, n_errors: int) -> int:
+        """
+        Sleeps before retrying a request that failed for another reason than
+        the rate limit, or raises `error` after `max_retries` failures in a row.
+
+        Returns:
+            The number of failures in a row, `error` included.
+        """
+        n_errors += 1
+        if n_errors > self.max_retries:
+            logger.error(f'Shard {shard.index}: {error}. Giving up after {self.max_retries} retries')
+            raise error
+        backoff_sec = self.retry_backoff_sec * 2 ** (n_errors - 1)
+        logger.warning(
+            f'Shard {shard.index}: {error}. Retry {n_errors}/{self.max_retries} in {backoff_sec}s'
+        )
+        sleep(backoff_sec)
+        return n_errors
+
+    def get_trades(self) -> List[FastTrade]:
+        """
+        Returns the next page of trades of the shard currently being emitted.
+        """
+        self._submit_shards()
+
+        if self._head_shard >= len(self._shards):
+            return []
+
+        future = self._futures[self._head_shard]
+        try:
+            page = self._shard_queues[self._head_shard].get(timeout=1)
+        except queue.Empty:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+            return []
+
+        if page is None:
+            del self._shard_queues[self._head_shard]
+            del self._futures[self._head_shard]
+            self._head_shard += 1
+            logger.info(f'Shard {self._head_shard}/{len(self._shards)} produced')
+            return []
+
+        return page
+
+    def is_done(self) -> bool:
+        """
+        Checks if all shards have been fetched and emitted.
+        """
+        done = self._head_shard >= len(self._shards)
+        if done:
+            self._executor.shutdown(wait=False)
+        return done
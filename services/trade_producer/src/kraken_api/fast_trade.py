@@ -0,0 +1,161 @@
+import calendar
+import json
+from typing import Dict, List, Optional
+
+from .Trade import Trade
+
+
+class FastTrade:
+    """
+    Compact trade record used on the hot path instead of the pydantic `Trade`.
+
+    It has the same fields as `Trade`, but no per-instance `__dict__` and no
+    validation, and it serializes itself straight to the JSON bytes we send to
+    Kafka.
+    """
+
+    __slots__ = ('product_id', 'price', 'volume', 'timestamp_ms', 'side')
+
+    def __init__(
+        self,
+        product_id: str,
+        price: float,
+        volume: float,
+        timestamp_ms: int,
+        side: str,
+    ) -> None:
+        self.product_id = product_id
+        self.price = price
+        self.volume = volume
+        self.timestamp_ms = timestamp_ms
+        self.side = side
+
+    def to_json_bytes(self) -> bytes:
+        """
+        Same payload as `json.dumps(trade.model_dump())` with compact separators.
+        """
+        return (
+            f'{{"product_id":{_quoted(self.product_id)},"price":{self.price!r},'
+            f'"volume":{self.volume!r},"timestamp_ms":{self.timestamp_ms},'
+            f'"side":"{self.side}"}}'
+        ).encode()
+
+    def to_dict(self) -> Dict:
+        return {
+            'product_id': self.product_id,
+            'price': self.price,
+            'volume': self.volume,
+            'timestamp_ms': self.timestamp_ms,
+            'side': self.side,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f'FastTrade(product_id={self.product_id!r}, price={self.price!r}, '
+            f'volume={self.volume!r}, timestamp_ms={self.timestamp_ms!r}, '
+            f'side={self.side!r})'
+        )
+
+
+_QUOTED_CACHE: Dict[str, str] = {}
+
+
+def _quoted(value: str) -> str:
+    quoted = _QUOTED_CACHE.get(value)
+    if quoted is None:
+        quoted = _QUOTED_CACHE[value] = json.dumps(value)
+    return quoted
+
+
+_DAY_MS_CACHE: Dict[str, int] = {}
+
+
+def parse_iso8601_ms(timestamp: str) -> int:
+    """
+    Parses a UTC timestamp like `2024-01-31T12:34:56.789012Z` into milliseconds
+    since the epoch.
+
+    Only the layout Kraken sends is supported, which lets us slice the string
+    instead of going through `datetime.strptime`. The epoch of the day is
+    cached, so most calls are a handful of `int()` conversions.
+    """
+    day = timestamp[:10]
+    day_ms = _DAY_MS_CACHE.get(day)
+    if day_ms is None:
+        day_ms = _DAY_MS_CACHE[day] = calendar.timegm(
+            (int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0)
+        ) * 1000
+
+    timestamp_ms = (
+        day_ms
+        + int(timestamp[11:13]) * 3_600_000
+        + int(timestamp[14:16]) * 60_000
+        + int(timestamp[17:19]) * 1_000
+    )
+
+    if len(timestamp) > 20 and timestamp[19] == '.':
+        fraction = timestamp[20:23].rstrip('Z')
+        timestamp_ms += int(fraction.ljust(3, '0'))
+
+    return timestamp_ms
+
+
+def _validated(trade: FastTrade) -> FastTrade:
+    Trade(**trade.to_dict())
+    return trade
+
+
+def decode_rest_trades(
+    product_id: str, rows: List[List], validate: bool = False
+) -> List[FastTrade]:
+    """
+    Decodes the trade rows of a Kraken REST `Trades` response.
+
+    Args:
+        product_id: The product ID the rows belong to.
+        rows: `[price, volume, time, side, order_type, misc, trade_id]` rows.
+        validate: Whether to also validate every trade with the pydantic model.
+    Returns:
+        The decoded trades.
+    """
+    trades = [
+        FastTrade(
+            product_id,
+            float(row[0]),
+            float(row[1]),
+            int(float(row[2]) * 1000),
+            'buy' if row[3] == 'b' else 'sell',
+        )
+        for row in rows
+    ]
+    if validate:
+        trades = [_validated(trade) for trade in trades]
+    return trades
+
+
+def decode_websocket_trades(
+    data: List[Dict], product_id: Optional[str] = None, validate: bool = False
+) -> List[FastTrade]:
+    """
+    Decodes the `data` list of a Kraken websocket v2 `trade` message.
+
+    Args:
+        data: The trade objects of the message.
+        product_id: Overrides the `symbol` of every trade when given.
+        validate: Whether to also validate every trade with the pydantic model.
+    Returns:
+        The decoded trades.
+    """
+    trades = [
+        FastTrade(
+            product_id or trade['symbol'],
+            float(trade['price']),
+            float(trade['qty']),
+            parse_iso8601_ms(trade['timestamp']),
+            trade['side'],
+        )
+        for trade in data
+    ]
+    if validate:
+        trades = [_validated(trade) for trade in trades]
+    return trades
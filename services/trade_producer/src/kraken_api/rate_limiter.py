@@ -0,0 +1,84 @@
+import threading
+from time import monotonic, sleep
+
+
+class TokenBucketRateLimiter:
+    """
+    Thread-safe token bucket shared by every worker hitting the Kraken REST API.
+
+    The refill rate adapts to the responses we get back (AIMD): every successful
+    request adds `increase_step` requests/sec up to `max_rate_per_sec`, and every
+    rate-limit error halves the rate and pauses all workers with an exponential
+    backoff.
+    """
+
+    def __init__(
+        self,
+        max_rate_per_sec: float,
+        capacity: int = 1,
+        min_rate_per_sec: float = 0.1,
+        increase_step: float = 0.05,
+        initial_backoff_sec: float = 1.0,
+        max_backoff_sec: float = 60.0,
+    ) -> None:
+        self.max_rate_per_sec = max_rate_per_sec
+        self.min_rate_per_sec = min(min_rate_per_sec, max_rate_per_sec)
+        self.rate_per_sec = max_rate_per_sec
+        self.capacity = capacity
+        self.increase_step = increase_step
+        self.initial_backoff_sec = initial_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+
+        self._tokens = float(capacity)
+        self._last_refill = monotonic()
+        self._blocked_until = 0.0
+        self._backoff_sec = initial_backoff_sec
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_sec)
+        self._last_refill = now
+
+    def acquire(self) -> None:
+        """
+        Blocks until a request token is available.
+        """
+        while True:
+            with self._lock:
+                now = monotonic()
+                if now < self._blocked_until:
+                    wait_sec = self._blocked_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait_sec = (1 - self._tokens) / self.rate_per_sec
+            sleep(wait_sec)
+
+    def on_success(self) -> None:
+        """
+        Additive increase of the request rate after a successful request.
+        """
+        with self._lock:
+            self.rate_per_sec = min(
+                self.max_rate_per_sec, self.rate_per_sec + self.increase_step
+            )
+            self._backoff_sec = self.initial_backoff_sec
+
+    def on_rate_limited(self) -> float:
+        """
+        Multiplicative decrease of the request rate and a shared pause for all
+        workers.
+
+        Returns:
+            The number of seconds every worker is paused for.
+        """
+        with self._lock:
+            self.rate_per_sec = max(self.min_rate_per_sec, self.rate_per_sec / 2)
+            backoff_sec = self._backoff_sec
+            self._blocked_until = max(self._blocked_until, monotonic() + backoff_sec)
+            self._backoff_sec = min(self.max_backoff_sec, self._backoff_sec * 2)
+            self._tokens = 0.0
+            return backoff_sec
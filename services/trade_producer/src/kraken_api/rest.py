@@ -5,17 +5,67 @@ from datetime import datetime, timezone
 from typing import Tuple
 from loguru import logger
 from time import sleep
-from .Trade import Trade
+from .fast_trade import FastTrade, decode_rest_trades
+
+
+# errors Kraken answers with when we are over the rate limit
+RATE_LIMIT_ERRORS = {'EAPI:Rate limit exceeded', 'EGeneral:Too many requests'}
+
+
+class KrakenRestAPIError(Exception):
+    """
+    Raised when the Kraken REST API answers with a non-empty `error` list.
+    """
+
+    def __init__(self, errors: List[str]) -> None:
+        super().__init__(', '.join(errors))
+        self.errors = errors
+
+    @property
+    def is_rate_limit(self) -> bool:
+        return any(error in RATE_LIMIT_ERRORS for error in self.errors)
+
+
+def fetch_trades_page(
+    product_id: str, since_ns: int, validate: bool = False
+) -> Tuple[List[FastTrade], int]:
+    """
+    Fetches a single page (up to 1000 trades) from the Kraken REST API.
+
+    Args:
+        product_id: The product ID to fetch the trades for.
+        since_ns: Cursor in nanoseconds, as returned by Kraken in `last`.
+        validate: Whether to validate every trade with the pydantic `Trade` model.
+    Returns:
+        The trades in the page and the cursor (in nanoseconds) of the next page.
+    """
+    url = KrakenRestAPI.URL_SINCE_NS.format(product_id=product_id, since_ns=since_ns)
+    response = requests.get(url, headers={'accept': 'application/json'}, timeout=30)
+    data = json.loads(response.text)
+
+    if data.get('error'):
+        raise KrakenRestAPIError(data['error'])
+
+    result = data['result']
+    pair = next(key for key in result if key != 'last')
+
+    trades = decode_rest_trades(product_id, result[pair], validate=validate)
+
+    return trades, int(result['last'])
+
 
 class KrakenRestAPI:
     URL = 'https://api.kraken.com/0/public/Trades?pair={product_id}&since={since_sec}'
+    URL_SINCE_NS = 'https://api.kraken.com/0/public/Trades?pair={product_id}&since={since_ns}'
 
     def __init__(
         self,
         product_id: str,
         last_n_days: int,
+        validate_trades: bool = False,
     ) -> None:
         self.product_id = product_id
+        self.validate_trades = validate_trades
         self.from_ms, self.to_ms = self._init_from_to_ms(last_n_days)
         self._is_done = False
         self.last_trade_ms = self.from_ms
@@ -30,7 +80,7 @@ class KrakenRestAPI:
 
         return from_ms, to_ms
 
-    def get_trades(self) -> List[Trade]:
+    def get_trades(self) -> List[FastTrade]:
         """
         Fetches a batch of trades from the Kraken API.
         """
@@ -51,12 +101,9 @@ class KrakenRestAPI:
         
         pair = list(data['result'].keys())[0]
 
-        trades = [Trade(
-            product_id=self.product_id,
-            price=float(trade[0]),
-            volume=float(trade[1]),
-            timestamp_ms=int(trade[2]) * 1000,
-        ) for trade in data['result'][pair]]
+        trades = decode_rest_trades(
+            self.product_id, data['result'][pair], validate=self.validate_trades
+        )
 
         if trades [-1].timestamp_ms > self.last_trade_ms:
             self.last_trade_ms = trades[-1].timestamp_ms + 1
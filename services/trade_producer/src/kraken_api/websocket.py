@@ -1,75 +1,259 @@
-from typing import List, Dict
-from websocket import create_connection
+import asyncio
 import json
+import queue
+import threading
+from collections import Counter, deque
+from time import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+import requests
+import websockets
 from loguru import logger
-from datetime import datetime
-from .Trade import Trade
+
+from .fast_trade import FastTrade, decode_websocket_trades
+from .rest import KrakenRestAPIError, fetch_trades_page
 
 
 class KrakenWebsocketTradeAPI:
+    """
+    Live trades from the Kraken websocket API.
+
+    An asyncio receive loop runs in a background thread and pushes trades into a
+    bounded queue, which decouples network receive from Kafka produce:
+    `get_trades` only drains the queue, and when the producer falls behind the
+    loop stops reading from the socket until there is room again.
+
+    The connection is considered dead when nothing (not even a heartbeat) is
+    received for `heartbeat_timeout_sec`. The loop then reconnects with
+    exponential backoff and replays the trades missed while disconnected
+    through the REST API. The replay runs as a separate task, so the socket
+    keeps being read, and the live trades received meanwhile are held back
+    until it is done, so every product stays in timestamp order.
+    """
+
     URL = 'wss://ws.kraken.com/v2'
 
-    def __init__(self, product_id: str):
-        self.product_id = product_id
+    def __init__(
+        self,
+        product_ids: List[str],
+        validate_trades: bool = False,
+        heartbeat_timeout_sec: float = 10.0,
+        queue_max_size: int = 10_000,
+        max_reconnect_backoff_sec: float = 30.0,
+        gap_fill_max_retries: int = 5,
+    ):
+        self.product_ids = product_ids
+        self.validate_trades = validate_trades
+        self.heartbeat_timeout_sec = heartbeat_timeout_sec
+        self.max_reconnect_backoff_sec = max_reconnect_backoff_sec
+        self.gap_fill_max_retries = gap_fill_max_retries
 
-        # establish connection
-        self._ws = create_connection(self.URL)
-        logger.info(f'Connected to Kraken API: {self.URL}')
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_max_size)
+        # timestamp of the last trade handed to the queue, per product, and
+        # the (timestamp, price, volume) of the trades in that millisecond, so
+        # the replay of a gap skips them
+        self._last_trade_ms: Dict[str, int] = {}
+        self._last_trade_keys: Dict[str, Counter] = {}
+        # live trades received while a gap is replayed, None when there is no
+        # replay in progress
+        self._pending: Optional[Deque[List[FastTrade]]] = None
+        self._error: Optional[BaseException] = None
 
-        # subscribe to the product
-        self._subscribe(product_id)
+        self._thread = threading.Thread(
+            target=self._run, name='kraken-websocket', daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            asyncio.run(self._receive_loop())
+        except BaseException as e:
+            self._error = e
+            raise
+
+    async def _receive_loop(self) -> None:
+        backoff_sec = 1.0
+        while True:
+            backfill_task = None
+            try:
+                async with websockets.connect(self.URL) as ws:
+                    logger.info(f'Connected to Kraken API: {self.URL}')
+                    await self._subscribe(ws)
+                    subscribed_at_ms = int(time() * 1000)
+                    backoff_sec = 1.0
 
-    def _subscribe(self, product_id: str) -> None:
-        logger.info(f'Subscribing for Symbol: {product_id}')
+                    if self._last_trade_ms:
+                        self._pending = deque()
+                        backfill_task = asyncio.create_task(
+                            self._backfill_gap_then_flush(until_ms=subscribed_at_ms)
+                        )
 
-        self._ws.send(
+                    while True:
+                        message = await asyncio.wait_for(
+                            ws.recv(), timeout=self.heartbeat_timeout_sec
+                        )
+                        trades = self._parse_message(message)
+                        if not trades:
+                            continue
+                        if self._pending is not None:
+                            self._pending.append(trades)
+                        else:
+                            await self._put(trades)
+
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f'No message in {self.heartbeat_timeout_sec}s, reconnecting'
+                )
+            except (websockets.WebSocketException, OSError) as e:
+                logger.warning(f'Websocket connection lost: {e!r}')
+            finally:
+                # the held back trades are replayed after the next connection,
+                # since they are newer than the last trade handed over
+                if backfill_task is not None and not backfill_task.done():
+                    backfill_task.cancel()
+                    await asyncio.gather(backfill_task, return_exceptions=True)
+                self._pending = None
+
+            logger.info(f'Reconnecting in {backoff_sec}s')
+            await asyncio.sleep(backoff_sec)
+            backoff_sec = min(self.max_reconnect_backoff_sec, backoff_sec * 2)
+
+    async def _subscribe(self, ws) -> None:
+        logger.info(f'Subscribing for Symbols: {self.product_ids}')
+
+        await ws.send(
             json.dumps(
                 {
                     'method': 'subscribe',
                     'params': {
                         'channel': 'trade',
-                        'symbol': [product_id],
+                        'symbol': self.product_ids,
                         'snapshot': False,
                     },
                 }
             )
         )
 
-        logger.info('Subscription worked!!')
+    def _parse_message(self, message: str) -> List[FastTrade]:
+        message = json.loads(message)
 
-        # dumpping the first 2 messages
-        _ = self._ws.recv()
-        _ = self._ws.recv()
-
-    def get_trades(self) -> List[Trade]:
-        message = self._ws.recv()
+        if message.get('method') == 'subscribe':
+            if message.get('success'):
+                logger.info(f"Subscribed to {message['result']['symbol']}")
+            else:
+                logger.error(f"Subscription failed: {message.get('error')}")
+            return []
 
-        if 'heartbeat' in message:
+        # status and heartbeat messages only keep the connection alive
+        if message.get('channel') != 'trade':
             return []
 
-        message = json.loads(message)  #
-
-        trades = []
-        for trade in message['data']:
-            trades.append(
-                # {
-                #     'product_id': self.product_id,
-                #     'price': trade['price'],
-                #     'volume': trade['qty'],
-                #     'timestamp': int(datetime.strptime(trade['timestamp'], '%Y-%m-%dT%H:%M:%S.%fZ').timestamp() * 1000),
-                # }
-                Trade(
-                    product_id=self.product_id,
-                    price=trade['price'],
-                    volume=trade['qty'],
-                    timestamp_ms=int(datetime.strptime(trade['timestamp'], '%Y-%m-%dT%H:%M:%S.%fZ').timestamp() * 1000),
-                )
+        return decode_websocket_trades(message['data'], validate=self.validate_trades)
+
+    async def _put(self, trades: List[FastTrade]) -> None:
+        """
+        Hands trades over to the producer, waiting in a worker thread when the
+        queue is full so the event loop itself is never blocked.
+        """
+        for trade in trades:
+            key = (trade.timestamp_ms, trade.price, trade.volume)
+            if trade.timestamp_ms != self._last_trade_ms.get(trade.product_id):
+                self._last_trade_ms[trade.product_id] = trade.timestamp_ms
+                self._last_trade_keys[trade.product_id] = Counter([key])
+            else:
+                self._last_trade_keys[trade.product_id][key] += 1
+
+        try:
+            self._queue.put_nowait(trades)
+        except queue.Full:
+            logger.warning('Trade queue is full, waiting for the producer')
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._queue.put, trades
+            )
+
+    async def _backfill_gap_then_flush(self, until_ms: int) -> None:
+        try:
+            await self._backfill_gap(until_ms)
+        except Exception as e:
+            logger.error(f'Gap backfill failed: {e!r}')
+
+        # the live trades received meanwhile come after the replayed ones
+        while self._pending:
+            await self._put(self._pending.popleft())
+        self._pending = None
+
+    async def _backfill_gap(self, until_ms: int) -> None:
+        """
+        Replays through the REST API the trades published between the last
+        trade we received and the moment the new subscription started.
+
+        The replay starts at the millisecond of the last trade, minus the
+        trades of that millisecond we already have.
+        """
+        loop = asyncio.get_running_loop()
+
+        for product_id, last_trade_ms in list(self._last_trade_ms.items()):
+            logger.info(
+                f'Backfilling {product_id} gap of {(until_ms - last_trade_ms) / 1000:.1f}s'
             )
+            already_sent = Counter(self._last_trade_keys[product_id])
+            since_ns = last_trade_ms * 1_000_000
+            n_trades = 0
+            n_retries = 0
 
-        return trades
+            while since_ns < until_ms * 1_000_000:
+                try:
+                    trades, last_ns = await loop.run_in_executor(
+                        None, fetch_trades_page, product_id, since_ns, self.validate_trades
+                    )
+                except (KrakenRestAPIError, requests.RequestException, ValueError) as e:
+                    n_retries += 1
+                    if n_retries > self.gap_fill_max_retries:
+                        logger.error(f'Giving up on the {product_id} gap: {e}')
+                        break
+                    logger.warning(f'Gap backfill for {product_id} failed: {e}')
+                    await asyncio.sleep(2 ** n_retries)
+                    continue
+                trades = [
+                    trade for trade in trades
+                    if last_trade_ms <= trade.timestamp_ms < until_ms
+                    and not _take(already_sent, (trade.timestamp_ms, trade.price, trade.volume))
+                ]
+                if trades:
+                    n_trades += len(trades)
+                    await self._put(trades)
+
+                if last_ns <= since_ns:
+                    break
+                since_ns = last_ns
+
+            logger.info(f'Replayed {n_trades} missed trades for {product_id}')
+
+    def get_trades(self) -> List[FastTrade]:
+        """
+        Returns the next batch of trades received, or an empty list if none
+        arrived within a second.
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError('Kraken websocket receive loop died') from self._error
+
+        try:
+            return self._queue.get(timeout=1)
+        except queue.Empty:
+            return []
 
     def is_done(self) -> bool:
         """
         The websocket never stops.
         """
-        return False
\ No newline at end of file
+        return False
+
+
+def _take(counter: Counter, key: Tuple) -> bool:
+    """
+    Decrements the count of `key` in `counter`, if it is there.
+    """
+    if counter[key] > 0:
+        counter[key] -= 1
+        return True
+    return False
@@ -1,17 +1,31 @@
 from quixstreams import Application
+from quixstreams.models import TopicConfig
 from kraken_api.websocket import KrakenWebsocketTradeAPI
-from kraken_api.rest import KrakenRestAPI
+from kraken_api.backfill import KrakenRestAPIBackfill
 from typing import List, Dict
 from loguru import logger
 from config import config
-from kraken_api.Trade import Trade
+from kraken_api.fast_trade import FastTrade
+from kafka_produce import ProduceStats, produce_batch
 
 def produce_trades(
     kafka_broker_address: str,
     kafka_topic_name: str,
-    product_id: str,
+    product_ids: List[str],
     live_or_historical: str,
     last_n_days: int,
+    backfill_n_workers: int = 4,
+    backfill_n_shards: int = 64,
+    backfill_max_requests_per_sec: float = 1.0,
+    kafka_linger_ms: int = 50,
+    kafka_batch_size: int = 1_000_000,
+    kafka_compression_type: str = 'lz4',
+    stats_log_interval_sec: float = 10.0,
+    validate_trades: bool = False,
+    websocket_heartbeat_timeout_sec: float = 10.0,
+    websocket_queue_max_size: int = 10_000,
+    kafka_topic_partitions: int = 1,
+    kafka_topic_replication_factor: int = 1,
 ) -> None:
     """
     Reads trades from a Kraken API.
@@ -19,21 +33,64 @@ def produce_trades(
     Args:
         kafka_broker_address: The address of the Kafka broker.
         kafka_topic: The topic to produce the trades to.
-        product_id: The product ID to produce the trades for.
+        product_ids: The product IDs to produce the trades for.
         live_or_historical: Whether to produce live or historical trades.
         las_n_days: The number of days to produce historical trades for.
+        backfill_n_workers: Number of concurrent REST workers in historical mode.
+        backfill_n_shards: Number of time shards the historical range is split into.
+        backfill_max_requests_per_sec: Request budget shared by all REST workers.
+        kafka_linger_ms: How long the producer waits to fill a batch.
+        kafka_batch_size: Maximum size of a producer batch in bytes.
+        kafka_compression_type: Compression codec for producer batches.
+        stats_log_interval_sec: How often throughput counters are logged.
+        validate_trades: Validate every trade with the pydantic model (debug only).
+        websocket_heartbeat_timeout_sec: Silence after which the websocket reconnects.
+        websocket_queue_max_size: Max batches buffered between receive and produce.
+        kafka_topic_partitions: Number of partitions of the topic, if it has to be
+            created. Trades are keyed by product, so every product stays in one
+            partition and trade_to_ohlc can run one instance per partition.
+        kafka_topic_replication_factor: Replication factor of the topic, if it has
+            to be created.
     Returns:
         None
     """
 
-    app = Application(broker_address=kafka_broker_address)
+    app = Application(
+        broker_address=kafka_broker_address,
+        producer_extra_config={
+            'linger.ms': kafka_linger_ms,
+            'batch.size': kafka_batch_size,
+            'compression.type': kafka_compression_type,
+        },
+    )
 
-    topic = app.topic(name=kafka_topic_name, value_serializer='json')
+    topic = app.topic(
+        name=kafka_topic_name,
+        value_serializer='json',
+        config=TopicConfig(
+            num_partitions=kafka_topic_partitions,
+            replication_factor=kafka_topic_replication_factor,
+        ),
+    )
 
     if live_or_historical == 'live':
-        kraken_api = KrakenWebsocketTradeAPI(product_id=product_id)
+        kraken_api = KrakenWebsocketTradeAPI(
+            product_ids=product_ids,
+            validate_trades=validate_trades,
+            heartbeat_timeout_sec=websocket_heartbeat_timeout_sec,
+            queue_max_size=websocket_queue_max_size,
+        )
     else:
-        kraken_api = KrakenRestAPI(product_id=product_id, last_n_days=last_n_days)
+        kraken_api = KrakenRestAPIBackfill(
+            product_ids=product_ids,
+            last_n_days=last_n_days,
+            n_workers=backfill_n_workers,
+            n_shards=backfill_n_shards,
+            max_requests_per_sec=backfill_max_requests_per_sec,
+            validate_trades=validate_trades,
+        )
+
+    stats = ProduceStats(log_interval_sec=stats_log_interval_sec)
 
     with app.get_producer() as producer:
         while True:
@@ -41,30 +98,32 @@ def produce_trades(
                 logger.info('All historical data produced')
                 break
 
+            trades: List[FastTrade] = kraken_api.get_trades()
 
-            trades: List[Trade] = kraken_api.get_trades()
-
-            for trade in trades:
-                message = topic.serialize(
-                    key=trade.product_id, 
-                    value=trade.model_dump(),
-                    timestamp_ms=trade.timestamp_ms
-                )
+            produce_batch(producer=producer, topic=topic, trades=trades, stats=stats)
+            stats.maybe_log()
 
-                producer.produce(
-                    topic=topic.name, 
-                    value=message.value, 
-                    key=message.key,
-                    timestamp=message.timestamp,
-                )
-                logger.info(f'Message sent to Kafka: {trade}')
+    # the producer is flushed on exit, so every delivery report has been served
+    stats.log_summary()
 
 
 if __name__ == '__main__':
     produce_trades(
         kafka_broker_address=config.kafka_broker_address,
         kafka_topic_name=config.kafka_topic_name,
-        product_id=config.product_id,
+        product_ids=config.product_ids,
         live_or_historical=config.live_or_historical,
         last_n_days=config.last_n_days,
+        backfill_n_workers=config.backfill_n_workers,
+        backfill_n_shards=config.backfill_n_shards,
+        backfill_max_requests_per_sec=config.backfill_max_requests_per_sec,
+        kafka_linger_ms=config.kafka_linger_ms,
+        kafka_batch_size=config.kafka_batch_size,
+        kafka_compression_type=config.kafka_compression_type,
+        stats_log_interval_sec=config.stats_log_interval_sec,
+        validate_trades=config.validate_trades,
+        websocket_heartbeat_timeout_sec=config.websocket_heartbeat_timeout_sec,
+        websocket_queue_max_size=config.websocket_queue_max_size,
+        kafka_topic_partitions=config.kafka_topic_partitions,
+        kafka_topic_replication_factor=config.kafka_topic_replication_factor,
     )
@@ -0,0 +1,155 @@
+"""
+Drives millions of synthetic trades through the OHLC reducer and reports
+trades/sec and bytes per open window, next to the previous OHLC-only dict
+reducer and a dict-per-trade reducer carrying the same fields.
+
+quixstreams serializes the aggregate to JSON after every update to write it to
+the window state store, so the throughput is measured both for the reducer
+alone and with that serialization step. Run with `make benchmark`.
+"""
+import argparse
+import json
+import random
+import sys
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+from loguru import logger
+
+from ohlc_aggregator import init_ohlc_candle, update_ohlc_candle
+
+
+def legacy_init_ohlc_candle(value: Dict) -> Dict:
+    return {
+        'open': value['price'],
+        'high': value['price'],
+        'low': value['price'],
+        'close': value['price'],
+        'product_id': value['product_id'],
+    }
+
+
+def legacy_update_ohlc_candle(ohlc_candle: Dict, trade: Dict) -> Dict:
+    return {
+        'open': ohlc_candle['open'],
+        'high': max(ohlc_candle['high'], trade['price']),
+        'low': min(ohlc_candle['low'], trade['price']),
+        'close': trade['price'],
+        'product_id': trade['product_id'],
+    }
+
+
+def dict_init_ohlc_candle(trade: Dict) -> Dict:
+    volume = trade['volume']
+    return {
+        'open': trade['price'],
+        'high': trade['price'],
+        'low': trade['price'],
+        'close': trade['price'],
+        'volume': volume,
+        'price_volume': trade['price'] * volume,
+        'trade_count': 1,
+        'first_trade_ms': trade['timestamp_ms'],
+        'last_trade_ms': trade['timestamp_ms'],
+        'buy_volume': volume if trade['side'] == 'buy' else 0.0,
+        'sell_volume': volume if trade['side'] == 'sell' else 0.0,
+        'product_id': trade['product_id'],
+    }
+
+
+def dict_update_ohlc_candle(ohlc_candle: Dict, trade: Dict) -> Dict:
+    """
+    The dict-per-trade reducer with the same fields as the list-based one.
+    """
+    volume = trade['volume']
+    return {
+        'open': ohlc_candle['open'],
+        'high': max(ohlc_candle['high'], trade['price']),
+        'low': min(ohlc_candle['low'], trade['price']),
+        'close': trade['price'],
+        'volume': ohlc_candle['volume'] + volume,
+        'price_volume': ohlc_candle['price_volume'] + trade['price'] * volume,
+        'trade_count': ohlc_candle['trade_count'] + 1,
+        'first_trade_ms': min(ohlc_candle['first_trade_ms'], trade['timestamp_ms']),
+        'last_trade_ms': max(ohlc_candle['last_trade_ms'], trade['timestamp_ms']),
+        'buy_volume': ohlc_candle['buy_volume'] + (volume if trade['side'] == 'buy' else 0.0),
+        'sell_volume': ohlc_candle['sell_volume'] + (volume if trade['side'] == 'sell' else 0.0),
+        'product_id': trade['product_id'],
+    }
+
+
+def synthetic_trades(n_trades: int, n_products: int) -> List[Dict]:
+    timestamp_ms = 1_700_000_000_000
+    prices = [random.uniform(1, 70_000) for _ in range(n_products)]
+    trades = []
+    for _ in range(n_trades):
+        i = random.randrange(n_products)
+        prices[i] *= 1 + random.uniform(-1e-4, 1e-4)
+        timestamp_ms += random.randint(0, 100)
+        trades.append({
+            'product_id': f'PRODUCT{i}/USD',
+            'price': prices[i],
+            'volume': random.uniform(0.0001, 0.5),
+            'timestamp_ms': timestamp_ms,
+            'side': random.choice(['buy', 'sell']),
+        })
+    return trades
+
+
+def drive(
+    trades: List[Dict],
+    initializer: Callable[[Dict], Any],
+    reducer: Callable[[Any, Dict], Any],
+    window_ms: int,
+    serialize: bool,
+) -> float:
+    windows: Dict[Any, Any] = {}
+    start = perf_counter()
+    for trade in trades:
+        key = (trade['product_id'], trade['timestamp_ms'] // window_ms)
+        candle = windows.get(key)
+        candle = initializer(trade) if candle is None else reducer(candle, trade)
+        if serialize:
+            json.dumps(candle)
+        windows[key] = candle
+    return len(trades) / (perf_counter() - start)
+
+
+def deep_size(obj: Any) -> int:
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            deep_size(k) + deep_size(v) for k, v in obj.items()
+        )
+    if isinstance(obj, list):
+        return sys.getsizeof(obj) + sum(deep_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-trades', type=int, default=2_000_000)
+    parser.add_argument('--n-products', type=int, default=10)
+    parser.add_argument('--window-sec', type=int, default=60)
+    args = parser.parse_args()
+
+    trades = synthetic_trades(args.n_trades, args.n_products)
+    window_ms = args.window_sec * 1000
+
+    for name, initializer, reducer in [
+        ('previous OHLC-only dict', legacy_init_ohlc_candle, legacy_update_ohlc_candle),
+        ('dict per trade, same fields', dict_init_ohlc_candle, dict_update_ohlc_candle),
+        ('in-place list', init_ohlc_candle, update_ohlc_candle),
+    ]:
+        reducer_only = drive(trades, initializer, reducer, window_ms, serialize=False)
+        with_state = drive(trades, initializer, reducer, window_ms, serialize=True)
+
+        candle = initializer(trades[0])
+        for trade in trades[1:100]:
+            candle = reducer(candle, trade)
+
+        logger.info(
+            f'{name}: {reducer_only:,.0f} trades/s (reducer), '
+            f'{with_state:,.0f} trades/s (reducer + state serialization), '
+            f'{deep_size(candle)} bytes in memory and '
+            f'{len(json.dumps(candle))} bytes in the state store per open window'
+        )
@@ -0,0 +1,160 @@
+"""
+Compares the trades/sec of the batch OHLC builder and of the streaming
+reducers. That both give the same candles is checked by
+`tests/test_batch_ohlc.py`.
+
+The streaming side drives `init_ohlc_candle`, `update_ohlc_candle` and
+`merge_ohlc_candles` window by window in plain Python, once alone and once
+with the JSON serialization of the window state quixstreams does after every
+update. Neither includes RocksDB, so both are upper bounds for the streaming
+path.
+Run with `make benchmark-batch`. No broker is needed.
+"""
+import argparse
+import json
+import random
+from time import perf_counter
+from typing import Dict, List
+
+import pandas as pd
+from loguru import logger
+
+from batch_ohlc import (
+    TRADE_COLUMNS,
+    ohlc_candles_to_records,
+    rollup_ohlc_candles,
+    trades_to_ohlc_candles,
+)
+from ohlc_aggregator import (
+    copy_ohlc_candle,
+    fill_ohlc_candle_gaps,
+    init_ohlc_candle,
+    merge_ohlc_candles,
+    ohlc_candle_to_dict,
+    update_ohlc_candle,
+)
+
+def synthetic_trades(n_trades: int, n_products: int) -> List[Dict]:
+    timestamp_ms = 1_700_000_000_000
+    prices = [random.uniform(1, 70_000) for _ in range(n_products)]
+    # some products trade rarely, so they have windows without trades
+    products = random.choices(
+        range(n_products), weights=[1 / (i + 1) ** 3 for i in range(n_products)], k=n_trades
+    )
+    trades = []
+    for i in products:
+        prices[i] *= 1 + random.uniform(-1e-4, 1e-4)
+        timestamp_ms += random.randint(0, 100)
+        trades.append({
+            'product_id': f'PRODUCT{i}/USD',
+            'price': prices[i],
+            'volume': random.uniform(0.0001, 0.5),
+            'timestamp_ms': timestamp_ms,
+            'side': random.choice(['buy', 'sell']),
+        })
+    return trades
+
+
+class DictState(dict):
+    """
+    Stands in for the quixstreams state of one product.
+    """
+
+    def set(self, key, value):
+        self[key] = value
+
+
+def streaming_candles(
+    trades: List[Dict],
+    resolutions: List[int],
+    to_ms: int,
+    fill_gaps: bool,
+    serialize: bool = False,
+) -> Dict[int, List[Dict]]:
+    windows: Dict = {}
+    window_ms = resolutions[0] * 1000
+    for trade in trades:
+        key = (trade['product_id'], trade['timestamp_ms'] - trade['timestamp_ms'] % window_ms)
+        candle = windows.get(key)
+        candle = init_ohlc_candle(trade) if candle is None else update_ohlc_candle(candle, trade)
+        if serialize:
+            json.dumps(candle)
+        windows[key] = candle
+
+    candles = {resolutions[0]: windows}
+    for window_sec in resolutions[1:]:
+        window_ms = window_sec * 1000
+        coarser: Dict = {}
+        for (product_id, start), candle in sorted(windows.items()):
+            key = (product_id, start - start % window_ms)
+            state = coarser.get(key)
+            coarser[key] = copy_ohlc_candle(candle) if state is None else merge_ohlc_candles(state, candle)
+        candles[window_sec] = windows = coarser
+
+    published = {}
+    for window_sec, windows in candles.items():
+        states: Dict = {}
+        published[window_sec] = []
+        for (product_id, start), candle in sorted(windows.items()):
+            if start + window_sec * 1000 > to_ms:
+                continue
+            candle = ohlc_candle_to_dict(candle, start + window_sec * 1000)
+            if fill_gaps:
+                state = states.setdefault(product_id, DictState())
+                published[window_sec] += fill_ohlc_candle_gaps(candle, state, window_sec)
+            else:
+                published[window_sec].append(candle)
+        published[window_sec].sort(key=lambda c: (c['timestamp'], c['product_id']))
+
+    return published
+
+
+def batch_candles(
+    trades: pd.DataFrame, resolutions: List[int], to_ms: int, fill_gaps: bool
+) -> Dict[int, List[Dict]]:
+    candles = trades_to_ohlc_candles(trades, resolutions[0])
+    records = {
+        resolutions[0]: ohlc_candles_to_records(candles, resolutions[0], to_ms, fill_gaps)
+    }
+    for window_sec in resolutions[1:]:
+        candles = rollup_ohlc_candles(candles, window_sec)
+        records[window_sec] = ohlc_candles_to_records(candles, window_sec, to_ms, fill_gaps)
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-trades', type=int, default=2_000_000)
+    parser.add_argument('--n-products', type=int, default=10)
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[60, 300, 900, 3600])
+    parser.add_argument('--no-fill-gaps', dest='fill_gaps', action='store_false')
+    args = parser.parse_args()
+
+    trades = synthetic_trades(args.n_trades, args.n_products)
+    trades_df = pd.DataFrame(trades, columns=TRADE_COLUMNS)
+    to_ms = trades[-1]['timestamp_ms']
+
+    start = perf_counter()
+    streaming_candles(trades, args.resolutions, to_ms, args.fill_gaps)
+    streaming_sec = perf_counter() - start
+
+    start = perf_counter()
+    streaming_candles(trades, args.resolutions, to_ms, args.fill_gaps, serialize=True)
+    streaming_with_state_sec = perf_counter() - start
+
+    start = perf_counter()
+    actual = batch_candles(trades_df, args.resolutions, to_ms, args.fill_gaps)
+    batch_sec = perf_counter() - start
+
+    for window_sec in args.resolutions:
+        n_synthetic = sum(candle['is_synthetic'] for candle in actual[window_sec])
+        logger.info(f'{window_sec}s: {len(actual[window_sec])} candles, {n_synthetic} of them synthetic')
+
+    logger.info(f'streaming reducers:         {args.n_trades / streaming_sec:,.0f} trades/s')
+    logger.info(
+        f'streaming reducers + state: {args.n_trades / streaming_with_state_sec:,.0f} trades/s'
+    )
+    logger.info(
+        f'batch builder:              {args.n_trades / batch_sec:,.0f} trades/s '
+        f'({streaming_sec / batch_sec:.1f}x, {streaming_with_state_sec / batch_sec:.1f}x)'
+    )
@@ -0,0 +1,166 @@
+"""
+Trades/sec of 1 to N trade_to_ohlc instances sharing one consumer group, on a
+multi-partition trades topic in a local Redpanda.
+
+Start the broker first with `make start-redpanda` in `docker-compose/`, then run
+`make load-test` from this service. Synthetic trades for many products are
+produced once, keyed by product like `produce_trades` does. Then, for every
+instance count, fresh instances (each with its own consumer group name, output
+topic and state directory) consume the whole topic, and the time until the
+group has committed every offset is measured. Instance start-up is included
+in that time, so use enough trades for it to be small in comparison.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from confluent_kafka import TopicPartition
+from loguru import logger
+from quixstreams import Application
+from quixstreams.models import TopicConfig
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+
+def produce_trades(
+    app: Application, topic_name: str, n_partitions: int, n_trades: int, n_products: int
+) -> None:
+    topic = app.topic(
+        name=topic_name,
+        value_serializer='json',
+        config=TopicConfig(num_partitions=n_partitions, replication_factor=1),
+    )
+    timestamp_ms = 1_700_000_000_000
+    prices = [random.uniform(1, 70_000) for _ in range(n_products)]
+
+    with app.get_producer() as producer:
+        for _ in range(n_trades):
+            i = random.randrange(n_products)
+            prices[i] *= 1 + random.uniform(-1e-4, 1e-4)
+            timestamp_ms += random.randint(0, 20)
+            product_id = f'PRODUCT{i}/USD'
+            producer.produce(
+                topic=topic.name,
+                key=product_id,
+                value=json.dumps({
+                    'product_id': product_id,
+                    'price': prices[i],
+                    'volume': random.uniform(0.0001, 0.5),
+                    'timestamp_ms': timestamp_ms,
+                    'side': random.choice(['buy', 'sell']),
+                }),
+                timestamp=timestamp_ms,
+            )
+
+    logger.info(f'Produced {n_trades} trades for {n_products} products to {topic_name}')
+
+
+def end_offsets(app: Application, topic_name: str) -> Dict[int, int]:
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+        metadata = consumer.list_topics(topic=topic_name, timeout=10)
+        return {
+            partition: consumer.get_watermark_offsets(
+                TopicPartition(topic_name, partition), timeout=10
+            )[1]
+            for partition in metadata.topics[topic_name].partitions
+        }
+
+
+def run_instances(
+    broker_address: str,
+    topic_name: str,
+    targets: Dict[int, int],
+    n_instances: int,
+    ohlc_windows_seconds: int,
+    timeout_sec: float,
+) -> float:
+    run_id = f'{topic_name}_{n_instances}_{int(time.time())}'
+    consumer_group = f'load_test_{run_id}'
+    state_root = Path(tempfile.mkdtemp(prefix=f'{run_id}_'))
+
+    processes = []
+    start = time.perf_counter()
+    for i in range(n_instances):
+        env = {
+            **os.environ,
+            'KAFKA_BROKER_ADDRESS': broker_address,
+            'KAFKA_INPUT_TOPIC': topic_name,
+            'KAFKA_OUTPUT_TOPIC': f'ohlc_{run_id}',
+            'KAFKA_CONSUMER_GROUP': consumer_group,
+            'OHLC_WINDOWS_SECONDS': str(ohlc_windows_seconds),
+            'KAFKA_GROUP_INSTANCE_ID': f'{consumer_group}_{i}',
+            'STATE_DIR': str(state_root / str(i)),
+        }
+        processes.append(subprocess.Popen(
+            [sys.executable, 'src/main.py'],
+            cwd=SERVICE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ))
+
+    # only reads the offsets committed by the group, it never joins it
+    app = Application(broker_address=broker_address, consumer_group=consumer_group)
+    partitions = [TopicPartition(topic_name, partition) for partition in targets]
+
+    try:
+        with app.get_consumer(auto_commit_enable=False) as consumer:
+            while True:
+                committed = {
+                    tp.partition: tp.offset
+                    for tp in consumer.committed(partitions, timeout=10)
+                }
+                if all(committed[p] >= offset for p, offset in targets.items()):
+                    return time.perf_counter() - start
+                if time.perf_counter() - start > timeout_sec:
+                    raise TimeoutError(f'{n_instances} instances did not finish in {timeout_sec}s')
+                if any(process.poll() is not None for process in processes):
+                    raise RuntimeError(f'An instance of {n_instances} exited early')
+                time.sleep(0.5)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--broker-address', default='localhost:19092')
+    parser.add_argument('--n-partitions', type=int, default=8)
+    parser.add_argument('--n-trades', type=int, default=2_000_000)
+    parser.add_argument('--n-products', type=int, default=64)
+    parser.add_argument('--instances', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--ohlc-windows-seconds', type=int, default=60)
+    parser.add_argument('--timeout-sec', type=float, default=1800)
+    args = parser.parse_args()
+
+    app = Application(broker_address=args.broker_address)
+    topic_name = f'trade_load_test_{int(time.time())}'
+    produce_trades(app, topic_name, args.n_partitions, args.n_trades, args.n_products)
+    targets = {p: offset for p, offset in end_offsets(app, topic_name).items() if offset > 0}
+
+    baseline = None
+    for n_instances in args.instances:
+        elapsed = run_instances(
+            broker_address=args.broker_address,
+            topic_name=topic_name,
+            targets=targets,
+            n_instances=n_instances,
+            ohlc_windows_seconds=args.ohlc_windows_seconds,
+            timeout_sec=args.timeout_sec,
+        )
+        trades_per_sec = args.n_trades / elapsed
+        baseline = baseline or trades_per_sec / n_instances
+        logger.info(
+            f'{n_instances} instance(s): {trades_per_sec:,.0f} trades/s, '
+            f'{trades_per_sec / baseline:.2f}x ({trades_per_sec / baseline / n_instances:.0%} '
+            f'of linear)'
+        )
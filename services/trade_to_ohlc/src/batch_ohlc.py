@@ -0,0 +1,349 @@
+import json
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+TRADE_COLUMNS = ['product_id', 'price', 'volume', 'timestamp_ms', 'side']
+
+# same fields, in the same order, as `ohlc_candle_to_dict`
+CANDLE_COLUMNS = [
+    'timestamp',
+    'open',
+    'high',
+    'low',
+    'close',
+    'product_id',
+    'volume',
+    'vwap',
+    'trade_count',
+    'first_trade_ms',
+    'last_trade_ms',
+    'buy_volume',
+    'sell_volume',
+    'is_synthetic',
+]
+
+
+def read_trades_from_parquet(
+    path: str, from_ms: Optional[int] = None, to_ms: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Reads the trades of a local Parquet dump, in the order they were written.
+
+    Args:
+        path: The Parquet file or directory.
+        from_ms: Only trades at or after this timestamp, if given.
+        to_ms: Only trades before this timestamp, if given.
+    Returns:
+        The trades, with the `TRADE_COLUMNS` columns.
+    """
+    filters = []
+    if from_ms is not None:
+        filters.append(('timestamp_ms', '>=', from_ms))
+    if to_ms is not None:
+        filters.append(('timestamp_ms', '<', to_ms))
+
+    return pd.read_parquet(path, columns=TRADE_COLUMNS, filters=filters or None)
+
+
+def read_trades_from_topic(
+    app, topic_name: str, from_ms: Optional[int] = None, to_ms: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Reads the trades of a Kafka topic up to the end offsets it has when we
+    start, in partition order.
+
+    The partitions are assigned directly and no offsets are committed, so this
+    does not interfere with the streaming consumer group.
+
+    Args:
+        app: The quixstreams Application.
+        topic_name: The trades topic.
+        from_ms: Seek every partition to this timestamp, if given.
+        to_ms: Only trades before this timestamp, if given.
+    Returns:
+        The trades, with the `TRADE_COLUMNS` columns.
+    """
+    from confluent_kafka import OFFSET_BEGINNING, OFFSET_END, TopicPartition
+
+    columns = {column: [] for column in TRADE_COLUMNS}
+
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+        metadata = consumer.list_topics(topic=topic_name, timeout=10)
+        partitions = [
+            TopicPartition(topic_name, partition, OFFSET_BEGINNING)
+            for partition in metadata.topics[topic_name].partitions
+        ]
+        if from_ms is not None:
+            for partition in partitions:
+                partition.offset = from_ms
+            partitions = consumer.offsets_for_times(partitions, timeout=10)
+
+        # the offset of the last message to read, per partition
+        end_offsets = {}
+        for partition in partitions:
+            # no message at or after `from_ms` in this partition
+            if partition.offset == OFFSET_END:
+                continue
+            low, high = consumer.get_watermark_offsets(partition, timeout=10)
+            start = low if partition.offset == OFFSET_BEGINNING else partition.offset
+            if high > start:
+                end_offsets[partition.partition] = high - 1
+
+        consumer.assign([p for p in partitions if p.partition in end_offsets])
+
+        while end_offsets:
+            for msg in consumer.consume(num_messages=10_000, timeout=1):
+                if msg.error():
+                    logger.error(f'Error reading {topic_name}: {msg.error()}')
+                    continue
+
+                trade = json.loads(msg.value())
+                if to_ms is None or trade['timestamp_ms'] < to_ms:
+                    for column in TRADE_COLUMNS:
+                        columns[column].append(trade.get(column))
+
+                if msg.offset() >= end_offsets.get(msg.partition(), -1):
+                    end_offsets.pop(msg.partition(), None)
+
+    logger.info(f'Read {len(columns["price"])} trades from {topic_name}')
+    return pd.DataFrame(columns)
+
+
+def trades_to_ohlc_candles(trades: pd.DataFrame, window_sec: int) -> pd.DataFrame:
+    """
+    Aggregates trades into candles of `window_sec`, per product.
+
+    Open and close are the first and last trade of each window in the order of
+    `trades`, like in the streaming reducer.
+
+    Args:
+        trades: The trades, with the `TRADE_COLUMNS` columns.
+        window_sec: The candle resolution, in seconds.
+    Returns:
+        One row per product and window with the candle state, indexed by
+        `product_id` and `window_start`.
+    """
+    window_ms = window_sec * 1000
+    price = trades['price'].to_numpy(dtype=np.float64)
+    volume = trades['volume'].to_numpy(dtype=np.float64)
+    timestamp_ms = trades['timestamp_ms'].to_numpy(dtype=np.int64)
+
+    # grouping by one integer key is much faster than by the product_id strings
+    product_codes, product_ids = pd.factorize(trades['product_id'], sort=False)
+    # trades produced before `side` existed have None, which is neither
+    is_buy = trades['side'].eq('buy').to_numpy()
+    is_sell = trades['side'].eq('sell').to_numpy()
+    window_index = timestamp_ms // window_ms
+
+    frame = pd.DataFrame({
+        'key': window_index * len(product_ids) + product_codes,
+        'price': price,
+        'volume': volume,
+        'price_volume': price * volume,
+        'timestamp_ms': timestamp_ms,
+        'buy_volume': np.where(is_buy, volume, 0.0),
+        'sell_volume': np.where(is_sell, volume, 0.0),
+    })
+
+    candles = frame.groupby('key', sort=False).agg(
+        open=('price', 'first'),
+        high=('price', 'max'),
+        low=('price', 'min'),
+        close=('price', 'last'),
+        volume=('volume', 'sum'),
+        price_volume=('price_volume', 'sum'),
+        trade_count=('price', 'size'),
+        first_trade_ms=('timestamp_ms', 'min'),
+        last_trade_ms=('timestamp_ms', 'max'),
+        buy_volume=('buy_volume', 'sum'),
+        sell_volume=('sell_volume', 'sum'),
+    )
+
+    keys = candles.index.to_numpy()
+    candles.index = pd.MultiIndex.from_arrays(
+        [
+            np.asarray(product_ids)[keys % len(product_ids)],
+            keys // len(product_ids) * window_ms,
+        ],
+        names=['product_id', 'window_start'],
+    )
+    return candles
+
+
+def rollup_ohlc_candles(candles: pd.DataFrame, window_sec: int) -> pd.DataFrame:
+    """
+    Rolls candles from `trades_to_ohlc_candles` up into coarser candles of
+    `window_sec`, like `merge_ohlc_candles` does in the streaming path.
+    """
+    window_ms = window_sec * 1000
+    candles = candles.reset_index().sort_values(['product_id', 'window_start'], kind='stable')
+    candles['window_start'] -= candles['window_start'] % window_ms
+
+    return candles.groupby(['product_id', 'window_start'], sort=False).agg(
+        open=('open', 'first'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        close=('close', 'last'),
+        volume=('volume', 'sum'),
+        price_volume=('price_volume', 'sum'),
+        trade_count=('trade_count', 'sum'),
+        first_trade_ms=('first_trade_ms', 'min'),
+        last_trade_ms=('last_trade_ms', 'max'),
+        buy_volume=('buy_volume', 'sum'),
+        sell_volume=('sell_volume', 'sum'),
+    )
+
+
+def fill_ohlc_candle_gaps(candles: pd.DataFrame, window_sec: int) -> pd.DataFrame:
+    """
+    Adds a synthetic candle for every empty window between the first and the
+    last candle of each product, like `ohlc_aggregator.fill_ohlc_candle_gaps`
+    does in the streaming path.
+
+    Args:
+        candles: Candles with the `CANDLE_COLUMNS` columns, sorted by timestamp.
+        window_sec: The candle resolution, in seconds.
+    Returns:
+        The dense candles, sorted by timestamp and product.
+    """
+    window_ms = window_sec * 1000
+    dense = []
+    for product_id, product_candles in candles.groupby('product_id', sort=False):
+        timestamps = product_candles['timestamp'].to_numpy()
+        product_candles = product_candles.set_index('timestamp').reindex(
+            np.arange(timestamps[0], timestamps[-1] + 1, window_ms)
+        )
+        is_synthetic = product_candles['close'].isna()
+        if is_synthetic.any():
+            product_candles['product_id'] = product_id
+            product_candles['close'] = product_candles['close'].ffill()
+            product_candles['last_trade_ms'] = product_candles['last_trade_ms'].ffill()
+            for column in ['open', 'high', 'low', 'vwap']:
+                product_candles[column] = product_candles[column].fillna(product_candles['close'])
+            product_candles['first_trade_ms'] = product_candles['first_trade_ms'].fillna(
+                product_candles['last_trade_ms']
+            )
+            for column in ['volume', 'trade_count', 'buy_volume', 'sell_volume']:
+                product_candles[column] = product_candles[column].fillna(0)
+            product_candles['is_synthetic'] = is_synthetic
+        dense.append(product_candles.rename_axis('timestamp').reset_index())
+
+    dense = pd.concat(dense, ignore_index=True).astype({
+        'timestamp': 'int64',
+        'trade_count': 'int64',
+        'first_trade_ms': 'int64',
+        'last_trade_ms': 'int64',
+        'is_synthetic': 'bool',
+    })
+    return dense.sort_values(['timestamp', 'product_id'], kind='stable')[CANDLE_COLUMNS]
+
+
+def ohlc_candles_to_records(
+    candles: pd.DataFrame,
+    window_sec: int,
+    to_ms: Optional[int] = None,
+    fill_gaps: bool = False,
+) -> List[dict]:
+    """
+    Converts candle states into the messages the streaming path publishes,
+    ordered by window.
+
+    Args:
+        candles: The candle states.
+        window_sec: The candle resolution, in seconds.
+        to_ms: Drop the windows ending after this timestamp, which would still be
+            open in the streaming path.
+        fill_gaps: Whether to add synthetic candles for empty windows.
+    Returns:
+        The candles as dicts, in the format of `ohlc_candle_to_dict`.
+    """
+    candles = candles.reset_index()
+    candles['timestamp'] = candles['window_start'] + window_sec * 1000
+    if to_ms is not None:
+        candles = candles[candles['timestamp'] <= to_ms]
+    candles = candles.sort_values(['window_start', 'product_id'], kind='stable')
+
+    volume = candles['volume'].to_numpy()
+    candles['vwap'] = np.where(
+        volume != 0,
+        candles['price_volume'].to_numpy() / np.where(volume != 0, volume, 1),
+        candles['close'].to_numpy(),
+    )
+    candles['is_synthetic'] = False
+
+    if fill_gaps and not candles.empty:
+        candles = fill_ohlc_candle_gaps(candles, window_sec)
+
+    return candles[CANDLE_COLUMNS].to_dict('records')
+
+
+def build_ohlc_batch(
+    kafka_input_topic: str,
+    kafka_output_topic: str,
+    kafka_broker_address: str,
+    ohlc_windows_seconds: int,
+    ohlc_rollup_windows_seconds: List[int],
+    batch_trades_parquet_path: Optional[str] = None,
+    batch_from_ms: Optional[int] = None,
+    batch_to_ms: Optional[int] = None,
+    ohlc_fill_gaps: bool = True,
+) -> None:
+    """
+    Builds the candles of a range of historical trades in one vectorized pass
+    and writes them to the same topics as `trade_to_ohlc`, without streaming
+    windows or state.
+
+    The trades are expected to be time-ordered per product: unlike the
+    streaming path, late trades are not dropped.
+
+    Args:
+        kafka_input_topic: The Kafka topic to read trades from, unless
+            `batch_trades_parquet_path` is given.
+        kafka_output_topic: The Kafka topic to write the base candles to.
+        kafka_broker_address: The Kafka broker address.
+        ohlc_windows_seconds: The base candle resolution, in seconds.
+        ohlc_rollup_windows_seconds: The coarser resolutions, see `trade_to_ohlc`.
+        batch_trades_parquet_path: A local Parquet dump of trades to read
+            instead of the topic.
+        batch_from_ms: The start of the trade range, if given.
+        batch_to_ms: The end of the trade range, if given. Defaults to the last
+            trade, and windows ending after it are not emitted.
+        ohlc_fill_gaps: Whether to emit synthetic candles for empty windows.
+    """
+    from quixstreams import Application
+
+    app = Application(broker_address=kafka_broker_address)
+
+    if batch_trades_parquet_path:
+        trades = read_trades_from_parquet(batch_trades_parquet_path, batch_from_ms, batch_to_ms)
+    else:
+        trades = read_trades_from_topic(app, kafka_input_topic, batch_from_ms, batch_to_ms)
+
+    if trades.empty:
+        logger.info('No trades in range, nothing to do')
+        return
+
+    to_ms = batch_to_ms if batch_to_ms is not None else int(trades['timestamp_ms'].max())
+
+    candles = trades_to_ohlc_candles(trades, ohlc_windows_seconds)
+    resolutions = [(kafka_output_topic, ohlc_windows_seconds, candles)]
+    for window_sec in ohlc_rollup_windows_seconds:
+        candles = rollup_ohlc_candles(candles, window_sec)
+        resolutions.append((f'{kafka_output_topic}_{window_sec}s', window_sec, candles))
+
+    with app.get_producer() as producer:
+        for topic_name, window_sec, candles in resolutions:
+            topic = app.topic(name=topic_name, value_serializer='json')
+            records = ohlc_candles_to_records(candles, window_sec, to_ms, ohlc_fill_gaps)
+            for record in records:
+                message = topic.serialize(key=record['product_id'], value=record)
+                producer.produce(
+                    topic=topic.name,
+                    value=message.value,
+                    key=message.key,
+                    timestamp=record['timestamp'] - window_sec * 1000,
+                )
+            logger.info(f'Produced {len(records)} candles to {topic_name}')
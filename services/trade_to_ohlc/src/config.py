@@ -1,7 +1,8 @@
 from pydantic_settings import BaseSettings
 import os
 from dotenv import load_dotenv, find_dotenv
-from typing import Optional
+from pydantic import field_validator
+from typing import List, Optional
 
 load_dotenv(find_dotenv())
 
@@ -10,6 +11,34 @@ class Config(BaseSettings):
     kafka_output_topic: str = os.environ.get('KAFKA_OUTPUT_TOPIC')
     kafka_broker_address:Optional[str] = None
     ohlc_windows_seconds: int = os.environ['OHLC_WINDOWS_SECONDS']
+    # OHLC_ROLLUP_WINDOWS_SECONDS must be a JSON list, e.g. '[300, 900, 3600]'
+    ohlc_rollup_windows_seconds: List[int] = []
     kafka_consumer_group: str = os.environ.get('KAFKA_CONSUMER_GROUP')
+    ohlc_fill_gaps: bool = os.environ.get('OHLC_FILL_GAPS', True)
+    state_dir: str = os.environ.get('STATE_DIR', 'state')
+    kafka_commit_interval_sec: float = os.environ.get('KAFKA_COMMIT_INTERVAL_SEC', 5.0)
+    kafka_group_instance_id: Optional[str] = os.environ.get('KAFKA_GROUP_INSTANCE_ID')
+    kafka_session_timeout_ms: int = os.environ.get('KAFKA_SESSION_TIMEOUT_MS', 45_000)
+    ohlc_gap_tick_interval_sec: float = os.environ.get('OHLC_GAP_TICK_INTERVAL_SEC', 5.0)
+    ohlc_mode: str = os.environ.get('OHLC_MODE', 'stream')
+    batch_trades_parquet_path: Optional[str] = os.environ.get('BATCH_TRADES_PARQUET_PATH')
+    batch_from_ms: Optional[int] = os.environ.get('BATCH_FROM_MS')
+    batch_to_ms: Optional[int] = os.environ.get('BATCH_TO_MS')
 
-config = Config()
\ No newline at end of file
+    @field_validator('ohlc_rollup_windows_seconds')
+    @classmethod
+    def validate_ohlc_rollup_windows_seconds(cls, v: List[int], info) -> List[int]:
+        finer = info.data['ohlc_windows_seconds']
+        for window_sec in v:
+            assert window_sec > finer and window_sec % finer == 0, \
+                f'Rollup windows must be increasing multiples of each other: {v}'
+            finer = window_sec
+        return v
+
+    @field_validator('ohlc_mode')
+    @classmethod
+    def validate_ohlc_mode(cls, v: str) -> str:
+        assert v in ['stream', 'batch'], f'Invalid ohlc_mode value: {v}'
+        return v
+
+config = Config()
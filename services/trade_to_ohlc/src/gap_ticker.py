@@ -0,0 +1,137 @@
+import threading
+import uuid
+from time import monotonic
+from typing import Callable, Dict, List
+
+from loguru import logger
+
+
+def is_gap_tick(value: Dict) -> bool:
+    """
+    Tells a gap tick from a trade: ticks have no price.
+    """
+    return 'price' not in value
+
+
+class GapTicker:
+    """
+    Sends a gap tick for every product of the partitions this instance reads,
+    every `interval_sec`, to a topic partitioned like the trades.
+
+    A window only closes when a later message of the same product arrives, so
+    without ticks the synthetic candles of a product that stopped trading wait
+    for its next trade. A tick goes through the same windows as the trades and
+    closes them like a trade would, without adding to any candle. A window
+    that only got ticks becomes a synthetic candle.
+
+    The tick of a product is timestamped with the event time of its own last
+    trade, plus the wall-clock time since that trade was read, but never later
+    than the latest trade read from its partition. So a tick only closes
+    windows the producer has already sent later trades for, and the ticks stop
+    advancing while the producer sends nothing, e.g. while it is disconnected.
+    The trades and the ticks are consumed in timestamp order, so a tick is
+    only processed once the trades before it have been.
+
+    An instance only processes its own ticks. The ticks of a partition that was
+    moved to another instance are dropped there, and are no longer sent once
+    the partition has been idle for `idle_timeout_sec`. After a restart, a
+    product is ticked again once one of its trades is read.
+    """
+
+    def __init__(
+        self,
+        interval_sec: float,
+        idle_timeout_sec: float = 60.0,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.interval_sec = interval_sec
+        self.idle_timeout_sec = idle_timeout_sec
+        self.ticker_id = uuid.uuid4().hex
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        # per partition: the latest trade timestamp, and when the partition
+        # was last read
+        self._partitions: Dict[int, List] = {}
+        # per partition and product: the timestamp of the last trade of the
+        # product, and when it was read
+        self._products: Dict[int, Dict[str, List]] = {}
+
+    def is_own(self, value: Dict) -> bool:
+        """
+        Keeps the trades and the ticks of this instance.
+        """
+        return not is_gap_tick(value) or value['ticker_id'] == self.ticker_id
+
+    def observe(self, value: Dict, partition: int) -> None:
+        """
+        Records a trade or a tick read from `partition`. Called from the
+        processing thread.
+        """
+        now = self._clock()
+        with self._lock:
+            partition_state = self._partitions.get(partition)
+            if is_gap_tick(value):
+                if partition_state is not None:
+                    partition_state[1] = now
+                return
+            if partition_state is None:
+                partition_state = self._partitions[partition] = [value['timestamp_ms'], now]
+                self._products[partition] = {}
+            partition_state[0] = max(partition_state[0], value['timestamp_ms'])
+            partition_state[1] = now
+
+            product = self._products[partition].get(value['product_id'])
+            if product is None:
+                self._products[partition][value['product_id']] = [value['timestamp_ms'], now]
+            elif value['timestamp_ms'] >= product[0]:
+                product[0] = value['timestamp_ms']
+                product[1] = now
+
+    def ticks(self) -> List[Dict]:
+        """
+        Returns the ticks to send now, with their partition, and forgets the
+        partitions idle for longer than `idle_timeout_sec`. A product gets no
+        tick while it would not be later than its last trade.
+        """
+        now = self._clock()
+        ticks = []
+        with self._lock:
+            for partition, (latest_ms, last_read_at) in list(self._partitions.items()):
+                if now - last_read_at > self.idle_timeout_sec:
+                    logger.info(f'Partition {partition} is idle, no more gap ticks for it')
+                    del self._partitions[partition]
+                    del self._products[partition]
+                    continue
+                for product_id, (timestamp_ms, read_at) in self._products[partition].items():
+                    tick_ms = min(timestamp_ms + int((now - read_at) * 1000), latest_ms)
+                    if tick_ms > timestamp_ms:
+                        ticks.append({
+                            'product_id': product_id,
+                            'timestamp_ms': tick_ms,
+                            'ticker_id': self.ticker_id,
+                            'partition': partition,
+                        })
+        return ticks
+
+    def run(self, producer, topic, stop: threading.Event) -> None:
+        """
+        Sends the ticks every `interval_sec` until `stop` is set.
+
+        Args:
+            producer: A quixstreams producer.
+            topic: The quixstreams topic of the ticks.
+            stop: Set to stop ticking.
+        """
+        with producer:
+            while not stop.wait(self.interval_sec):
+                for tick in self.ticks():
+                    message = topic.serialize(key=tick['product_id'], value=tick)
+                    producer.produce(
+                        topic=topic.name,
+                        key=message.key,
+                        value=message.value,
+                        partition=tick['partition'],
+                        timestamp=tick['timestamp_ms'],
+                    )
+                producer.flush()
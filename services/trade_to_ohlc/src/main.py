@@ -1,7 +1,16 @@
+import threading
 from datetime import timedelta
-from config import config
 from loguru import logger
-from typing import Dict, Any
+from typing import Any, List, Optional
+from gap_ticker import GapTicker
+from ohlc_aggregator import (
+    copy_ohlc_candle,
+    fill_ohlc_candle_gaps,
+    init_ohlc_candle,
+    merge_ohlc_candles,
+    ohlc_candle_to_dict,
+    update_ohlc_candle,
+)
 
 def custom_timestamp_extractor(
     value: Any,
@@ -11,52 +20,171 @@ def custom_timestamp_extractor(
 ) -> int:
     return value['timestamp_ms']
 
-def init_ohlc_candle(value: Dict) -> Dict:
-    return {
-        'open': value['price'],
-        'high': value['price'],
-        'low': value['price'],
-        'close': value['price'],
-        'product_id': value['product_id'],
-    }
-
-def update_ohlc_candle(ohlc_candle: Dict, trade: Dict) -> Dict:
-    return {
-        'open': ohlc_candle['open'],
-        'high': max(ohlc_candle['high'], trade['price']),
-        'low': min(ohlc_candle['low'], trade['price']),
-        'close': trade['price'],
-        'product_id': trade['product_id'],
-    }
-
 def trade_to_ohlc(
     kafka_input_topic: str,
     kafka_output_topic: str,
     kafka_broker_address: str,
     ohlc_windows_seconds: int,
     kafka_consumer_group: str,
+    ohlc_rollup_windows_seconds: List[int] = [],
+    ohlc_fill_gaps: bool = True,
+    state_dir: str = 'state',
+    kafka_commit_interval_sec: float = 5.0,
+    kafka_group_instance_id: Optional[str] = None,
+    kafka_session_timeout_ms: int = 45_000,
+    ohlc_gap_tick_interval_sec: float = 5.0,
 ) -> None:
     """
     Converts trades to OHLCs.
+
+    Candles of `ohlc_windows_seconds` are built from the trades and written to
+    `kafka_output_topic`. Each of the `ohlc_rollup_windows_seconds` is rolled up
+    from the closed candles of the previous (finer) resolution instead of from
+    the trades, and written to `{kafka_output_topic}_{window_sec}s`, so the
+    trades topic is read and deserialized only once.
+
+    See `add_ohlc_pipeline` for the candles.
+
+    Args:
+        kafka_input_topic: The Kafka topic to read trades from.
+        kafka_output_topic: The Kafka topic to write the base candles to.
+        kafka_broker_address: The Kafka broker address.
+        ohlc_windows_seconds: The base candle resolution, in seconds.
+        kafka_consumer_group: The Kafka consumer group.
+        ohlc_rollup_windows_seconds: The coarser resolutions, in increasing order,
+            each a multiple of the previous one.
+        ohlc_fill_gaps: Whether to emit synthetic candles for empty windows.
+        state_dir: Where the window state is kept. On a persistent volume, a
+            restarted instance only replays the changelog written since its
+            last commit instead of the whole changelog.
+        kafka_commit_interval_sec: How often offsets and state are committed.
+        kafka_group_instance_id: A stable, unique ID per instance (e.g. the pod
+            name) for static group membership: a restart within the session
+            timeout gets its partitions back without a rebalance.
+        kafka_session_timeout_ms: How long the broker waits for a lost instance
+            before its partitions are reassigned.
+        ohlc_gap_tick_interval_sec: How often the windows of products without
+            trades are closed with gap ticks, when filling gaps. 0 disables the
+            ticks, so gaps are only filled by the next trade of the product.
     """
 
     from quixstreams import Application
 
+    consumer_extra_config = {'session.timeout.ms': kafka_session_timeout_ms}
+    if kafka_group_instance_id:
+        consumer_extra_config['group.instance.id'] = kafka_group_instance_id
+
     app = Application(
         broker_address=kafka_broker_address,
         consumer_group=kafka_consumer_group,
-        auto_offset_reset="earliest"
+        auto_offset_reset="earliest",
+        state_dir=state_dir,
+        commit_interval=kafka_commit_interval_sec,
+        consumer_extra_config=consumer_extra_config,
+    )
+
+    gap_ticker = None
+    if ohlc_fill_gaps and ohlc_gap_tick_interval_sec > 0:
+        gap_ticker = GapTicker(
+            interval_sec=ohlc_gap_tick_interval_sec,
+            idle_timeout_sec=kafka_session_timeout_ms / 1000,
+        )
+
+    gap_tick_topic = add_ohlc_pipeline(
+        app,
+        kafka_input_topic,
+        kafka_output_topic,
+        ohlc_windows_seconds,
+        ohlc_rollup_windows_seconds,
+        ohlc_fill_gaps,
+        gap_ticker,
     )
 
+    if gap_ticker is None:
+        app.run()
+        return
+
+    stop_ticks = threading.Event()
+    ticks = threading.Thread(
+        target=gap_ticker.run,
+        args=(app.get_producer(), gap_tick_topic, stop_ticks),
+        name='gap-ticker',
+        daemon=True,
+    )
+    ticks.start()
+    try:
+        app.run()
+    finally:
+        stop_ticks.set()
+        ticks.join()
+
+def add_ohlc_pipeline(
+    app,
+    kafka_input_topic: str,
+    kafka_output_topic: str,
+    ohlc_windows_seconds: int,
+    ohlc_rollup_windows_seconds: List[int],
+    ohlc_fill_gaps: bool,
+    gap_ticker: Optional[GapTicker] = None,
+):
+    """
+    Adds the dataframes that turn the trades of `kafka_input_topic` into
+    candles to `app`.
+
+    With `ohlc_fill_gaps`, a window without trades gets a flat candle at the
+    previous close, flagged with `is_synthetic`, so every resolution is a dense
+    series. Rollups are built from the real candles only.
+
+    The synthetic candles are emitted when the window after them closes. With a
+    `gap_ticker`, its ticks, read from `{kafka_output_topic}_gap_ticks`, close
+    the windows of quiet products every `interval_sec`. Without it, they wait
+    for the next trade of the product.
+
+    Returns:
+        The topic of the gap ticks, or None without a `gap_ticker`.
+    """
+    from quixstreams.context import message_context
+    from quixstreams.models import TopicConfig
+
     input_topic = app.topic(
         name=kafka_input_topic,
         value_deserializer='json',
         timestamp_extractor=custom_timestamp_extractor
     )
-    output_topic = app.topic(name=kafka_output_topic, value_serializer='json')
+
+    # trades are keyed by product, so all the state of a product lives in one
+    # partition. Candles keep the same key, and their topics get as many
+    # partitions as the trades topic, so every instance owns the same products
+    # end to end.
+    output_topic_config = TopicConfig(
+        num_partitions=input_topic.broker_config.num_partitions,
+        replication_factor=input_topic.broker_config.replication_factor,
+    )
 
     sdf = app.dataframe(input_topic)
 
+    gap_tick_topic = None
+    if gap_ticker is not None:
+        # ticks must land in the partition of their product, and old ones are
+        # useless
+        gap_tick_topic = app.topic(
+            name=f'{kafka_output_topic}_gap_ticks',
+            key_serializer='str',
+            value_serializer='json',
+            value_deserializer='json',
+            timestamp_extractor=custom_timestamp_extractor,
+            config=TopicConfig(
+                num_partitions=input_topic.broker_config.num_partitions,
+                replication_factor=input_topic.broker_config.replication_factor,
+                extra_config={'retention.ms': str(3_600_000)},
+            ),
+        )
+        # the two topics are consumed in timestamp order, and the window state
+        # moves to a store of the merged dataframe
+        sdf = sdf.concat(app.dataframe(gap_tick_topic))
+        sdf = sdf.filter(gap_ticker.is_own)
+        sdf = sdf.update(lambda value: gap_ticker.observe(value, message_context().partition))
+
     # Apply transformation
     # Add a small grace period to handle slightly late data without delaying window closure
     grace_period_ms = timedelta(seconds=10)
@@ -64,31 +192,94 @@ def trade_to_ohlc(
         duration_ms=timedelta(seconds=ohlc_windows_seconds),
         grace_ms=grace_period_ms
     )
-    sdf = sdf.reduce(reducer=update_ohlc_candle, initializer=init_ohlc_candle).final()
+    windows = sdf.reduce(reducer=update_ohlc_candle, initializer=init_ohlc_candle).final()
+    publish_candles(
+        windows,
+        app.topic(name=kafka_output_topic, value_serializer='json', config=output_topic_config),
+        ohlc_windows_seconds,
+        ohlc_fill_gaps,
+    )
 
-    sdf['open'] = sdf['value']['open']
-    sdf['high'] = sdf['value']['high']
-    sdf['low'] = sdf['value']['low']
-    sdf['close'] = sdf['value']['close']
-    sdf['product_id'] = sdf['value']['product_id']
-    sdf['timestamp'] = sdf['end']
+    for window_sec in ohlc_rollup_windows_seconds:
+        # closed windows are timestamped with their start, so every finer candle
+        # falls into the coarser window it belongs to. They are final and come in
+        # order per product, so the coarser window needs no grace period.
+        windows = windows.apply(lambda window: window['value'])
+        windows = windows.tumbling_window(
+            duration_ms=timedelta(seconds=window_sec),
+            name=f'ohlc_{window_sec}s',
+        )
+        windows = windows.reduce(reducer=merge_ohlc_candles, initializer=copy_ohlc_candle).final()
+        publish_candles(
+            windows,
+            app.topic(
+                name=f'{kafka_output_topic}_{window_sec}s',
+                value_serializer='json',
+                config=output_topic_config,
+            ),
+            window_sec,
+            ohlc_fill_gaps,
+        )
 
-    # keep only relevant values
-    sdf = sdf[['timestamp','open', 'high', 'low', 'close', 'product_id']]
+    return gap_tick_topic
+
+def publish_candles(windows, output_topic, window_sec: int, fill_gaps: bool) -> None:
+    """
+    Writes the candles of closed windows to the output topic, as a new branch of
+    the `windows` dataframe.
+    """
+    # the candle is timestamped with the end of the window
+    sdf = windows.apply(lambda window: ohlc_candle_to_dict(window['value'], window['end']))
+
+    if not fill_gaps:
+        # drop the windows that only got gap ticks
+        sdf = sdf.filter(lambda candle: candle['trade_count'])
+    else:
+        sdf = sdf.apply(
+            lambda candle, state: fill_ohlc_candle_gaps(candle, state, window_sec),
+            stateful=True,
+            expand=True,
+        )
+        # like the real candles, the message is timestamped with the window start
+        sdf = sdf.set_timestamp(
+            lambda candle, key, timestamp, headers: candle['timestamp'] - window_sec * 1000
+        )
 
     # Print the result
     sdf = sdf.update(logger.info)
-    
-    sdf = sdf.to_topic(output_topic)
-    
 
-    app.run(sdf)
+    sdf.to_topic(output_topic)
 
 if __name__ == '__main__':
+    from config import config
+
+    if config.ohlc_mode == 'batch':
+        from batch_ohlc import build_ohlc_batch
+
+        build_ohlc_batch(
+            kafka_input_topic=config.kafka_input_topic,
+            kafka_output_topic=config.kafka_output_topic,
+            kafka_broker_address=config.kafka_broker_address,
+            ohlc_windows_seconds=config.ohlc_windows_seconds,
+            ohlc_rollup_windows_seconds=config.ohlc_rollup_windows_seconds,
+            batch_trades_parquet_path=config.batch_trades_parquet_path,
+            batch_from_ms=config.batch_from_ms,
+            batch_to_ms=config.batch_to_ms,
+            ohlc_fill_gaps=config.ohlc_fill_gaps,
+        )
+        raise SystemExit
+
     trade_to_ohlc(
         kafka_input_topic=config.kafka_input_topic,
         kafka_output_topic=config.kafka_output_topic,
         kafka_broker_address=config.kafka_broker_address,
         ohlc_windows_seconds=config.ohlc_windows_seconds,
         kafka_consumer_group=config.kafka_consumer_group,
+        ohlc_rollup_windows_seconds=config.ohlc_rollup_windows_seconds,
+        ohlc_fill_gaps=config.ohlc_fill_gaps,
+        state_dir=config.state_dir,
+        kafka_commit_interval_sec=config.kafka_commit_interval_sec,
+        kafka_group_instance_id=config.kafka_group_instance_id,
+        kafka_session_timeout_ms=config.kafka_session_timeout_ms,
+        ohlc_gap_tick_interval_sec=config.ohlc_gap_tick_interval_sec,
     )
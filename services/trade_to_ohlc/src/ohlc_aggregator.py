@@ -0,0 +1,245 @@
+from typing import Any, Dict, List
+
+# The candle of an open window is a flat list instead of a dict: it is updated
+# in place for every trade, and it is what quixstreams serializes into the
+# window state store, so no field names are repeated in every state write.
+OPEN = 0
+HIGH = 1
+LOW = 2
+CLOSE = 3
+VOLUME = 4
+PRICE_VOLUME = 5
+TRADE_COUNT = 6
+FIRST_TRADE_MS = 7
+LAST_TRADE_MS = 8
+BUY_VOLUME = 9
+SELL_VOLUME = 10
+PRODUCT_ID = 11
+
+
+def init_ohlc_candle(trade: Dict) -> List[Any]:
+    """
+    Creates the candle state of a window from its first trade.
+
+    A window opened by a gap tick (see `gap_ticker`) has no trades yet: its
+    candle is empty, with a trade count of 0 and no prices.
+    """
+    price = trade.get('price')
+    if price is None:
+        return [None, None, None, None, 0.0, 0.0, 0, None, None, 0.0, 0.0, trade['product_id']]
+    volume = trade['volume']
+    side = trade.get('side')
+    return [
+        price,
+        price,
+        price,
+        price,
+        volume,
+        price * volume,
+        1,
+        trade['timestamp_ms'],
+        trade['timestamp_ms'],
+        volume if side == 'buy' else 0.0,
+        volume if side == 'sell' else 0.0,
+        trade['product_id'],
+    ]
+
+
+def update_ohlc_candle(candle: List[Any], trade: Dict) -> List[Any]:
+    """
+    Adds a trade to the candle state, in place. Gap ticks leave it unchanged.
+    """
+    price = trade.get('price')
+    if price is None:
+        return candle
+    if not candle[TRADE_COUNT]:
+        candle[:] = init_ohlc_candle(trade)
+        return candle
+
+    volume = trade['volume']
+    timestamp_ms = trade['timestamp_ms']
+
+    if price > candle[HIGH]:
+        candle[HIGH] = price
+    elif price < candle[LOW]:
+        candle[LOW] = price
+    candle[CLOSE] = price
+
+    candle[VOLUME] += volume
+    candle[PRICE_VOLUME] += price * volume
+    candle[TRADE_COUNT] += 1
+
+    if timestamp_ms < candle[FIRST_TRADE_MS]:
+        candle[FIRST_TRADE_MS] = timestamp_ms
+    elif timestamp_ms > candle[LAST_TRADE_MS]:
+        candle[LAST_TRADE_MS] = timestamp_ms
+
+    side = trade.get('side')
+    if side == 'buy':
+        candle[BUY_VOLUME] += volume
+    elif side == 'sell':
+        candle[SELL_VOLUME] += volume
+
+    return candle
+
+
+def ohlc_candle_to_dict(candle: List[Any], timestamp: int) -> Dict:
+    """
+    Converts the candle state of a closed window into the message we publish.
+
+    The candle of a window without trades only keeps its timestamp, product
+    and trade count of 0: `fill_ohlc_candle_gaps` turns it into a synthetic
+    candle, and it is dropped when gaps are not filled.
+
+    Args:
+        candle: The candle state.
+        timestamp: The end of the window, in milliseconds.
+    Returns:
+        The candle as a dict.
+    """
+    if not candle[TRADE_COUNT]:
+        return {'timestamp': timestamp, 'product_id': candle[PRODUCT_ID], 'trade_count': 0}
+
+    volume = candle[VOLUME]
+    return {
+        'timestamp': timestamp,
+        'open': candle[OPEN],
+        'high': candle[HIGH],
+        'low': candle[LOW],
+        'close': candle[CLOSE],
+        'product_id': candle[PRODUCT_ID],
+        'volume': volume,
+        'vwap': candle[PRICE_VOLUME] / volume if volume else candle[CLOSE],
+        'trade_count': candle[TRADE_COUNT],
+        'first_trade_ms': candle[FIRST_TRADE_MS],
+        'last_trade_ms': candle[LAST_TRADE_MS],
+        'buy_volume': candle[BUY_VOLUME],
+        'sell_volume': candle[SELL_VOLUME],
+        'is_synthetic': False,
+    }
+
+
+def synthetic_ohlc_candle(previous: Dict, timestamp: int) -> Dict:
+    """
+    Creates the flat candle of a window without trades, at the close of the
+    previous candle of the same product.
+
+    Args:
+        previous: The previous candle, as returned by `ohlc_candle_to_dict`.
+        timestamp: The end of the empty window, in milliseconds.
+    Returns:
+        The synthetic candle, flagged with `is_synthetic`.
+    """
+    close = previous['close']
+    return {
+        'timestamp': timestamp,
+        'open': close,
+        'high': close,
+        'low': close,
+        'close': close,
+        'product_id': previous['product_id'],
+        'volume': 0.0,
+        'vwap': close,
+        'trade_count': 0,
+        'first_trade_ms': previous['last_trade_ms'],
+        'last_trade_ms': previous['last_trade_ms'],
+        'buy_volume': 0.0,
+        'sell_volume': 0.0,
+        'is_synthetic': True,
+    }
+
+
+def fill_ohlc_candle_gaps(candle: Dict, state, window_sec: int) -> List[Dict]:
+    """
+    Returns the candle, preceded by a synthetic candle for every empty window
+    since the previous candle of the same product.
+
+    The previous candle is kept in the state of the product, so gaps are filled
+    across restarts too. A candle without trades, closed by gap ticks, is
+    replaced by a synthetic one, so quiet products get their synthetic candles
+    without waiting for their next trade.
+
+    Args:
+        candle: The candle of a closed window, from `ohlc_candle_to_dict`.
+        state: The quixstreams state of the product.
+        window_sec: The candle resolution, in seconds.
+    Returns:
+        The candles to publish, in order.
+    """
+    state_key = f'last_ohlc_candle_{window_sec}s'
+    previous = state.get(state_key)
+
+    if not candle['trade_count']:
+        if previous is None or candle['timestamp'] <= previous['timestamp']:
+            return []
+        candles = [
+            synthetic_ohlc_candle(previous, timestamp)
+            for timestamp in range(
+                previous['timestamp'] + window_sec * 1000,
+                candle['timestamp'] + 1,
+                window_sec * 1000,
+            )
+        ]
+        state.set(state_key, {**previous, 'timestamp': candle['timestamp']})
+        return candles
+
+    candles = []
+    if previous is not None:
+        candles = [
+            synthetic_ohlc_candle(previous, timestamp)
+            for timestamp in range(
+                previous['timestamp'] + window_sec * 1000,
+                candle['timestamp'],
+                window_sec * 1000,
+            )
+        ]
+    candles.append(candle)
+
+    if previous is None or candle['timestamp'] > previous['timestamp']:
+        state.set(state_key, {
+            'timestamp': candle['timestamp'],
+            'close': candle['close'],
+            'last_trade_ms': candle['last_trade_ms'],
+            'product_id': candle['product_id'],
+        })
+
+    return candles
+
+
+def copy_ohlc_candle(candle: List[Any]) -> List[Any]:
+    """
+    Creates the candle state of a coarser window from its first finer candle.
+    """
+    return list(candle)
+
+
+def merge_ohlc_candles(candle: List[Any], other: List[Any]) -> List[Any]:
+    """
+    Adds the candle of a finer, later window to the candle state of a coarser
+    window, in place. Finer candles without trades leave it unchanged.
+    """
+    if not other[TRADE_COUNT]:
+        return candle
+    if not candle[TRADE_COUNT]:
+        candle[:] = other
+        return candle
+
+    if other[HIGH] > candle[HIGH]:
+        candle[HIGH] = other[HIGH]
+    if other[LOW] < candle[LOW]:
+        candle[LOW] = other[LOW]
+    candle[CLOSE] = other[CLOSE]
+
+    candle[VOLUME] += other[VOLUME]
+    candle[PRICE_VOLUME] += other[PRICE_VOLUME]
+    candle[TRADE_COUNT] += other[TRADE_COUNT]
+
+    if other[FIRST_TRADE_MS] < candle[FIRST_TRADE_MS]:
+        candle[FIRST_TRADE_MS] = other[FIRST_TRADE_MS]
+    if other[LAST_TRADE_MS] > candle[LAST_TRADE_MS]:
+        candle[LAST_TRADE_MS] = other[LAST_TRADE_MS]
+
+    candle[BUY_VOLUME] += other[BUY_VOLUME]
+    candle[SELL_VOLUME] += other[SELL_VOLUME]
+
+    return candle
@@ -0,0 +1,112 @@
+"""
+Runs the streaming pipeline of `main.add_ohlc_pipeline` without a broker.
+
+The topics are described by a fake admin, the trades and gap ticks are fed
+one by one to the composed dataframes of a real quixstreams Application, with
+its RocksDB window state, and the producer collects the candles instead of
+sending them.
+"""
+import json
+from collections import defaultdict
+from contextvars import copy_context
+from typing import Callable, Dict, List, Optional
+
+import pytest
+from quixstreams import Application
+from quixstreams.context import set_message_context
+from quixstreams.models import TopicConfig
+from quixstreams.models.messagecontext import MessageContext
+from quixstreams.models.topics.admin import TopicAdmin
+
+from gap_ticker import GapTicker, is_gap_tick
+from main import add_ohlc_pipeline
+
+INPUT_TOPIC = 'trade'
+OUTPUT_TOPIC = 'ohlc'
+GAP_TICK_TOPIC = f'{OUTPUT_TOPIC}_gap_ticks'
+
+TOPIC_CONFIG = TopicConfig(
+    num_partitions=1,
+    replication_factor=1,
+    extra_config={'retention.ms': '-1', 'retention.bytes': '-1'},
+)
+
+
+@pytest.fixture
+def run_ohlc_pipeline(monkeypatch, tmp_path) -> Callable:
+    """
+    Returns a function that runs trades and gap ticks, in order, through the
+    streaming pipeline and returns the candles it publishes, per resolution, in
+    publish order.
+    """
+    monkeypatch.setattr(
+        TopicAdmin,
+        'inspect_topics',
+        lambda self, topic_names, timeout=30: {name: TOPIC_CONFIG for name in topic_names},
+    )
+    monkeypatch.setattr(TopicAdmin, 'create_topics', lambda self, *args, **kwargs: None)
+
+    def run(
+        messages: List[Dict],
+        ohlc_windows_seconds: int,
+        ohlc_rollup_windows_seconds: List[int] = [],
+        ohlc_fill_gaps: bool = True,
+        gap_ticker: Optional[GapTicker] = None,
+    ) -> Dict[int, List[Dict]]:
+        app = Application(
+            broker_address='localhost:9092',
+            consumer_group='test',
+            state_dir=str(tmp_path / 'state'),
+            use_changelog_topics=False,
+        )
+        add_ohlc_pipeline(
+            app,
+            INPUT_TOPIC,
+            OUTPUT_TOPIC,
+            ohlc_windows_seconds,
+            ohlc_rollup_windows_seconds,
+            ohlc_fill_gaps,
+            gap_ticker,
+        )
+
+        topics = {OUTPUT_TOPIC: ohlc_windows_seconds}
+        topics.update({
+            f'{OUTPUT_TOPIC}_{window_sec}s': window_sec
+            for window_sec in ohlc_rollup_windows_seconds
+        })
+        candles = defaultdict(list)
+
+        def produce(topic, value=None, key=None, headers=None, partition=None, timestamp=None, **kwargs):
+            candles[topics[topic]].append(json.loads(value))
+
+        monkeypatch.setattr(app._producer, 'produce', produce)
+
+        composed = app._dataframe_registry.compose_all()
+        app._processing_context.init_checkpoint()
+        registry = app._dataframe_registry
+        stream_ids = {
+            stream_id for topic in composed for stream_id in registry.get_stream_ids(topic)
+        }
+        for stream_id in stream_ids:
+            app._state_manager.on_partition_assign(
+                stream_id=stream_id,
+                partition=0,
+                committed_offsets={topic: -1001 for topic in registry.get_topics_for_stream_id(stream_id)},
+            )
+
+        for offset, message in enumerate(messages):
+            topic = GAP_TICK_TOPIC if is_gap_tick(message) else INPUT_TOPIC
+            context = copy_context()
+            context.run(set_message_context, MessageContext(topic, 0, offset, 0))
+            context.run(
+                composed[topic],
+                message,
+                message['product_id'].encode(),
+                message['timestamp_ms'],
+                None,
+            )
+
+        app._state_manager.close()
+        return dict(candles)
+
+    return run
@@ -0,0 +1,132 @@
+"""
+Checks that the batch OHLC builder publishes the same candles as the streaming
+pipeline of `trade_to_ohlc`, on the same trades.
+"""
+import math
+import random
+from typing import Dict, List
+
+import pandas as pd
+import pytest
+
+from batch_ohlc import (
+    TRADE_COLUMNS,
+    ohlc_candles_to_records,
+    rollup_ohlc_candles,
+    trades_to_ohlc_candles,
+)
+
+RESOLUTIONS = [60, 300, 900]
+# the grace period of the base windows in `add_ohlc_pipeline`
+GRACE_MS = 10_000
+
+# floats that are sums of many trades, compared with a tolerance because
+# pandas adds them up in a different order
+SUMMED_FIELDS = {'volume', 'vwap', 'buy_volume', 'sell_volume'}
+
+
+def synthetic_trades(n_trades: int, n_products: int, seed: int = 42) -> List[Dict]:
+    rng = random.Random(seed)
+    timestamp_ms = 1_700_000_000_000
+    prices = [rng.uniform(1, 70_000) for _ in range(n_products)]
+    # some products trade rarely, so they have windows without trades
+    products = rng.choices(
+        range(n_products), weights=[1 / (i + 1) ** 3 for i in range(n_products)], k=n_trades
+    )
+    trades = []
+    for i in products:
+        prices[i] *= 1 + rng.uniform(-1e-4, 1e-4)
+        timestamp_ms += rng.randint(0, 400)
+        trades.append({
+            'product_id': f'PRODUCT{i}/USD',
+            'price': prices[i],
+            'volume': rng.uniform(0.0001, 0.5),
+            'timestamp_ms': timestamp_ms,
+            # trades produced before `side` existed have none
+            'side': rng.choice(['buy', 'sell', 'sell', None]),
+        })
+    return trades
+
+
+def batch_candles(trades: List[Dict], to_ms: int, fill_gaps: bool) -> Dict[int, List[Dict]]:
+    candles = trades_to_ohlc_candles(pd.DataFrame(trades, columns=TRADE_COLUMNS), RESOLUTIONS[0])
+    records = {RESOLUTIONS[0]: ohlc_candles_to_records(candles, RESOLUTIONS[0], to_ms, fill_gaps)}
+    for window_sec in RESOLUTIONS[1:]:
+        candles = rollup_ohlc_candles(candles, window_sec)
+        records[window_sec] = ohlc_candles_to_records(candles, window_sec, to_ms, fill_gaps)
+    return records
+
+
+def streaming_candles(run_ohlc_pipeline, trades: List[Dict], to_ms: int, fill_gaps: bool) -> Dict[int, List[Dict]]:
+    """
+    Runs the trades through the streaming pipeline, then closes every window
+    ending at `to_ms` with later trades of every product, and returns the
+    candles up to `to_ms`, ordered like the batch ones.
+
+    The batch builder only fills the gaps between the first and last candle of
+    a product, so the synthetic candles after the last one are dropped.
+    """
+    product_ids = sorted({trade['product_id'] for trade in trades})
+    # every coarser resolution closes once the finer one has a closed window
+    # after `to_ms`, so one round of trades per resolution
+    window_ms = RESOLUTIONS[-1] * 1000
+    flush_trades = [
+        {'product_id': product_id, 'price': 1.0, 'volume': 1.0, 'timestamp_ms': timestamp_ms, 'side': 'buy'}
+        for timestamp_ms in range(to_ms + GRACE_MS, to_ms + (len(RESOLUTIONS) + 1) * window_ms, window_ms)
+        for product_id in product_ids
+    ]
+    published = run_ohlc_pipeline(trades + flush_trades, RESOLUTIONS[0], RESOLUTIONS[1:], fill_gaps)
+
+    candles = {}
+    for window_sec in RESOLUTIONS:
+        records = [candle for candle in published.get(window_sec, []) if candle['timestamp'] <= to_ms]
+        last_real = {}
+        for candle in records:
+            if not candle['is_synthetic']:
+                last_real[candle['product_id']] = candle['timestamp']
+        candles[window_sec] = sorted(
+            (candle for candle in records if candle['timestamp'] <= last_real[candle['product_id']]),
+            key=lambda candle: (candle['timestamp'], candle['product_id']),
+        )
+    return candles
+
+
+def assert_same_candles(expected: List[Dict], actual: List[Dict]) -> None:
+    assert len(expected) == len(actual)
+    for e, a in zip(expected, actual):
+        assert list(e) == list(a)
+        for field in e:
+            if field in SUMMED_FIELDS:
+                assert math.isclose(e[field], a[field], rel_tol=1e-9), (field, e, a)
+            else:
+                assert e[field] == a[field], (field, e, a)
+
+
+@pytest.mark.parametrize('fill_gaps', [True, False])
+def test_batch_matches_streaming(run_ohlc_pipeline, fill_gaps):
+    trades = synthetic_trades(n_trades=20_000, n_products=5)
+    window_ms = RESOLUTIONS[-1] * 1000
+    # the end of the last coarsest window with trades
+    to_ms = -(-trades[-1]['timestamp_ms'] // window_ms) * window_ms
+
+    expected = streaming_candles(run_ohlc_pipeline, trades, to_ms, fill_gaps)
+    actual = batch_candles(trades, to_ms, fill_gaps)
+
+    for window_sec in RESOLUTIONS:
+        assert_same_candles(expected[window_sec], actual[window_sec])
+    # the rare products leave gaps in the base candles
+    assert any(candle['is_synthetic'] for candle in actual[RESOLUTIONS[0]]) == fill_gaps
+
+
+def test_trades_without_side_are_neither_buy_nor_sell(run_ohlc_pipeline):
+    trades = [
+        {'product_id': 'BTC/USD', 'price': 100.0, 'volume': volume, 'timestamp_ms': timestamp_ms, 'side': side}
+        for volume, timestamp_ms, side in [(1.0, 1_000, None), (2.0, 2_000, 'sell'), (4.0, 3_000, None)]
+    ]
+    flush_trade = {**trades[0], 'timestamp_ms': 60_000 + GRACE_MS}
+
+    [expected] = run_ohlc_pipeline(trades + [flush_trade], 60)[60]
+    [actual] = batch_candles(trades, to_ms=60_000, fill_gaps=False)[60]
+
+    assert actual == expected
+    assert (actual['buy_volume'], actual['sell_volume'], actual['volume']) == (0.0, 2.0, 7.0)
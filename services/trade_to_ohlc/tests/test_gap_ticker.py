@@ -0,0 +1,100 @@
+"""
+Checks that gap ticks close the windows of products that stopped trading, so
+their synthetic candles are published without waiting for their next trade.
+"""
+from typing import Dict, List
+
+from gap_ticker import GapTicker
+
+
+def trade(timestamp_ms: int, price: float, product_id: str = 'BTC/USD') -> Dict:
+    return {'product_id': product_id, 'price': price, 'volume': 1.0, 'timestamp_ms': timestamp_ms, 'side': 'buy'}
+
+
+def tick(ticker: GapTicker, timestamp_ms: int, product_id: str = 'BTC/USD') -> Dict:
+    return {'product_id': product_id, 'timestamp_ms': timestamp_ms, 'ticker_id': ticker.ticker_id, 'partition': 0}
+
+
+def timestamps(candles: List[Dict]) -> List[int]:
+    return [candle['timestamp'] for candle in candles]
+
+
+def test_gap_ticks_publish_synthetic_candles_of_quiet_products(run_ohlc_pipeline):
+    ticker = GapTicker(interval_sec=60)
+    other_ticker = GapTicker(interval_sec=60)
+    quiet = [
+        trade(1_000, 100.0),
+        trade(2_000, 101.0),
+        # the ticks of another instance are dropped, or they would close the
+        # windows of this one
+        tick(other_ticker, 1_000_000),
+    ] + [tick(ticker, timestamp_ms) for timestamp_ms in range(30_000, 400_000, 60_000)]
+
+    published = run_ohlc_pipeline(quiet, 60, [300], gap_ticker=ticker)
+
+    # the tick at 390s closes the windows up to the one starting at 320s
+    assert timestamps(published[60]) == list(range(60_000, 360_001, 60_000))
+    real, *synthetic = published[60]
+    assert not real['is_synthetic'] and real['close'] == 101.0
+    assert all(candle['is_synthetic'] and candle['close'] == 101.0 for candle in synthetic)
+    # the first 300s window closes with the base candle starting at 300s
+    [rollup] = published[300]
+    assert (rollup['timestamp'], rollup['is_synthetic'], rollup['volume']) == (300_000, False, 2.0)
+
+    published = run_ohlc_pipeline(
+        quiet + [trade(400_000, 105.0), tick(ticker, 490_000)], 60, [300], gap_ticker=ticker
+    )
+
+    # the next trade fills no gap twice
+    assert timestamps(published[60]) == list(range(60_000, 420_001, 60_000))
+    assert [candle['is_synthetic'] for candle in published[60]] == [False] + [True] * 5 + [False]
+    assert published[60][-1]['close'] == 105.0
+
+
+def test_gap_ticks_without_filling_gaps_publish_real_candles_only(run_ohlc_pipeline):
+    ticker = GapTicker(interval_sec=60)
+    messages = [trade(1_000, 100.0)] + [tick(ticker, timestamp_ms) for timestamp_ms in range(30_000, 400_000, 60_000)]
+
+    published = run_ohlc_pipeline(messages, 60, ohlc_fill_gaps=False, gap_ticker=ticker)
+
+    assert timestamps(published[60]) == [60_000]
+
+
+def test_gap_ticks_follow_the_event_time_of_their_product():
+    now = [0.0]
+    ticker = GapTicker(interval_sec=1, idle_timeout_sec=30, clock=lambda: now[0])
+    ticker.observe(trade(10_000, 1.0, 'BTC/USD'), partition=0)
+    # the shard of another product, sent ahead of this one by a backfill
+    ticker.observe(trade(100_000, 1.0, 'ETH/USD'), partition=0)
+    ticker.observe(trade(9_000, 1.0, 'BTC/USD'), partition=0)
+    ticker.observe(trade(50_000, 1.0, 'SOL/USD'), partition=1)
+
+    # a product is ticked from its own last trade, and not past the latest
+    # trade of its partition
+    now[0] = 2.5
+    ticks = {(t['partition'], t['product_id']): t['timestamp_ms'] for t in ticker.ticks()}
+    assert ticks == {(0, 'BTC/USD'): 12_500}
+
+    # the ticks stop advancing while the producer sends nothing
+    now[0] = 200.0
+    ticker.observe(tick(ticker, 12_500, 'BTC/USD'), partition=0)
+    ticks = {(t['partition'], t['product_id']): t['timestamp_ms'] for t in ticker.ticks()}
+    assert ticks == {(0, 'BTC/USD'): 100_000}
+
+
+def test_gap_ticks_stop_for_idle_partitions():
+    now = [0.0]
+    ticker = GapTicker(interval_sec=1, idle_timeout_sec=30, clock=lambda: now[0])
+    ticker.observe(trade(10_000, 1.0, 'BTC/USD'), partition=0)
+    ticker.observe(trade(20_000, 1.0, 'ETH/USD'), partition=0)
+    ticker.observe(trade(50_000, 1.0, 'SOL/USD'), partition=1)
+    ticker.observe(trade(60_000, 1.0, 'ADA/USD'), partition=1)
+
+    # its own ticks keep partition 0 alive, partition 1 was moved away
+    now[0] = 20.0
+    ticker.observe(tick(ticker, 20_000, 'BTC/USD'), partition=0)
+    now[0] = 40.0
+    assert [(t['partition'], t['product_id']) for t in ticker.ticks()] == [(0, 'BTC/USD')]
+
+    now[0] = 60.0
+    assert ticker.ticks() == []
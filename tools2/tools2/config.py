@@ -1,11 +1,16 @@
 from pydantic_settings import BaseSettings
 import os
 from dotenv import load_dotenv, find_dotenv
+from typing import Optional
 
 load_dotenv(find_dotenv())
 
 class Config(BaseSettings):
-    project_name: str = os.environ.get('HOPSWORKS_PROJECT_NAME')
-    api_key: str = os.environ.get('HOPSWORKS_API_KEY')
+    # only needed with the hopsworks backend
+    project_name: Optional[str] = os.environ.get('HOPSWORKS_PROJECT_NAME')
+    api_key: Optional[str] = os.environ.get('HOPSWORKS_API_KEY')
+    # 'hopsworks', or 'local' for the store kafka_to_feature_store writes to `local_feature_store_dir`
+    feature_store_backend: str = os.environ.get('FEATURE_STORE_BACKEND', 'hopsworks')
+    local_feature_store_dir: str = os.environ.get('LOCAL_FEATURE_STORE_DIR', 'feature_store')
 
 config = Config()
\ No newline at end of file